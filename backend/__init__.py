@@ -1,7 +1,7 @@
 from .logger import logger
 
 from .core import Core
-from .geometry import Figure, Point, Circle, Triangle, Rectangle, Path
+from .geometry import Figure, Point, Circle, Triangle, Rectangle, ConvexPolygon, Path
 from .geometry import mean_points, sum_points
 from .cars import SimpleCar, RoutingCar
 from .agents import Agent, Overseer
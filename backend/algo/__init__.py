@@ -1 +1,3 @@
-from .priority_queue import PriorityQueue
\ No newline at end of file
+from .priority_queue import PriorityQueue
+from .indexed_heap import IndexedHeap
+from .spatial_hash import SpatialHash, cell_key
\ No newline at end of file
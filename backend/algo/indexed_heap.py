@@ -0,0 +1,162 @@
+import heapq
+from itertools import count
+from typing import TypeVar, Optional, Generic, Hashable
+
+T = TypeVar("T", bound=Hashable)
+
+class IndexedHeap(Generic[T]):
+    """
+    Min-heap of elements with priorities, which keeps an index of its elements:
+    insert, decrease_key and extract_minimum take O(log n), contains and priority take O(1).
+    Elements are usually integer vertex ids, but any hashable elements work, they are never compared.
+
+    Entries live in a binary heap of heapq, changing a priority pushes a new entry
+    and leaves the old one to be skipped when it reaches the top.
+    """
+
+    def __init__(self):
+        # [priority, insertion number, element], the number breaks ties in insertion order
+        self.heap: list[list] = []
+        # element -> its live entry
+        self.index: dict[T, list] = dict()
+        self.counter = count()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __bool__(self) -> bool:
+        return bool(self.index)
+
+    def __contains__(self, element: T) -> bool:
+        return element in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __repr__(self) -> str:
+        return ', '.join([f'{e}: {entry[0]}' for e, entry in self.index.items()])
+
+    def clear(self):
+        self.heap.clear()
+        self.index.clear()
+
+    def priority(self, element: T) -> float:
+        return self.index[element][0]
+
+    def insert(self, element: T, priority: float):
+        """
+        Adds the element, or changes its priority if it is already in the heap
+        """
+        old = self.index.get(element)
+        if old is not None:
+            old[2] = _REMOVED
+        entry = [priority, next(self.counter), element]
+        self.index[element] = entry
+        heapq.heappush(self.heap, entry)
+        if len(self.heap) > 2 * len(self.index) + 64:
+            self._compact()
+
+    def decrease_key(self, element: T, priority: float) -> bool:
+        """
+        Inserts the element or lowers its priority, returns False if it already had a lower or equal one
+        """
+        old = self.index.get(element)
+        if old is not None and old[0] <= priority:
+            return False
+        self.insert(element, priority)
+        return True
+
+    def get_minimum(self) -> Optional[T]:
+        self._skip_removed()
+        return self.heap[0][2] if self.heap else None
+
+    def extract_minimum(self) -> Optional[T]:
+        self._skip_removed()
+        if not self.heap:
+            return None
+        element = heapq.heappop(self.heap)[2]
+        del self.index[element]
+        return element
+
+    def extract_minimum_with_priority(self) -> tuple[T, float]:
+        self._skip_removed()
+        priority, _, element = heapq.heappop(self.heap)
+        del self.index[element]
+        return element, priority
+
+    def remove(self, element: T):
+        self.index.pop(element)[2] = _REMOVED
+
+    def discard(self, element: T):
+        if element in self.index:
+            self.remove(element)
+
+    def _skip_removed(self):
+        heap = self.heap
+        while heap and heap[0][2] is _REMOVED:
+            heapq.heappop(heap)
+
+    def _compact(self):
+        self.heap = [entry for entry in self.heap if entry[2] is not _REMOVED]
+        heapq.heapify(self.heap)
+
+# marks entries of removed elements and of outdated priorities
+_REMOVED = object()
+
+if __name__ == '__main__':
+    from random import random, randrange, seed
+    from time import perf_counter
+    from .priority_queue import PriorityQueue
+
+    test_n = 1
+    if test_n == 0:
+        # Example Usage
+        pq = IndexedHeap()
+        a, b, c, d = "A", "B", "C", "asda"
+        pq.insert(a, 0)
+        pq.insert(b, 1)
+        pq.insert(c, -1)
+        pq.insert(d, 0.2)
+
+        print(pq)
+        print(pq.get_minimum())
+
+        pq.decrease_key(b, -2)
+        pq.remove(a)
+        print(pq)
+        print([pq.extract_minimum() for _ in range(len(pq))])
+    elif test_n == 1:
+        # Dijkstra-like workload: inserts, decrease-keys and pops on integer ids
+        seed(0)
+        for n in (1000, 10000, 100000):
+            ops = []
+            for i in range(n):
+                ops.append((0, i, random()))
+                for _ in range(3):
+                    ops.append((1, randrange(n), random()))
+                if i % 2:
+                    ops.append((2, None, None))
+            ops += [(2, None, None)] * (n - n // 2)
+
+            results = []
+            for cls in (PriorityQueue, IndexedHeap):
+                pq = cls()
+                popped = []
+                ts = perf_counter()
+                for op, e, p in ops:
+                    if op == 0:
+                        pq.insert(e, p)
+                    elif op == 1:
+                        if e not in pq:
+                            continue
+                        if cls is IndexedHeap:
+                            pq.decrease_key(e, p)
+                        elif p < pq.priorities[e]:
+                            # decrease-key as the pathfinders did it with PriorityQueue
+                            pq.discard(e)
+                            pq.insert(e, p)
+                    else:
+                        popped.append(pq.extract_minimum())
+                results.append(popped)
+                print(f'{cls.__name__:>14}: {n:6} elements, {(perf_counter() - ts) / len(ops) * 1e6:5.2f} us/op')
+            assert results[0] == results[1]
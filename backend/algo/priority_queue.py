@@ -33,6 +33,7 @@ class PriorityQueue(Generic[T]):
     def discard(self, element: T):
         if element in self:
             self.queue.remove(element)
+            self.priorities.pop(element)
     
     def __iter__(self):
         return iter(self.queue)
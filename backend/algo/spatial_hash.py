@@ -0,0 +1,69 @@
+from typing import TypeVar, Optional, Generic, Iterator
+from math import floor, hypot
+
+T = TypeVar("T")
+
+def cell_key(x: float, y: float, cell: float) -> tuple[int, int]:
+    """
+    Quantizes coordinates into integer grid cell indexes
+    """
+    return floor(x / cell), floor(y / cell)
+
+class SpatialHash(Generic[T]):
+    """
+    Maps 2d coordinates to items with a tolerance:
+    find(x, y) returns an item stored closer than eps to (x, y).
+    Items are bucketed by eps-sized grid cells, so a lookup only checks the 3x3 cells around the point.
+    """
+
+    def __init__(self, eps: float):
+        self.eps = eps
+        self.cells: dict[tuple[int, int], list[tuple[float, float, T]]] = dict()
+        self.size = 0
+
+    def add(self, x: float, y: float, item: T):
+        self.cells.setdefault(cell_key(x, y, self.eps), []).append((x, y, item))
+        self.size += 1
+
+    def find(self, x: float, y: float) -> Optional[T]:
+        cx, cy = cell_key(x, y, self.eps)
+        for ix in (cx - 1, cx, cx + 1):
+            for iy in (cy - 1, cy, cy + 1):
+                for ox, oy, item in self.cells.get((ix, iy), ()):
+                    if hypot(ox - x, oy - y) < self.eps:
+                        return item
+        return None
+
+    def remove(self, x: float, y: float, item: T):
+        key = cell_key(x, y, self.eps)
+        bucket = self.cells[key]
+        for i, entry in enumerate(bucket):
+            if entry[2] is item:
+                bucket.pop(i)
+                break
+        else: # if not break encountered
+            raise KeyError(item)
+        if not bucket:
+            del self.cells[key]
+        self.size -= 1
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[T]:
+        for bucket in self.cells.values():
+            for _, _, item in bucket:
+                yield item
+
+if __name__ == '__main__':
+    # Example Usage
+    sh = SpatialHash(1e-5)
+    sh.add(0, 0, "A")
+    sh.add(1, 1, "B")
+
+    print(sh.find(4e-6, -4e-6))
+    print(sh.find(1 - 1e-6, 1))
+    print(sh.find(0.5, 0.5))
+
+    sh.remove(0, 0, "A")
+    print(sh.find(0, 0), len(sh))
@@ -1,3 +1,5 @@
+from typing import Iterable
+
 from .agents import Agent, Overseer
 from .sprites import Sprite
 from .pathfinding import QuadTree
@@ -15,7 +17,26 @@ class Core(Overseer):
     
     def add_sprite(self, f: Sprite):
         self._sprites.append(f)
-        self.quadtree.add_sprites([f])
+        if self.pathfinder is not None:
+            # the pathfinder repairs its graph around the new obstacle
+            self.pathfinder.add_obstacle(f)
+        else:
+            self.quadtree.add_sprites([f])
+    
+    def add_sprites(self, sprites: Iterable[Sprite]):
+        sprites = list(sprites)
+        self._sprites.extend(sprites)
+        self.quadtree.load_sprites(sprites)
+        if self.pathfinder is not None:
+            # one repair for the whole batch
+            self.pathfinder.update()
+    
+    def remove_sprite(self, f: Sprite):
+        self._sprites.remove(f)
+        if self.pathfinder is not None:
+            self.pathfinder.remove_obstacle(f)
+        else:
+            self.quadtree.remove_sprite(f)
     
     def sprites(self) -> list[Sprite]:
         for f in self._sprites:
@@ -47,4 +68,4 @@ class Core(Overseer):
         for s in all_sprites:
             s.update(deltatime)
             
-        self.quadtree.optimize_tree()
\ No newline at end of file
+        self.quadtree.relocate_dirty()
\ No newline at end of file
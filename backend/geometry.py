@@ -2,7 +2,7 @@ import numpy as np
 from typing import Generator
 from itertools import pairwise
 
-from math import sqrt, atan2
+from math import sqrt, atan2, acos, cos, sin
 
 EPS = 1e-5
 
@@ -16,6 +16,57 @@ def sign(a: float):
         return -1
     return 0
 
+def distance_xy(ax: float, ay: float, bx: float, by: float, px: float, py: float) -> float:
+    """
+    Line(a, b).distance(p) on raw coordinates
+    """
+    lx, ly = bx - ax, by - ay
+    line_length = sqrt(lx ** 2 + ly ** 2)
+    return (lx * (py - ay) - ly * (px - ax)) / line_length if line_length > EPS else 0.0
+
+def segments_intersect_xy(ax: float, ay: float, bx: float, by: float,
+                          cx: float, cy: float, dx: float, dy: float) -> bool:
+    """
+    Line(a, b)._intersects_line(Line(c, d)) on raw coordinates
+    """
+    lx, ly = bx - ax, by - ay
+    return _segments_intersect(ax, ay, bx, by, sqrt(lx ** 2 + ly ** 2), cx, cy, dx, dy)
+
+def _segments_intersect(ax: float, ay: float, bx: float, by: float, line_length: float,
+                        cx: float, cy: float, dx: float, dy: float) -> bool:
+    """
+    segments_intersect_xy with the length of (a, b) known
+    """
+    lx, ly = bx - ax, by - ay
+    if line_length > EPS:
+        d1 = (lx * (cy - ay) - ly * (cx - ax)) / line_length
+        d2 = (lx * (dy - ay) - ly * (dx - ax)) / line_length
+    else:
+        d1 = d2 = 0.0
+
+    if abs(d1) + abs(d2) < 2 * EPS:
+        prod1 = (ax - cx) * (bx - dx) + (ay - cy) * (by - dy)
+        prod2 = (ax - dx) * (bx - cx) + (ay - dy) * (by - cy)
+        return prod1 < 0 or prod2 < 0
+
+    if sign(d1) * sign(d2) > 0:
+        return False
+
+    a1, a2 = abs(d1), abs(d2)
+    ix = (cx * a2 + dx * a1) / (a1 + a2)
+    iy = (cy * a2 + dy * a1) / (a1 + a2)
+    return (ax - ix) * (bx - ix) + (ay - iy) * (by - iy) < -EPS
+
+def boxes_overlap(a: tuple[float, float, float, float] | None, b: tuple[float, float, float, float] | None,
+                  eps: float = EPS) -> bool:
+    """
+    Checks if axis-aligned boxes (xmin, ymin, xmax, ymax) are closer than eps.
+    None is an unbounded box.
+    """
+    if a is None or b is None:
+        return True
+    return a[0] <= b[2] + eps and b[0] <= a[2] + eps and a[1] <= b[3] + eps and b[1] <= a[3] + eps
+
 def rotation_matrix(angle: float) -> np.ndarray[float]:
     return np.array([
         [np.cos(angle), np.sin(angle)],
@@ -26,6 +77,12 @@ class Point:
     pass
 
 class Figure:
+    # cached bounding box and derived geometry (edges, normals, ...), reset by changed()
+    _aabb: tuple[float, float, float, float] | None = None
+    _cache: dict | None = None
+    # incremented on every change of the figure
+    version: int = 0
+
     def __init__(self):
         pass
     
@@ -38,12 +95,90 @@ class Figure:
     def contains(self, other: Point) -> bool:
         return False
 
+    def has_intersect_point(self, x: float, y: float) -> bool:
+        """
+        has_intersect(Point(x, y)) on raw coordinates.
+        Figures override it to avoid allocating a Point.
+        """
+        return self.has_intersect(Point(x, y))
+
+    def has_intersect_segment(self, x1: float, y1: float, x2: float, y2: float) -> bool:
+        """
+        has_intersect(Line(Point(x1, y1), Point(x2, y2))) on raw coordinates.
+        Figures override it to avoid allocating a Line.
+        """
+        return self.has_intersect(Line(Point(x1, y1), Point(x2, y2)))
+
+    def segment_entry(self, x1: float, y1: float, x2: float, y2: float) -> float:
+        """
+        For a segment intersecting the figure returns the parameter t in [0, 1],
+        at which the segment (x1, y1) + t * (x2 - x1, y2 - y1) enters it.
+        Vertexes are treated as a closed polygon.
+        """
+        if self.has_intersect_point(x1, y1):
+            return 0.0
+        dx, dy = x2 - x1, y2 - y1
+        vs = self.vertexes()
+        best = 1.0 if vs else 0.0
+        for i in range(len(vs)):
+            a, b = vs[i - 1], vs[i]
+            ex, ey = b.x - a.x, b.y - a.y
+            denom = dx * ey - dy * ex
+            if abs(denom) < EPS ** 2:
+                continue
+            ax, ay = a.x - x1, a.y - y1
+            t = (ax * ey - ay * ex) / denom
+            u = (ax * dy - ay * dx) / denom
+            if -EPS <= u <= 1 + EPS and 0 <= t < best:
+                best = t
+        return best
+
     def vertexes(self, quality: int = 0) -> list[Point]:
         return []
     
     def set_vertexes(self, vs: list[Point]):
         pass
 
+    def aabb(self) -> tuple[float, float, float, float] | None:
+        """
+        Returns the axis-aligned bounding box (xmin, ymin, xmax, ymax),
+        or None for figures without vertexes
+        """
+        if self._aabb is None:
+            self._aabb = self._compute_aabb()
+        return self._aabb
+
+    def _compute_aabb(self) -> tuple[float, float, float, float] | None:
+        vs = self.vertexes()
+        if not vs:
+            return None
+        xs, ys = [v.x for v in vs], [v.y for v in vs]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def changed(self):
+        """
+        Drops cached geometry, must be called whenever the figure moves or changes shape
+        """
+        self._aabb = None
+        self._cache = None
+        self.version += 1
+
+    def cached(self, key: str, compute):
+        """
+        Returns compute() cached until the figure changes
+        """
+        if self._cache is None:
+            self._cache = dict()
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def normals(self) -> list[Point]:
+        """
+        Unit normals of edges() of the figure, pointing to the left of each edge
+        """
+        return self.cached('normals', lambda: [e.normal() for e in self.edges()])
+
     def mass_center(self):
         return Point(0, 0)
     
@@ -60,12 +195,27 @@ class Figure:
     
     def move(self, shift: Point):
         self.set_vertexes([v + shift for v in self.vertexes()])
+        self.changed()
     
     def rotate(self, center: Point, angle: float):
         rotmat = rotation_matrix(angle)
         vecs = np.array([[(v - center).x, (v - center).y] for v in self.vertexes()])
         nvecs = vecs.dot(rotmat)
         self.set_vertexes([Point(*c) + center for c in nvecs])
+        self.changed()
+
+    def place(self, local: 'Figure', origin: Point, angle: float, position: Point):
+        """
+        Sets the figure to the local one rotated by angle around origin and moved to position:
+        v = R(angle)(v_local - origin) + position, same as local.rotate(origin, angle) and local.move(position - origin)
+        """
+        c, s = cos(angle), sin(angle)
+        vs = []
+        for v in local.vertexes():
+            dx, dy = v.x - origin.x, v.y - origin.y
+            vs.append(Point(position.x + dx * c - dy * s, position.y + dx * s + dy * c))
+        self.set_vertexes(vs)
+        self.changed()
 
 from functools import reduce
 def sum_points(points: list[Point]):
@@ -80,6 +230,8 @@ class Triangle(Figure):
     pass
 class Rectangle(Figure):
     pass
+class ConvexPolygon(Figure):
+    pass
 class Line:
     pass
 
@@ -94,6 +246,9 @@ class Point:
     def vertexes(self, quality: int = 0) -> list[Point]:
         return [self]
 
+    def aabb(self) -> tuple[float, float, float, float]:
+        return self.x, self.y, self.x, self.y
+
     def mass_center(self):
         return self.copy()
     
@@ -121,7 +276,7 @@ class Point:
             return np.sqrt((self.x - other.x)**2 + (self.y - other.y)**2)
         elif isinstance(other, Circle):
             return max(0, self.distance_to(other.center) - other.radius)
-        elif isinstance(other, (Rectangle, Triangle)):
+        elif isinstance(other, (Rectangle, Triangle, ConvexPolygon)):
             if other.has_intersect(self):
                 return 0
             return min([self.distance_to(e) for e in other.edges()])
@@ -183,6 +338,9 @@ class Line:
             raise ValueError("Отрезок не может быть задан двумя одинаковыми точками.")
         self.p1 = p1
         self.p2 = p2
+        # (direction x, direction y, length) and (A, B, C) of equation(), computed on demand and reset by set_vertexes
+        self._vec: tuple[float, float, float] | None = None
+        self._eq: tuple[float, float, float] | None = None
         
     def copy(self):
         return Line(self.p1.copy(), self.p2.copy())
@@ -194,10 +352,34 @@ class Line:
         return f'{self.__class__.__name__}: A={self.p1}, B={self.p2}'
     
     def print_eq(self):
-        A = self.p2.y - self.p1.y
-        B = self.p1.x - self.p2.x
-        C = self.p2.x * self.p1.y - self.p1.x * self.p2.y
-        return A, B, C
+        return self.equation()
+
+    def vector(self) -> tuple[float, float, float]:
+        """
+        Returns (x, y) of p2 - p1 and its length
+        """
+        if self._vec is None:
+            lx, ly = self.p2.x - self.p1.x, self.p2.y - self.p1.y
+            self._vec = (lx, ly, sqrt(lx ** 2 + ly ** 2))
+        return self._vec
+
+    def equation(self) -> tuple[float, float, float]:
+        """
+        Returns coefficients (A, B, C) of the line A * x + B * y + C = 0
+        """
+        if self._eq is None:
+            A = self.p2.y - self.p1.y
+            B = self.p1.x - self.p2.x
+            C = self.p2.x * self.p1.y - self.p1.x * self.p2.y
+            self._eq = (A, B, C)
+        return self._eq
+
+    def normal(self) -> Point:
+        """
+        Unit normal pointing to the left of p1 -> p2
+        """
+        lx, ly, length = self.vector()
+        return Point(-ly / length, lx / length)
     
     def vertexes(self, quality: int = 0) -> list[Point]:
         return [self.p1, self.p2]
@@ -205,6 +387,12 @@ class Line:
     def set_vertexes(self, vs: list[Point]):
         self.p1 = vs[0]
         self.p2 = vs[1]
+        self._vec = None
+        self._eq = None
+
+    def aabb(self) -> tuple[float, float, float, float]:
+        p1, p2 = self.p1, self.p2
+        return min(p1.x, p2.x), min(p1.y, p2.y), max(p1.x, p2.x), max(p1.y, p2.y)
     
     def __hash__(self):
         return self.p1.__hash__() + self.p2.__hash__()
@@ -234,17 +422,22 @@ class Line:
         Если расстояние меньше нуля, то точка справа от прямой, если больше, то слева.
         (сторона выбирается при обходе прямой от p1 к p2)
         """
-        # Векторное представление
-        line_vec = self.p2 - self.p1  # Вектор направления прямой
-        point_vec = p - self.p1       # Вектор от точки `p1` до `p`
-        
-        # Векторное произведение для нахождения площади параллелограмма
-        # cross_product = line_vec.dot(point_vec)
-        cross_product = line_vec.x * point_vec.y - line_vec.y * point_vec.x
-        line_length = abs(line_vec)  # Длина вектора прямой
+        # Расстояние = векторное произведение / длина прямой
+        return self.distance_at(p.x, p.y)
 
-        # Расстояние = площадь / длина прямой
-        return cross_product / line_length if line_length > EPS else 0.0
+    def distance_at(self, x: float, y: float) -> float:
+        """
+        distance(Point(x, y)) on raw coordinates
+        """
+        lx, ly, length = self.vector()
+        return (lx * (y - self.p1.y) - ly * (x - self.p1.x)) / length if length > EPS else 0.0
+
+    def intersects_segment(self, x1: float, y1: float, x2: float, y2: float) -> bool:
+        """
+        _intersects_line(Line(Point(x1, y1), Point(x2, y2))) on raw coordinates
+        """
+        p1, p2 = self.p1, self.p2
+        return _segments_intersect(p1.x, p1.y, p2.x, p2.y, self.vector()[2], x1, y1, x2, y2)
 
     def has_intersect(self, other: Point|Line|Figure) -> bool:
         if isinstance(other, Point):
@@ -259,23 +452,7 @@ class Line:
         """
         Проверяет, пересекаются ли два отрезка исключая концы отрезков
         """
-        
-        d1 = self.distance(other.p1)
-        d2 = self.distance(other.p2)
-        
-        # Если отрезки коллинеарны, проверить не лежат ли вершины одного внутри другого
-        if abs(d1) + abs(d2) < 2 * EPS:
-            prod1 = (self.p1 - other.p1) * (self.p2 - other.p2)
-            prod2 = (self.p1 - other.p2) * (self.p2 - other.p1)
-            return any([prod1 < 0, prod2 < 0])
-        
-        # Проверка на то, что обе точки второго отрезка лежат с одной стороны от первого отрезка
-        # if (self.p2 - self.p1).dot(other.p1 - self.p1) * (self.p2 - self.p1).dot(other.p2 - self.p1) > 0:
-        if sign(d1) * sign(d2) > 0:
-            return False
-        
-        intersection = (other.p1 * abs(d2) + other.p2 * abs(d1)) / (abs(d1) + abs(d2))
-        return (self.p1 - intersection) * (self.p2 - intersection) < -EPS
+        return self.intersects_segment(other.p1.x, other.p1.y, other.p2.x, other.p2.y)
 
 class Circle(Figure):
     def __init__(self, x: float, y: float, radius: float):
@@ -319,31 +496,96 @@ class Circle(Figure):
     def set_vertexes(self, vs: list[Point]):
         raise NotImplementedError("Circle can't be set with vertexes")
     
+    def _compute_aabb(self) -> tuple[float, float, float, float]:
+        c, r = self.center, self.radius
+        return c.x - r, c.y - r, c.x + r, c.y + r
+    
     def move(self, shift: Point):
         self.center += shift
+        self.changed()
     
     def rotate(self, center: Point, angle: float):
         rotmat = rotation_matrix(angle)
         vec = np.array((self.center - center).coords())
         self.center = Point(*(vec.dot(rotmat))) + center
+        self.changed()
+
+    def place(self, local: Circle, origin: Point, angle: float, position: Point):
+        dx, dy = local.center.x - origin.x, local.center.y - origin.y
+        c, s = cos(angle), sin(angle)
+        self.center = Point(position.x + dx * c - dy * s, position.y + dx * s + dy * c)
+        self.radius = local.radius
+        self.changed()
     
     def _intersects_line(self, line: Line) -> bool:
         """
         Checks if the segment has any point inside the circle
         """
+        return self.has_intersect_segment(line.p1.x, line.p1.y, line.p2.x, line.p2.y)
+
+    def has_intersect_point(self, x: float, y: float) -> bool:
+        cx, cy = self.center.x, self.center.y
+        if self.radius < EPS:
+            return is_close(cx, x) and is_close(cy, y)
+        return sqrt((cx - x) ** 2 + (cy - y) ** 2) < self.radius + EPS
+
+    def has_intersect_segment(self, x1: float, y1: float, x2: float, y2: float) -> bool:
+        if self.radius < EPS:
+            return False
+        cx, cy = self.center.x, self.center.y
         # if line is away from center of the circle
-        if abs(line.distance(self.center)) > self.radius - EPS:
+        if abs(distance_xy(x1, y1, x2, y2, cx, cy)) > self.radius - EPS:
             return False
-        line_vec = line.p2 - line.p1
-        p1_vec = line.p1 - self.center
-        p2_vec = line.p2 - self.center
+        lx, ly = x2 - x1, y2 - y1
+        p1x, p1y = x1 - cx, y1 - cy
+        p2x, p2y = x2 - cx, y2 - cy
         # segment points are on different sides of the circle
-        if (line_vec * p1_vec) * (line_vec * p2_vec) < 0:
+        if (lx * p1x + ly * p1y) * (lx * p2x + ly * p2y) < 0:
             return True
         # segment points are on the same side of the circle
-        if min(abs(line.p1 - self.center), abs(line.p2 - self.center)) < self.radius - EPS:
+        if min(sqrt(p1x ** 2 + p1y ** 2), sqrt(p2x ** 2 + p2y ** 2)) < self.radius - EPS:
             return True
         return False
+
+    def segment_entry(self, x1: float, y1: float, x2: float, y2: float) -> float:
+        dx, dy = x2 - x1, y2 - y1
+        px, py = x1 - self.center.x, y1 - self.center.y
+        a = dx ** 2 + dy ** 2
+        c = px ** 2 + py ** 2 - self.radius ** 2
+        if c <= 0 or a < EPS ** 2:
+            return 0.0
+        b = 2 * (dx * px + dy * py)
+        disc = max(b ** 2 - 4 * a * c, 0.0)
+        return min(max((-b - sqrt(disc)) / (2 * a), 0.0), 1.0)
+
+    def tangent_points(self, x: float, y: float) -> list[Point]:
+        """
+        Points of the circle touched by tangents from (x, y), empty if (x, y) isn't outside
+        """
+        cx, cy = self.center.x, self.center.y
+        d = sqrt((x - cx) ** 2 + (y - cy) ** 2)
+        if d <= self.radius + EPS:
+            return []
+        base, alpha = atan2(y - cy, x - cx), acos(self.radius / d)
+        return [Point(cx + self.radius * cos(base + a), cy + self.radius * sin(base + a)) for a in (alpha, -alpha)]
+
+    def bitangents(self, other: Circle) -> list[tuple[Point, Point]]:
+        """
+        Common tangents of two circles as pairs of touching points (on self, on other):
+        two outer ones if neither circle is inside the other and two inner ones if the circles are apart
+        """
+        c1, c2, r1, r2 = self.center, other.center, self.radius, other.radius
+        d = abs(c2 - c1)
+        base = atan2(c2.y - c1.y, c2.x - c1.x)
+        res: list[tuple[Point, Point]] = []
+        for r, k in ((r1 - r2, 1), (r1 + r2, -1)):  # outer, inner
+            if d <= abs(r) + EPS:
+                continue
+            alpha = acos(r / d)
+            for a in (base + alpha, base - alpha):
+                ux, uy = cos(a), sin(a)
+                res.append((Point(c1.x + r1 * ux, c1.y + r1 * uy), Point(c2.x + k * r2 * ux, c2.y + k * r2 * uy)))
+        return res
     
     def contains(self, other: Point|Figure|Line):
         """
@@ -367,14 +609,14 @@ class Circle(Figure):
         if self.radius < EPS:  # Если радиус 0, окружность превращается в точку
             return self.center.has_intersect(other)
         elif isinstance(other, Point):
-            return abs(self.center - other) < self.radius + EPS
+            return self.has_intersect_point(other.x, other.y)
         elif isinstance(other, Line):
             return self._intersects_line(other)
         elif isinstance(other, Circle):
             return abs(self.center - other.center) < self.radius + other.radius + EPS
         elif isinstance(other, Rectangle):
             return other.has_intersect(self)
-        elif isinstance(other, Triangle):
+        elif isinstance(other, (Triangle, ConvexPolygon)):
             return other.has_intersect(self)
         return False
 
@@ -393,6 +635,7 @@ class Triangle(Figure):
     
     def set_vertexes(self, vs: list[Point]):
         self.vertices = vs.copy()
+        self.changed()
 
     def area(self, a: Point, b: Point, c: Point) -> float:
         return abs((a.x * (b.y - c.y) + 
@@ -406,6 +649,9 @@ class Triangle(Figure):
         return self.vertices
     
     def edges(self) -> list[Line]:
+        return self.cached('edges', self._edges)
+
+    def _edges(self) -> list[Line]:
         a, b, c = self.vertices
         return [Line(a, b), Line(b, c), Line(c, a)]
 
@@ -434,30 +680,36 @@ class Triangle(Figure):
         Checks if intersection of two figures is not empty
         """
         if isinstance(other, Point):
-            dists = [side.distance(other) for side in self.edges()]
-            return all([d > EPS for d in dists]) or all([d < -EPS for d in dists])
+            return self.has_intersect_point(other.x, other.y)
         elif isinstance(other, Line):
-            for e in self.edges():
-                if e.has_intersect(other):
-                    if e.distance(other.p1) < EPS and e.distance(other.p2) < EPS:
-                        # coinsiding lines don't count
-                        continue
-                    else:
-                        return True
-            return False
+            return self.has_intersect_segment(other.p1.x, other.p1.y, other.p2.x, other.p2.y)
         elif isinstance(other, Circle):
             return self._intersects_circle(other)
         elif isinstance(other, Triangle):
             return self._intersects_triangle(other)
-        elif isinstance(other, Rectangle):
+        elif isinstance(other, (Rectangle, ConvexPolygon)):
             return other.has_intersect(self)
         return False
 
+    def has_intersect_point(self, x: float, y: float) -> bool:
+        e1, e2, e3 = self.edges()
+        d1 = e1.distance_at(x, y)
+        d2 = e2.distance_at(x, y)
+        d3 = e3.distance_at(x, y)
+        return (d1 > EPS and d2 > EPS and d3 > EPS) or (d1 < -EPS and d2 < -EPS and d3 < -EPS)
+
+    def has_intersect_segment(self, x1: float, y1: float, x2: float, y2: float) -> bool:
+        for e in self.edges():
+            if e.intersects_segment(x1, y1, x2, y2):
+                if e.distance_at(x1, y1) < EPS and e.distance_at(x2, y2) < EPS:
+                    # coinsiding lines don't count
+                    continue
+                return True
+        return False
+
     def _intersects_circle(self, circle: Circle) -> bool:
         a, b, c = self.vertices
-        d1 = Line(a, b).distance(circle.center)
-        d2 = Line(b, c).distance(circle.center)
-        d3 = Line(c, a).distance(circle.center)
+        d1, d2, d3 = (e.distance(circle.center) for e in self.edges())
         
         if sign(d1) < 0 and sign(d2) < 0 and sign(d3) < 0: # Если центр окружности внутри треугольника
             return True
@@ -511,11 +763,17 @@ class Rectangle(Figure):
     def rotate(self, center: Point, angle: float):
         raise NotImplementedError("Rectangle can't be rotated")
     
+    def _compute_aabb(self) -> tuple[float, float, float, float]:
+        return self.bottom_left.x, self.bottom_left.y, self.top_right.x, self.top_right.y
+
     def corners(self) -> list[Point]:
         """
         Returns corners in the following order:
         bottom_left, top_left, top_right, bottom_right
         """
+        return self.cached('corners', self._corners)
+
+    def _corners(self) -> list[Point]:
         p1, p3 = self.bottom_left, self.top_right
         p2 = Point(p1.x, p3.y)
         p4 = Point(p3.x, p1.y)
@@ -526,6 +784,9 @@ class Rectangle(Figure):
         Returns edges in the following order:
         left, top, right, bottom
         """
+        return self.cached('edges', self._edges)
+
+    def _edges(self) -> list[Line]:
         p1, p2, p3, p4 = self.corners()
         return [Line(p1, p2), Line(p2, p3), Line(p3, p4), Line(p4, p1)]
     
@@ -555,28 +816,44 @@ class Rectangle(Figure):
         Checks if intersection of two figures is not empty
         """
         if isinstance(other, Point):
-            return (self.bottom_left.x + EPS <= other.x <= self.top_right.x - EPS and
-                    self.bottom_left.y + EPS <= other.y <= self.top_right.y - EPS)
+            return self.has_intersect_point(other.x, other.y)
         elif isinstance(other, Line):
-            return self.contains((other.p1 + other.p2) / 2) or\
-                   any([other.has_intersect(e) for e in self.edges()]) or\
-                   any([self.contains(v) for v in other.vertexes()])
+            return self.has_intersect_segment(other.p1.x, other.p1.y, other.p2.x, other.p2.y)
         elif isinstance(other, Circle):
             return self._intersects_circle(other)
         elif isinstance(other, (Triangle, Rectangle)):
             return self._intersects_rectangle(other)
+        elif isinstance(other, ConvexPolygon):
+            return other.has_intersect(self)
 
         return False
 
+    def has_intersect_point(self, x: float, y: float) -> bool:
+        return (self.bottom_left.x + EPS <= x <= self.top_right.x - EPS and
+                self.bottom_left.y + EPS <= y <= self.top_right.y - EPS)
+
+    def has_intersect_segment(self, x1: float, y1: float, x2: float, y2: float) -> bool:
+        if self.has_intersect_point((x1 + x2) / 2, (y1 + y2) / 2):
+            return True
+        l, b = self.bottom_left.x, self.bottom_left.y
+        r, t = self.top_right.x, self.top_right.y
+        # edges: left, top, right, bottom
+        for ax, ay, bx, by in ((l, b, l, t), (l, t, r, t), (r, t, r, b), (r, b, l, b)):
+            if segments_intersect_xy(x1, y1, x2, y2, ax, ay, bx, by):
+                return True
+        return self.has_intersect_point(x1, y1) or self.has_intersect_point(x2, y2)
+
     def _intersects_circle(self, circle: Circle) -> bool:
         """
         Проверяет пересечение прямоугольника и окружности.
         """
-        p1, p2, p3, p4 = self.corners()
-        
-        t1, t2 = Triangle(p1, p2, p3), Triangle(p1, p4, p3)
+        t1, t2 = self.cached('halves', self._halves)
         return t1.has_intersect(circle) or t2.has_intersect(circle)
 
+    def _halves(self) -> tuple[Triangle, Triangle]:
+        p1, p2, p3, p4 = self.corners()
+        return Triangle(p1, p2, p3), Triangle(p1, p4, p3)
+
     def _intersects_rectangle(self, other: Rectangle|Triangle) -> bool:
         e1s = self.edges()
         e2s = other.edges()
@@ -590,6 +867,151 @@ class Rectangle(Figure):
             return True
         return False
 
+class ConvexPolygon(Figure):
+    """
+    Convex polygon with vertexes stored counterclockwise.
+    Intersections are found by the separating axis theorem, touching figures don't intersect.
+    """
+    def __init__(self, vertices: list[Point]):
+        if len(vertices) < 3:
+            raise ValueError("Многоугольник должен иметь хотя бы три вершины.")
+        self.vertices: list[Point] = []
+        self.set_vertexes(vertices)
+        if not self.is_convex():
+            raise ValueError("Многоугольник не выпуклый.")
+
+    @classmethod
+    def hull(cls, points: list[Point]) -> ConvexPolygon:
+        """
+        Convex hull of the points (monotone chain)
+        """
+        ps = sorted(points, key=lambda p: (p.x, p.y))
+        def half(ps: list[Point]) -> list[Point]:
+            res: list[Point] = []
+            for p in ps:
+                while len(res) >= 2 and (res[-1] - res[-2]).x * (p - res[-2]).y - (res[-1] - res[-2]).y * (p - res[-2]).x < EPS:
+                    res.pop()
+                res.append(p)
+            return res[:-1]
+        return cls(half(ps) + half(ps[::-1]))
+
+    def copy(self) -> ConvexPolygon:
+        return ConvexPolygon([v.copy() for v in self.vertices])
+
+    def vertexes(self, quality: int = 0) -> list[Point]:
+        return self.vertices
+
+    def mass_center(self):
+        return mean_points(self.vertexes())
+
+    def set_vertexes(self, vs: list[Point]):
+        self.vertices = vs.copy()
+        if self.signed_area() < 0:
+            self.vertices.reverse()
+        self.changed()
+
+    def signed_area(self) -> float:
+        vs = self.vertices
+        return sum(vs[i - 1].x * vs[i].y - vs[i].x * vs[i - 1].y for i in range(len(vs))) / 2
+
+    def is_convex(self) -> bool:
+        vs = self.vertices
+        for i in range(len(vs)):
+            a, b, c = vs[i - 2], vs[i - 1], vs[i]
+            if (b.x - a.x) * (c.y - b.y) - (b.y - a.y) * (c.x - b.x) < -EPS:
+                return False
+        return True
+
+    def corners(self) -> list[Point]:
+        return self.vertices
+
+    def edges(self) -> list[Line]:
+        return self.cached('edges', self._edges)
+
+    def _edges(self) -> list[Line]:
+        vs = self.vertices
+        return [Line(vs[i - 1], vs[i]) for i in range(len(vs)) if abs(vs[i] - vs[i - 1]) > EPS]
+
+    @staticmethod
+    def project(fig: Figure, axis: Point) -> tuple[float, float]:
+        """
+        Returns (min, max) of projections of the figure onto the unit axis
+        """
+        if isinstance(fig, Circle):
+            d = fig.center.x * axis.x + fig.center.y * axis.y
+            return d - fig.radius, d + fig.radius
+        ds = [v.x * axis.x + v.y * axis.y for v in fig.vertexes()]
+        return min(ds), max(ds)
+
+    def contains(self, other: Point|Figure|Line) -> bool:
+        """
+        Checks if other figure is completely inside
+        """
+        if isinstance(other, Point):
+            return self.has_intersect(other)
+        elif isinstance(other, Circle):
+            # edges are counterclockwise, so the inner side is on the left
+            return all(e.distance_at(other.center.x, other.center.y) > other.radius - EPS for e in self.edges())
+        elif isinstance(other, (Figure, Line)):
+            return all(self.contains(p) for p in other.vertexes())
+        return False
+
+    def has_intersect(self, other: Point|Line|Figure) -> bool:
+        """
+        Checks if intersection of two figures is not empty
+        """
+        if isinstance(other, Point):
+            return self.has_intersect_point(other.x, other.y)
+        elif isinstance(other, Line):
+            return self.has_intersect_segment(other.p1.x, other.p1.y, other.p2.x, other.p2.y)
+        elif isinstance(other, Circle):
+            return self._intersects_circle(other)
+        elif isinstance(other, (Triangle, Rectangle, ConvexPolygon)):
+            return self._intersects_polygon(other)
+        return False
+
+    def has_intersect_point(self, x: float, y: float) -> bool:
+        return all(e.distance_at(x, y) > EPS for e in self.edges())
+
+    def has_intersect_segment(self, x1: float, y1: float, x2: float, y2: float) -> bool:
+        # clipping the segment by inner half-planes of edges (Cyrus-Beck),
+        # the segment intersects the polygon if something is left of it
+        dx, dy = x2 - x1, y2 - y1
+        t_in, t_out = 0.0, 1.0
+        for e in self.edges():
+            lx, ly, length = e.vector()
+            dist = e.distance_at(x1, y1) - EPS
+            speed = (lx * dy - ly * dx) / length
+            if abs(speed) < EPS ** 2:
+                if dist <= 0:
+                    return False
+            elif speed > 0:
+                t_in = max(t_in, -dist / speed)
+            else:
+                t_out = min(t_out, -dist / speed)
+            if t_in >= t_out:
+                return False
+        return True
+
+    def _separated(self, other: Figure, axes: list[Point]) -> bool:
+        for axis in axes:
+            min1, max1 = self.project(self, axis)
+            min2, max2 = self.project(other, axis)
+            if min1 > max2 - EPS or min2 > max1 - EPS:
+                return True
+        return False
+
+    def _intersects_polygon(self, other: Triangle|Rectangle|ConvexPolygon) -> bool:
+        return not self._separated(other, self.normals() + other.normals())
+
+    def _intersects_circle(self, circle: Circle) -> bool:
+        c = circle.center
+        closest = min(self.vertices, key=lambda v: (v.x - c.x) ** 2 + (v.y - c.y) ** 2)
+        axes = self.normals()
+        if abs(closest - c) > EPS:
+            axes = axes + [(closest - c) / abs(closest - c)]
+        return not self._separated(circle, axes)
+
 class Path(Figure):
     def __init__(self, path: list[Point] = []):
         self.path = path
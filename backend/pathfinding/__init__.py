@@ -1,5 +1,10 @@
 from .graph import Graph, DirectedGraph, GraphVertex, GraphEdge
-from .quadtree import QuadTree
+from .csr_graph import CSRGraph
+from .quadtree import QuadTree, Change, ChangeKind
+from .linear_quadtree import LinearQuadTree
 from .buildgraph import build_graph_on_quadtree, Waypoint, VertMode
+from .tangents import CircleMode
+from .overlay import GraphOverlay
+from .search import BestFirstSearch
 from .pathfinder import Pathfinder, Dijkstra, Floyd
 from .quadtree_pathfinder import QuadPathfinder
\ No newline at end of file
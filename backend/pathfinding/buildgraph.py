@@ -1,13 +1,16 @@
+import numpy as np
 from enum import Enum
 from itertools import chain, combinations
-from typing import Iterable, TypeVar, Optional
 
 from .graph import Graph
 from .graph import GraphVertex as Vertex
 from .quadtree import QuadTree
+from .visibility import check_collisions_batch
+from .tangents import CircleMode, tangent_segments, ring_order, connect_ring, ring_radius
 
-from backend.geometry import Rectangle, Point, Line
+from backend.geometry import Rectangle, Circle, Point, Line, EPS
 from backend.sprites import make_sprite
+from backend.algo import SpatialHash, cell_key
 
 class VertMode(Enum):
     CENTER = 0
@@ -15,6 +18,9 @@ class VertMode(Enum):
     EDGES = 2
     BOTH = 3
     ALL = 4
+    # reduced visibility graph: no waypoints of quads, only convex corners of obstacles,
+    # joined where the edge is tangent to the obstacles at both ends
+    REDUCED = 5
 
 def build_vertexes_from_rect(rect: Rectangle, mode: VertMode = VertMode.CORNERS):
     res: list[Point] = []
@@ -30,15 +36,20 @@ class Waypoint(Vertex):
     def __init__(self, coords: Point):
         super().__init__()
         self.coords = coords
+        # neighbor -> intermediate points of the arc edge leading to it, see tangents.connect_ring
+        self.arcs: dict[Waypoint, list[Point]] = dict()
     
     def __hash__(self):
-        return self.coords.x.__hash__() + self.coords.y.__hash__()
+        return hash(cell_key(self.coords.x, self.coords.y, EPS))
     
     def __eq__(self, other: 'Waypoint') -> bool:
         if not isinstance(other, Waypoint):
             return False
         return self.coords == other.coords
     
+    def location(self) -> tuple[float, float]:
+        return self.coords.x, self.coords.y
+    
     def distance(self, other: 'Waypoint'):
         return abs(other.coords - self.coords)
     
@@ -49,49 +60,121 @@ def check_collisions(qtree: QuadTree, p: Point|Line) -> bool:
     """
     returns True if p collides with anything in qtree
     """
+    if isinstance(p, Point):
+        return qtree.point_collides(p.x, p.y)
+    elif isinstance(p, Line):
+        return qtree.segment_collides(p.p1.x, p.p1.y, p.p2.x, p.p2.y)
+
     ts = make_sprite(p)  # Eeh, but ok
     for s in qtree.get_collision_candidates(ts):
         if ts.collision_shape.has_intersect(s.collision_shape):
             return True
     return False
 
-T = TypeVar('T')
-def get_matching_item(container: Iterable[T], item: T) -> Optional[T]:
-    return next((x for x in container if x == item), None)
+def bitangent_pairs(corners: list[tuple[Waypoint, Point, Point]]) -> list[tuple[Waypoint, Waypoint]]:
+    """
+    For corners given as (waypoint, previous corner, next corner) of their obstacle returns pairs of waypoints,
+    such that the segment between them leaves both obstacles on one side at each end.
+    A waypoint being a corner of several obstacles has to be tangent to all of them.
+    """
+    wps: list[Waypoint] = []
+    index: dict[Waypoint, int] = dict()
+    sides: list[list[tuple[Point, Point]]] = []
+    for wp, prev, next in corners:
+        if wp not in index:
+            index[wp] = len(wps)
+            wps.append(wp)
+            sides.append([])
+        sides[index[wp]].append((prev, next))
+
+    p = np.array([wp.coords.coords() for wp in wps], dtype=np.float64).reshape(-1, 2)
+    i, j = np.triu_indices(len(wps), k=1)
+    d = p[j] - p[i]
+    def side(end: np.ndarray, q: np.ndarray) -> np.ndarray:
+        # side of the segment line where points q lie, 0 for points on the line
+        c = d[:, 0] * (q[end, 1] - p[end, 1]) - d[:, 1] * (q[end, 0] - p[end, 0])
+        return (c > EPS).astype(np.int8) - (c < -EPS).astype(np.int8)
+
+    ok = np.ones(len(i), dtype=bool)
+    for k in range(max((len(s) for s in sides), default=0)):
+        # corners of less than k + 1 obstacles repeat the first one
+        adj = [s[k] if k < len(s) else s[0] for s in sides]
+        prev = np.array([a.coords() for a, _ in adj], dtype=np.float64).reshape(-1, 2)
+        next = np.array([b.coords() for _, b in adj], dtype=np.float64).reshape(-1, 2)
+        for end in (i, j):
+            ok &= side(end, prev) * side(end, next) >= 0
+    return [(wps[a], wps[b]) for a, b in zip(i[ok].tolist(), j[ok].tolist())]
 
 def merge_vertexes(g: Graph, vertex_dict: dict[QuadTree, list[Waypoint]]):
-    new_vertex_dict: dict[QuadTree, list[Waypoint]] = dict()
+    # nodes without waypoints are kept, so repair_graph tells them from new ones
+    new_vertex_dict: dict[QuadTree, list[Waypoint]] = {q: [] for q in vertex_dict}
 
     for q in vertex_dict:
         for v in vertex_dict[q]:
-            if v in g.vertexes:
-                v_replace = get_matching_item(g.vertexes, v)
-                v_replace = v_replace if v_replace else v
-                if q in new_vertex_dict:
-                    new_vertex_dict[q].append(v_replace)
-                else:
-                    new_vertex_dict[q] = [v_replace]
+            v_replace = g.find_vertex(v)
+            if v_replace is not None:
+                new_vertex_dict[q].append(v_replace)
     return g, new_vertex_dict
 
-def build_graph_on_quadtree(qtree: QuadTree, mode: VertMode = VertMode.CORNERS, return_vertex_dict: bool = False, quality=20) -> tuple[Graph, dict[QuadTree, list[Waypoint]]]:
+def build_graph_on_quadtree(qtree: QuadTree, mode: VertMode = VertMode.CORNERS, return_vertex_dict: bool = False, quality=20,
+                            circle_mode: CircleMode = CircleMode.POLYGON) -> tuple[Graph, dict[QuadTree, list[Waypoint]]]:
+    """
+    circle_mode:
+        CircleMode.POLYGON - circles give `quality` waypoints around them like other figures
+        CircleMode.TANGENT - circles give tangent points to other circles and to corners of other figures,
+            waypoints on a circle are joined by arcs
+    """
+    # Waypoints shared by several quads (corners, edge midpoints) are created once
+    waypoints: SpatialHash[Waypoint] = SpatialHash(EPS)
+    def get_waypoint(p: Point) -> Waypoint:
+        wp = waypoints.find(p.x, p.y)
+        if wp is None:
+            wp = Waypoint(p)
+            waypoints.add(p.x, p.y, wp)
+        return wp
+
+    circles, segments = tangent_segments(qtree, quality) if circle_mode is CircleMode.TANGENT else (dict(), [])
+    # points of the rings stand for the quad waypoints next to circles
+    rings_around = [(c.center, ring_radius(c, quality)) for c in circles.values()]
+
     vertex_dict: dict[QuadTree, list[Waypoint]] = dict()
     for q in qtree.dfs():
         vertex_dict[q] = []
         wps: list[Waypoint] = []
         for p in build_vertexes_from_rect(q.rectangle, mode=mode):
-            if not check_collisions(qtree, p):
-                wps.append(Waypoint(p))
+            if not check_collisions(qtree, p) and not any(abs(p - c) < r for c, r in rings_around):
+                wps.append(get_waypoint(p))
         vertex_dict[q] += wps
     
+    added: dict[QuadTree, set[Waypoint]] = {q: set(vertex_dict[q]) for q in vertex_dict}
+    def add_waypoint(p: Point) -> Waypoint:
+        q2 = qtree.get_quad_tree_at(p.x, p.y)
+        wp = get_waypoint(p)
+        if wp not in added[q2]:
+            vertex_dict[q2].append(wp)
+            added[q2].add(wp)
+        return wp
+
+    corners: list[tuple[Waypoint, Point, Point]] = []
     for q in qtree.dfs():
         for fig in q.sprites:
+            if circle_mode is CircleMode.TANGENT and isinstance(fig.collision_shape, Circle):
+                continue
             vs = fig.collision_shape.vertexes(quality=quality)
-            for p in vs:
-                q2 = qtree.get_quad_tree(make_sprite(p))
+            for k, p in enumerate(vs):
                 if not check_collisions(qtree, p):
-                    wp = Waypoint(p)
-                    if wp not in vertex_dict[q2]:
-                        vertex_dict[q2].append(wp)
+                    corners.append((add_waypoint(p), vs[k - 1], vs[(k + 1) % len(vs)]))
+
+    tangents: list[tuple[Waypoint, Waypoint]] = []
+    rings: dict[int, set[Waypoint]] = dict()
+    if circle_mode is CircleMode.TANGENT:
+        for p1, p2, i1, i2 in segments:
+            # tangent points are joined by the tangents and arcs only, quads don't get them
+            wp1, wp2 = get_waypoint(p1), get_waypoint(p2)
+            tangents.append((wp1, wp2))
+            for i, wp in ((i1, wp1), (i2, wp2)):
+                if i is not None:
+                    rings.setdefault(i, set()).add(wp)
     
     G = Graph()
     for q in vertex_dict:
@@ -101,17 +184,39 @@ def build_graph_on_quadtree(qtree: QuadTree, mode: VertMode = VertMode.CORNERS,
     G, vertex_dict = merge_vertexes(G, vertex_dict)
     # print(f"After merging: {len(G.vertexes)}")
 
-    for q in vertex_dict:
-        for v1 in vertex_dict[q]:
-            for tq in chain([q], q.find_adjacent(direction='all'), q.recursive_parents()):
-                for v2 in vertex_dict[tq]:
-                    v2: Waypoint
-                    if v1 == v2:
-                        continue
-                    if G.has_edge(v1, v2):
-                        continue
-                    if not check_collisions(qtree, Line(v1.coords, v2.coords)):
-                        G.add_edge(v1, v2, cost=v1.distance(v2))
+    # collecting candidate edges to test them for collisions in one batch
+    if mode is VertMode.REDUCED:
+        candidates = bitangent_pairs(corners)
+    else:
+        pairs: dict[tuple[int, int], tuple[Waypoint, Waypoint]] = dict()
+        for q in vertex_dict:
+            tqs = list(chain([q], q.find_adjacent(direction='all'), q.recursive_parents()))
+            for v1 in vertex_dict[q]:
+                for tq in tqs:
+                    for v2 in vertex_dict.get(tq, ()):
+                        v2: Waypoint
+                        if v1 == v2:
+                            continue
+                        key = (id(v1), id(v2)) if id(v1) < id(v2) else (id(v2), id(v1))
+                        if key not in pairs:
+                            pairs[key] = (v1, v2)
+        candidates = list(pairs.values())
+    x1, y1, x2, y2 = (np.fromiter(c, dtype=np.float64, count=len(candidates)) for c in (
+        (v1.coords.x for v1, _ in candidates), (v1.coords.y for v1, _ in candidates),
+        (v2.coords.x for _, v2 in candidates), (v2.coords.y for _, v2 in candidates),
+    ))
+    collides = check_collisions_batch(qtree, x1, y1, x2, y2)
+    costs = np.hypot(x2 - x1, y2 - y1)
+    for (v1, v2), c, cost in zip(candidates, collides.tolist(), costs.tolist()):
+        if not c:
+            G.add_edge(v1, v2, cost=cost)
+
+    # tangent segments may be longer than neighboring quads, they are known to be free
+    for v1, v2 in tangents:
+        if v1 is not v2 and not v1.has_edge_to(v2):
+            G.add_edge(v1, v2, cost=abs(v2.coords - v1.coords))
+    for i, ring in rings.items():
+        connect_ring(qtree, G, circles[i], ring_order(circles[i], list(ring)), quality)
     
     # maybe redundant
     # G, vertex_dict = merge_vertexes(G, vertex_dict)
@@ -0,0 +1,99 @@
+import numpy as np
+from math import hypot
+from typing import Iterable
+
+from .graph import Graph
+from .buildgraph import Waypoint
+
+from backend.geometry import Point
+
+class CSRGraph:
+    """
+    Frozen array-backed undirected graph in compressed sparse row form.
+    Vertexes are int32 ids 0..N-1 with coordinates (xs[i], ys[i]).
+    Neighbours of vertex i are indices[indptr[i]:indptr[i + 1]] with matching costs.
+    Every undirected edge is stored twice, once per direction.
+    """
+    def __init__(self, xs: np.ndarray, ys: np.ndarray, indptr: np.ndarray, indices: np.ndarray, costs: np.ndarray):
+        self.xs = np.ascontiguousarray(xs, dtype=np.float64)
+        self.ys = np.ascontiguousarray(ys, dtype=np.float64)
+        self.indptr = np.ascontiguousarray(indptr, dtype=np.int32)
+        self.indices = np.ascontiguousarray(indices, dtype=np.int32)
+        self.costs = np.ascontiguousarray(costs, dtype=np.float64)
+
+        assert len(self.xs) == len(self.ys) == len(self.indptr) - 1
+        assert len(self.indices) == len(self.costs) == self.indptr[-1]
+
+        for arr in (self.xs, self.ys, self.indptr, self.indices, self.costs):
+            arr.flags.writeable = False
+
+    @classmethod
+    def from_graph(cls, g: Graph, return_ids: bool = False) -> 'CSRGraph | tuple[CSRGraph, dict[Waypoint, int]]':
+        """
+        Packs a Graph of Waypoints (e.g. the output of build_graph_on_quadtree) into CSR arrays.
+        If return_ids, also returns the mapping of original vertexes to their ids.
+        """
+        vertexes: list[Waypoint] = list(g.vertexes)
+        ids = {id(v): i for i, v in enumerate(vertexes)}
+
+        degrees = np.array([len(v.edges) for v in vertexes], dtype=np.int32)
+        indptr = np.zeros(len(vertexes) + 1, dtype=np.int32)
+        np.cumsum(degrees, out=indptr[1:])
+
+        indices = np.fromiter((ids[id(e.other(v))] for v in vertexes for e in v.edges), dtype=np.int32, count=indptr[-1])
+        costs = np.fromiter((cost for v in vertexes for cost in v.edges.values()), dtype=np.float64, count=indptr[-1])
+        xs = np.fromiter((v.coords.x for v in vertexes), dtype=np.float64, count=len(vertexes))
+        ys = np.fromiter((v.coords.y for v in vertexes), dtype=np.float64, count=len(vertexes))
+
+        csr = cls(xs, ys, indptr, indices, costs)
+        if return_ids:
+            return csr, {v: ids[id(v)] for v in vertexes}
+        return csr
+
+    def to_graph(self, return_vertexes: bool = False) -> Graph | tuple[Graph, list[Waypoint]]:
+        """
+        Unpacks the arrays back into a Graph of Waypoints.
+        If return_vertexes, also returns the list of Waypoints ordered by id.
+        """
+        vertexes = [Waypoint(Point(x, y)) for x, y in zip(self.xs.tolist(), self.ys.tolist())]
+        indptr, indices, costs = self.indptr.tolist(), self.indices.tolist(), self.costs.tolist()
+        for i, v in enumerate(vertexes):
+            for j in range(indptr[i], indptr[i + 1]):
+                v.add_edge_to(vertexes[indices[j]], costs[j])
+
+        g = Graph(set(vertexes))
+        return g if not return_vertexes else (g, vertexes)
+
+    def __len__(self) -> int:
+        return len(self.xs)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__} of {len(self)} vertexes and {self.num_edges()} edges'
+
+    @property
+    def vertexes(self) -> range:
+        return range(len(self))
+
+    def num_edges(self) -> int:
+        return len(self.indices) // 2
+
+    def nbytes(self) -> int:
+        return sum(arr.nbytes for arr in (self.xs, self.ys, self.indptr, self.indices, self.costs))
+
+    def neighbors(self, v: int) -> Iterable[tuple[int, float]]:
+        a, b = self.indptr[v], self.indptr[v + 1]
+        return zip(self.indices[a:b].tolist(), self.costs[a:b].tolist())
+
+    def has_edge(self, v1: int, v2: int) -> bool:
+        return v2 in self.indices[self.indptr[v1]:self.indptr[v1 + 1]]
+
+    def cost(self, v1: int, v2: int) -> float:
+        a, b = self.indptr[v1], self.indptr[v1 + 1]
+        found = np.flatnonzero(self.indices[a:b] == v2)
+        return float(self.costs[a + found[0]]) if len(found) else float('inf')
+
+    def point(self, v: int) -> Point:
+        return Point(float(self.xs[v]), float(self.ys[v]))
+
+    def distance(self, v1: int, v2: int) -> float:
+        return hypot(self.xs[v1] - self.xs[v2], self.ys[v1] - self.ys[v2])
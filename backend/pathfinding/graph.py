@@ -1,9 +1,8 @@
 from multipledispatch import dispatch
-from typing import TypeVar, Iterable, Optional
+from typing import Iterable, Optional
 
-T = TypeVar('T')
-def get_matching_item(container: Iterable[T], item: T) -> Optional[T]:
-    return next((x for x in container if x == item), None)
+from backend.algo import SpatialHash
+from backend.geometry import EPS
 
 class GraphVertex:
     def __init__(self):
@@ -21,6 +20,13 @@ class GraphVertex:
     def __eq__(self, other: 'GraphVertex') -> bool:
         return id(self) == id(other)
     
+    def location(self) -> Optional[tuple[float, float]]:
+        """
+        Returns coordinates of the vertex if it has any.
+        Graph merges vertexes with matching locations.
+        """
+        return None
+    
     def add_edge_to(self, other: 'GraphVertex', cost: float = 1):
         """
         Adds an edge to this vertex's edge list.
@@ -72,30 +78,52 @@ class Graph:
     """
     Undirected graph
     """
-    def __init__(self, vertexes: set[GraphVertex] = set()):
-        self.vertexes = vertexes
-    
+    def __init__(self, vertexes: Optional[set[GraphVertex]] = None):
+        self.vertexes: set[GraphVertex] = set()
+        # vertexes with a location, to match them by coordinates
+        self.index: SpatialHash[GraphVertex] = SpatialHash(EPS)
+        for v in (vertexes if vertexes is not None else set()):
+            self._register(v)
+
+    def _register(self, vertex: GraphVertex):
+        if vertex in self.vertexes:
+            return
+        self.vertexes.add(vertex)
+        loc = vertex.location()
+        if loc is not None:
+            self.index.add(*loc, vertex)
+
+    def find_vertex(self, vertex: GraphVertex) -> Optional[GraphVertex]:
+        """
+        Returns the vertex of the graph matching the given one, or None.
+        Vertexes with a location are matched by coordinates, others by identity.
+        """
+        loc = vertex.location()
+        if loc is None:
+            return vertex if vertex in self.vertexes else None
+        return self.index.find(*loc)
+
     def add_vertex(self, vertex: GraphVertex):
-        v_replace = get_matching_item(self.vertexes, vertex)
+        v_replace = self.find_vertex(vertex)
         if v_replace is vertex:
             return
 
-        v_replace = v_replace if v_replace else vertex
-
         # fixing edges
         new_edges = dict()
         for edge in vertex.edges:
-            if edge.v1 is vertex and get_matching_item(self.vertexes, edge.v2):
-                new_edge = GraphEdge(v_replace, get_matching_item(self.vertexes, edge.v2))
-            elif edge.v2 is vertex and get_matching_item(self.vertexes, edge.v1):
-                new_edge = GraphEdge(get_matching_item(self.vertexes, edge.v1), v_replace)
+            if edge.v1 is vertex and self.find_vertex(edge.v2):
+                new_edge = GraphEdge(v_replace or vertex, self.find_vertex(edge.v2))
+            elif edge.v2 is vertex and self.find_vertex(edge.v1):
+                new_edge = GraphEdge(self.find_vertex(edge.v1), v_replace or vertex)
             else:
                 raise ValueError(f"Vertex {vertex} has an edge with no connection to itself")
             new_edges[new_edge] = vertex.edges[edge]
-        
+
+        if v_replace is None:
+            self._register(vertex)
+            v_replace = vertex
         v_replace.edges.update(new_edges)
-        self.vertexes.add(vertex)
-        
+
     def remove_vertex(self, vertex: GraphVertex):
         others: list[GraphVertex] = []
         for e in vertex.edges:
@@ -104,12 +132,15 @@ class Graph:
         for oth in others:
             vertex.remove_edge_to(oth)
         self.vertexes.remove(vertex)
-    
+        loc = vertex.location()
+        if loc is not None:
+            self.index.remove(*loc, vertex)
+
     @dispatch(GraphVertex, GraphVertex, cost=float)
     def add_edge(self, v1: GraphVertex, v2: GraphVertex, cost: float = 1.0):
         self.add_vertex(v1)
         self.add_vertex(v2)
-        v1, v2 = get_matching_item(self.vertexes, v1), get_matching_item(self.vertexes, v2)
+        v1, v2 = self.find_vertex(v1), self.find_vertex(v2)
         v1.add_edge_to(v2, cost)
         v2.add_edge_to(v1, cost)
     
@@ -120,6 +151,17 @@ class Graph:
     def has_edge(self, v1: GraphVertex, v2: GraphVertex):
         return v1.has_edge_to(v2)
 
+    def neighbors(self, v: GraphVertex) -> Iterable[tuple[GraphVertex, float]]:
+        for e, cost in v.edges.items():
+            yield e.other(v), cost
+
+    def point(self, v: GraphVertex):
+        # only available for vertexes with coordinates, like Waypoint
+        return v.coords
+
+    def distance(self, v1: GraphVertex, v2: GraphVertex) -> float:
+        return v1.distance(v2)
+
 class DirectedGraph(Graph):
     """
     Directed graph
@@ -128,8 +170,8 @@ class DirectedGraph(Graph):
     @dispatch(GraphVertex, GraphVertex, cost=float)
     def add_edge(self, v1: GraphVertex, v2: GraphVertex, cost: float = 1.0):
         v1.add_edge_to(v2, cost)
-        self.vertexes.add(v1)
-        self.vertexes.add(v2)
+        self._register(v1)
+        self._register(v2)
     
     @dispatch(GraphEdge, cost=float)
     def add_edge(self, e: GraphEdge, cost: float = 1.0):
@@ -0,0 +1,351 @@
+import numpy as np
+from typing import Generator, Iterable, Optional
+from itertools import chain
+from math import floor
+
+from backend.geometry import Point, Rectangle, EPS
+from backend.sprites import Sprite
+
+MAX_DEPTH = 24
+DEPTH_BITS = 5  # low bits of a node key, which store its depth
+
+X_BITS = 0x5555555555555555  # x index occupies even bits of a Morton code
+Y_BITS = 0xAAAAAAAAAAAAAAAA
+
+def spread_bits(v: int) -> int:
+    """
+    Inserts a zero bit after every bit of a 32-bit integer
+    """
+    v &= 0xFFFFFFFF
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        v = (v | (v << shift)) & mask
+    return v
+
+def morton(ix: int, iy: int) -> int:
+    return spread_bits(ix) | (spread_bits(iy) << 1)
+
+def shift_code(code: int, depth: int, dx: int, dy: int) -> Optional[int]:
+    """
+    Returns Morton code of the cell next to the given one at the same depth,
+    shifted by dx, dy in {-1, 0, 1}, or None if it is outside the root.
+    Works on dilated integers, without decoding indexes.
+    """
+    full = (1 << 2 * depth) - 1
+    for d, bits, other in ((dx, X_BITS & full, Y_BITS & full), (dy, Y_BITS & full, X_BITS & full)):
+        part = code & bits
+        if d > 0:
+            if part == bits:
+                return None
+            part = ((code | other) + 1) & bits
+        elif d < 0:
+            if part == 0:
+                return None
+            part = (part - 1) & bits
+        code = part | (code & other)
+    return code
+
+class LinearQuadNode:
+    """
+    Light handle of a LinearQuadTree node, with the query surface of a QuadTree node
+    """
+    __slots__ = ('tree', 'id')
+
+    def __init__(self, tree: 'LinearQuadTree', id: int):
+        self.tree = tree
+        self.id = id
+
+    def __hash__(self):
+        return hash((id(self.tree), self.id))
+
+    def __eq__(self, other: 'LinearQuadNode') -> bool:
+        return isinstance(other, LinearQuadNode) and self.tree is other.tree and self.id == other.id
+
+    def __repr__(self) -> str:
+        return f'LinearQuadNode of [{self.rectangle.bottom_left}, {self.rectangle.top_right}] region with {len(self.sprites)} sprites'
+
+    @property
+    def depth(self) -> int:
+        return int(self.tree.depths[self.id])
+
+    @property
+    def code(self) -> int:
+        return int(self.tree.codes[self.id])
+
+    @property
+    def rectangle(self) -> Rectangle:
+        return self.tree.node_rectangle(self.id)
+
+    @property
+    def sprites(self) -> set[Sprite]:
+        return self.tree.node_sprites[self.id]
+
+    @property
+    def parent(self) -> Optional['LinearQuadNode']:
+        if self.depth == 0:
+            return None
+        return self.tree.node(self.depth - 1, self.code >> 2)
+
+    def recursive_parents(self) -> Generator['LinearQuadNode', None, None]:
+        depth, code = self.depth, self.code
+        while depth > 0:
+            depth, code = depth - 1, code >> 2
+            yield self.tree.node(depth, code)
+
+    def dfs(self) -> Iterable['LinearQuadNode']:
+        a, b = self.tree.subtree(self.id)
+        for i in range(a, b):
+            yield self.tree.nodes[i]
+
+    def find_adjacent(self, direction: str = 'all') -> Generator['LinearQuadNode', None, None]:
+        """
+        Returns nodes touching the specified side of the node from outside:
+        the larger ones containing the cell next to it and the smaller ones inside that cell.
+        direction: str = 'all' | 'left' | 'right' | 'top' | 'bottom'
+        """
+        if direction == 'all':
+            for direction in ['left', 'right', 'top', 'bottom']:
+                yield from self.find_adjacent(direction)
+            return
+        shifts = {'left': (-1, 0), 'right': (1, 0), 'top': (0, 1), 'bottom': (0, -1)}
+        if direction not in shifts:
+            raise ValueError('Invalid direction')
+        yield from self.tree.adjacent(self.id, *shifts[direction])
+
+class LinearQuadTree:
+    """
+    Quadtree stored as sorted arrays of node keys instead of linked node objects.
+    Node of depth d covers the cell (ix, iy) of a 2^d x 2^d grid over the root rectangle
+    and is identified by the Morton code of (ix, iy), x taking the lower bits like in QuadTree.children.
+    Keys are (code << 2 * (max_depth - d)) << DEPTH_BITS | d, so sorted keys list the nodes in the dfs order
+    and a point is located by a binary search.
+    Sprites are stored in the deepest cell containing them, like in QuadTree, with all its ancestors present.
+    Adding sprites rebuilds the arrays, so the tree suits static maps.
+    """
+    def __init__(self, rect: Rectangle, sprites: Iterable[Sprite] = (), max_depth: int = MAX_DEPTH):
+        assert rect.size().x == rect.size().y
+        assert max_depth <= MAX_DEPTH
+
+        self.rectangle = rect
+        self.max_depth = max_depth
+        self.unit = rect.width() / (1 << max_depth)  # size of the deepest cell
+        self.cells: dict[tuple[int, int], set[Sprite]] = {(0, 0): set()}  # (depth, code) -> sprites
+        self.add_sprites(sprites)
+
+    def __repr__(self) -> str:
+        return f'LinearQuadTree of [{self.rectangle.bottom_left}, {self.rectangle.top_right}] region with {len(self.nodes)} nodes'
+
+    def key(self, depth: int, code: int) -> int:
+        return (code << 2 * (self.max_depth - depth)) << DEPTH_BITS | depth
+
+    def grid(self, x: float, y: float) -> tuple[int, int]:
+        """
+        Indexes of the deepest cell containing (x, y)
+        """
+        bl, n = self.rectangle.bottom_left, (1 << self.max_depth) - 1
+        return (min(max(floor((x - bl.x) / self.unit), 0), n),
+                min(max(floor((y - bl.y) / self.unit), 0), n))
+
+    def box_cell(self, xmin: float, ymin: float, xmax: float, ymax: float) -> Optional[tuple[int, int]]:
+        """
+        Returns (depth, code) of the deepest cell strictly containing the box, or None if the root doesn't
+        """
+        bl, tr = self.rectangle.bottom_left, self.rectangle.top_right
+        if xmin - EPS < bl.x or ymin - EPS < bl.y or xmax + EPS > tr.x or ymax + EPS > tr.y:
+            return None
+        x0, y0 = self.grid(xmin - EPS, ymin - EPS)
+        x1, y1 = self.grid(xmax + EPS, ymax + EPS)
+        depth = self.max_depth - max((x0 ^ x1).bit_length(), (y0 ^ y1).bit_length())
+        shift = self.max_depth - depth
+        return depth, morton(x0 >> shift, y0 >> shift)
+
+    def add_sprites(self, sprites: Iterable[Sprite]):
+        for s in sprites:
+            if s.collision_shape is None:
+                continue
+            box = s.collision_shape.aabb()
+            cell = self.box_cell(*box) if box is not None else None
+            if cell is None:
+                continue
+            depth, code = cell
+            self.cells.setdefault(cell, set()).add(s)
+            while depth > 0 and (depth - 1, code >> 2) not in self.cells:
+                depth, code = depth - 1, code >> 2
+                self.cells[(depth, code)] = set()
+        self.rebuild()
+
+    def rebuild(self):
+        cells = sorted(self.cells, key=lambda c: self.key(*c))
+        self.keys = np.array([self.key(*c) for c in cells], dtype=np.uint64)
+        self.depths = np.array([d for d, _ in cells], dtype=np.uint8)
+        self.codes = np.array([c for _, c in cells], dtype=np.uint64)
+        self.index: dict[int, int] = {(d, c): i for i, (d, c) in enumerate(cells)}
+        self.node_sprites: list[set[Sprite]] = [self.cells[c] for c in cells]
+        self.nodes: list[LinearQuadNode] = [LinearQuadNode(self, i) for i in range(len(cells))]
+        self.rectangles: list[Optional[Rectangle]] = [None] * len(cells)
+
+        # node cells in units of the deepest cells
+        ix = np.zeros(len(cells), dtype=np.int64)
+        iy = np.zeros(len(cells), dtype=np.int64)
+        for bit in range(self.max_depth):
+            ix |= ((self.codes >> np.uint64(2 * bit)) & np.uint64(1)).astype(np.int64) << bit
+            iy |= ((self.codes >> np.uint64(2 * bit + 1)) & np.uint64(1)).astype(np.int64) << bit
+        shift = self.max_depth - self.depths.astype(np.int64)
+        self.gx0, self.gy0 = ix << shift, iy << shift
+        self.gsize = np.ones(len(cells), dtype=np.int64) << shift
+
+        bl = self.rectangle.bottom_left
+        self.x0, self.y0 = bl.x + self.gx0 * self.unit, bl.y + self.gy0 * self.unit
+        self.x1, self.y1 = self.x0 + self.gsize * self.unit, self.y0 + self.gsize * self.unit
+        self.occupied = np.flatnonzero([len(ss) > 0 for ss in self.node_sprites])
+
+    def node(self, depth: int, code: int) -> Optional[LinearQuadNode]:
+        i = self.index.get((depth, code))
+        return self.nodes[i] if i is not None else None
+
+    def node_rectangle(self, i: int) -> Rectangle:
+        if self.rectangles[i] is None:
+            self.rectangles[i] = Rectangle(Point(float(self.x0[i]), float(self.y0[i])), Point(float(self.x1[i]), float(self.y1[i])))
+        return self.rectangles[i]
+
+    def subtree(self, i: int) -> tuple[int, int]:
+        """
+        Range of node indexes in the subtree of the node i
+        """
+        depth, code = int(self.depths[i]), int(self.codes[i])
+        end = self.key(depth, code + 1) & ~((1 << DEPTH_BITS) - 1)
+        return i, int(self.keys.searchsorted(end))
+
+    def locate(self, depth: int, code: int) -> LinearQuadNode:
+        """
+        Returns the deepest node containing the cell, found by a binary search:
+        the closest preceding key belongs to a descendant of that node
+        """
+        p = int(self.keys.searchsorted(self.key(depth, code), side='right')) - 1
+        pd, pc = int(self.depths[p]), int(self.codes[p])
+        d = min(depth, pd)
+        a, b = code >> 2 * (depth - d), pc >> 2 * (pd - d)
+        d -= ((a ^ b).bit_length() + 1) // 2
+        return self.nodes[self.index[(d, code >> 2 * (depth - d))]]
+
+    def adjacent(self, i: int, dx: int, dy: int) -> Generator[LinearQuadNode, None, None]:
+        depth, code = int(self.depths[i]), int(self.codes[i])
+        ncode = shift_code(code, depth, dx, dy)
+        if ncode is None:
+            return
+
+        # larger nodes containing the neighbour cell, up to the common ancestor
+        d, c, own = depth, ncode, code
+        while d > 0 and c != own:
+            n = self.node(d, c)
+            if n is not None:
+                yield n
+            d, c, own = d - 1, c >> 2, own >> 2
+
+        # smaller nodes inside the neighbour cell along the shared side
+        n = self.node(depth, ncode)
+        if n is None:
+            return
+        a, b = self.subtree(n.id)
+        if dx > 0:
+            touch = self.gx0[a + 1:b] == self.gx0[n.id]
+        elif dx < 0:
+            touch = self.gx0[a + 1:b] + self.gsize[a + 1:b] == self.gx0[n.id] + self.gsize[n.id]
+        elif dy > 0:
+            touch = self.gy0[a + 1:b] == self.gy0[n.id]
+        else:
+            touch = self.gy0[a + 1:b] + self.gsize[a + 1:b] == self.gy0[n.id] + self.gsize[n.id]
+        for j in np.flatnonzero(touch).tolist():
+            yield self.nodes[a + 1 + j]
+
+    @property
+    def sprites(self) -> set[Sprite]:
+        return self.node_sprites[0]
+
+    def dfs(self) -> Iterable[LinearQuadNode]:
+        return iter(self.nodes)
+
+    def get_sprites(self) -> set[Sprite]:
+        return set(chain.from_iterable(self.node_sprites))
+
+    def get_quad_tree(self, s: Sprite) -> Optional[LinearQuadNode]:
+        box = s.collision_shape.aabb()
+        cell = self.box_cell(*box) if box is not None else None
+        if cell is None:
+            return None
+        return self.locate(*cell)
+
+    def get_quad_tree_at(self, x: float, y: float) -> Optional[LinearQuadNode]:
+        """
+        get_quad_tree for a point sprite at (x, y)
+        """
+        cell = self.box_cell(x, y, x, y)
+        if cell is None:
+            return None
+        return self.locate(*cell)
+
+    def get_sprites_in_box(self, xmin: float, ymin: float, xmax: float, ymax: float) -> list[Sprite]:
+        """
+        Returns sprites of all nodes, which rectangles overlap the axis-aligned box
+        """
+        occ = self.occupied
+        mask = (self.x0[occ] <= xmax) & (self.x1[occ] >= xmin) & (self.y0[occ] <= ymax) & (self.y1[occ] >= ymin)
+        return list(chain.from_iterable(self.node_sprites[i] for i in occ[mask].tolist()))
+
+    def get_collision_candidates(self, s: Sprite) -> set[Sprite]:
+        box = s.collision_shape.aabb()
+        if box is None:
+            return self.get_sprites()
+        return set(self.get_sprites_in_box(*box))
+
+    def point_collides(self, x: float, y: float) -> bool:
+        for s in self.get_sprites_in_box(x - EPS, y - EPS, x + EPS, y + EPS):
+            if s.collision_shape.has_intersect_point(x, y):
+                return True
+        return False
+
+    def segment_collides(self, x1: float, y1: float, x2: float, y2: float) -> bool:
+        for s in self.get_sprites_in_box(min(x1, x2) - EPS, min(y1, y2) - EPS, max(x1, x2) + EPS, max(y1, y2) + EPS):
+            if s.collision_shape.has_intersect_segment(x1, y1, x2, y2):
+                return True
+        return False
+
+if __name__ == '__main__':
+    from time import perf_counter
+    from random import random, seed
+
+    from .quadtree import QuadTree
+    from .buildgraph import build_graph_on_quadtree, VertMode
+    from backend.scene_generators import SpriteGenerator
+
+    test_n = 0
+    if test_n == 0:
+        # linked vs linear tree on the same scene: same nodes, time of point location, neighbours and graph building
+        seed(0)
+        np.random.seed(0)
+        sprites = SpriteGenerator(Rectangle(Point(0, 0), Point(15, 15)), avg_size=1).generate_sprites(200)
+        rect = Rectangle(Point(-5, -5), Point(20, 20))
+        qtree = QuadTree(rect)
+        qtree.add_sprites(sprites)
+        lqtree = LinearQuadTree(rect, sprites)
+        print(f'{len(list(qtree.dfs()))} linked nodes, {len(lqtree.nodes)} linear nodes')
+
+        points = [(random() * 25 - 5, random() * 25 - 5) for _ in range(10000)]
+        for tree in (qtree, lqtree):
+            name = tree.__class__.__name__
+            ts = perf_counter()
+            for x, y in points:
+                tree.get_quad_tree_at(x, y)
+            locate_time = (perf_counter() - ts) / len(points)
+
+            nodes = list(tree.dfs())
+            ts = perf_counter()
+            adjacent = sum(len(list(q.find_adjacent('all'))) for q in nodes)
+            adjacent_time = (perf_counter() - ts) / len(nodes)
+
+            ts = perf_counter()
+            G = build_graph_on_quadtree(tree, mode=VertMode.ALL)
+            graph_time = perf_counter() - ts
+            edges = sum(len(v.edges) for v in G.vertexes) // 2
+            print(f'{name:>15}: get_quad_tree_at {locate_time * 1e6:6.1f} us, find_adjacent {adjacent_time * 1e6:7.1f} us '
+                  f'({adjacent} found), graph of {len(G.vertexes)} vertexes and {edges} edges in {graph_time:.2f}s')
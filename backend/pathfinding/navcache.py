@@ -0,0 +1,125 @@
+import hashlib
+import io
+import os
+import numpy as np
+from time import time
+from typing import Optional
+
+from .graph import Graph
+from .csr_graph import CSRGraph
+from .quadtree import QuadTree
+from .buildgraph import build_graph_on_quadtree, Waypoint, VertMode
+from .tangents import CircleMode
+
+from backend.geometry import Circle, Point
+
+# bump when the graph building or the file layout changes, so old cache files are not used
+NAVCACHE_VERSION = 2
+
+def shape_key(shape) -> tuple:
+    if isinstance(shape, Circle):
+        return type(shape).__name__, (shape.center.x, shape.center.y, shape.radius)
+    return type(shape).__name__, tuple(c for p in shape.vertexes() for c in (p.x, p.y))
+
+def scene_fingerprint(qtree: QuadTree, mode: VertMode = VertMode.CORNERS, quality: int = 20,
+                      circle_mode: CircleMode = CircleMode.POLYGON) -> str:
+    """
+    sha256 of everything build_graph_on_quadtree depends on:
+    nodes of the tree in dfs order with their rectangles and obstacles, and the building parameters
+    """
+    h = hashlib.sha256(repr((NAVCACHE_VERSION, mode.name, quality, circle_mode.name)).encode())
+    for q in qtree.dfs():
+        r = q.rectangle
+        shapes = sorted(shape_key(s.collision_shape) for s in q.sprites if s.collision_shape is not None)
+        h.update(repr((r.bottom_left.x, r.bottom_left.y, r.top_right.x, r.top_right.y,
+                       [ch is not None for ch in q.children], shapes)).encode())
+    return h.hexdigest()
+
+def save_graph(path: str, fingerprint: str, qtree: QuadTree, graph: Graph, vertex_dict: dict[QuadTree, list[Waypoint]]):
+    """
+    Writes the graph as CSR arrays, vertex_dict as lists of vertex ids of the tree nodes in dfs order,
+    and arcs of waypoints (see tangents.connect_ring) as flat arrays
+    """
+    csr, ids = CSRGraph.from_graph(graph, return_ids=True)
+
+    node_vertexes = [[ids[v] for v in vertex_dict.get(q, [])] for q in qtree.dfs()]
+    arcs = [(ids[v], ids[u], arc) for v in graph.vertexes for u, arc in v.arcs.items()]
+    arc_points = [p for _, _, arc in arcs for p in arc]
+
+    buf = io.BytesIO()
+    np.savez(buf, fingerprint=np.frombuffer(fingerprint.encode(), dtype=np.uint8),
+             xs=csr.xs, ys=csr.ys, indptr=csr.indptr, indices=csr.indices, costs=csr.costs,
+             node_ptr=np.cumsum([0] + [len(vs) for vs in node_vertexes], dtype=np.int64),
+             node_vertexes=np.array([i for vs in node_vertexes for i in vs], dtype=np.int32),
+             arc_ends=np.array([(i, j) for i, j, _ in arcs], dtype=np.int32).reshape(-1, 2),
+             arc_ptr=np.cumsum([0] + [len(arc) for _, _, arc in arcs], dtype=np.int64),
+             arc_xy=np.array([(p.x, p.y) for p in arc_points], dtype=np.float64).reshape(-1, 2))
+
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(buf.getvalue())
+    os.replace(tmp, path)
+
+def load_graph(path: str, fingerprint: str, qtree: QuadTree) -> Optional[tuple[Graph, dict[QuadTree, list[Waypoint]]]]:
+    """
+    Reads the graph written by save_graph, returns None if there is no file or it was written for another scene
+    """
+    try:
+        data = np.load(path)
+    except (FileNotFoundError, ValueError, OSError):
+        return None
+    with data:
+        if bytes(data['fingerprint']).decode() != fingerprint:
+            return None
+        csr = CSRGraph(data['xs'], data['ys'], data['indptr'], data['indices'], data['costs'])
+        node_ptr, node_vertexes = data['node_ptr'].tolist(), data['node_vertexes'].tolist()
+        arc_ends, arc_ptr, arc_xy = data['arc_ends'].tolist(), data['arc_ptr'].tolist(), data['arc_xy'].tolist()
+
+    graph, vertexes = csr.to_graph(return_vertexes=True)
+    vertex_dict = {q: [vertexes[i] for i in node_vertexes[node_ptr[k]:node_ptr[k + 1]]] for k, q in enumerate(qtree.dfs())}
+    for k, (i, j) in enumerate(arc_ends):
+        vertexes[i].arcs[vertexes[j]] = [Point(x, y) for x, y in arc_xy[arc_ptr[k]:arc_ptr[k + 1]]]
+    return graph, vertex_dict
+
+def build_graph_cached(qtree: QuadTree, cache_dir: str, mode: VertMode = VertMode.CORNERS, quality: int = 20,
+                       circle_mode: CircleMode = CircleMode.POLYGON) -> tuple[Graph, dict[QuadTree, list[Waypoint]]]:
+    """
+    build_graph_on_quadtree with return_vertex_dict, which keeps its results in cache_dir.
+    Files are named by scene_fingerprint, so any change of obstacles or parameters builds the graph anew.
+    """
+    fingerprint = scene_fingerprint(qtree, mode, quality, circle_mode)
+    path = os.path.join(cache_dir, f'{fingerprint}.npz')
+    loaded = load_graph(path, fingerprint, qtree)
+    if loaded is not None:
+        return loaded
+
+    ts = time()
+    graph, vertex_dict = build_graph_on_quadtree(qtree, mode=mode, return_vertex_dict=True, quality=quality,
+                                                 circle_mode=circle_mode)
+    print(f'Building quadtree graph of {len(graph.vertexes)} vertices took {time() - ts: .2f}s')
+    os.makedirs(cache_dir, exist_ok=True)
+    save_graph(path, fingerprint, qtree, graph, vertex_dict)
+    return graph, vertex_dict
+
+if __name__ == '__main__':
+    import tempfile
+    from random import seed
+    from time import perf_counter
+    from backend.core import Core
+    from backend.geometry import Rectangle, Triangle
+    from backend.scene_generators import SpriteGenerator
+
+    test_n = 0
+    if test_n == 0:
+        # building the graph vs loading it from the cache
+        cache_dir = tempfile.mkdtemp()
+        for n_sprites in (10, 20, 40):
+            seed(n_sprites)
+            back = Core()
+            back.add_sprites(SpriteGenerator(Rectangle(Point(0, 0), Point(15, 10)), avg_size=2, types=[Triangle, Circle]).generate_sprites(n_sprites))
+            times = []
+            for _ in range(2):
+                ts = perf_counter()
+                graph, vertex_dict = build_graph_cached(back.quadtree, cache_dir, mode=VertMode.ALL)
+                times.append(perf_counter() - ts)
+            print(f'{n_sprites} sprites, V={len(graph.vertexes)}: build {times[0]:.3f}s, load {times[1]:.3f}s')
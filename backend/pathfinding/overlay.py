@@ -0,0 +1,120 @@
+import heapq
+from collections.abc import Set
+from itertools import chain, count
+from typing import Iterable, Optional
+
+from .graph import Graph
+from .buildgraph import Waypoint
+
+from backend.algo import SpatialHash
+from backend.geometry import Point, EPS
+
+class OverlayVertexes(Set):
+    """
+    Vertexes of the base graph and the virtual ones, without copying either
+    """
+    def __init__(self, overlay: 'GraphOverlay'):
+        self.overlay = overlay
+
+    def __contains__(self, v) -> bool:
+        return v in self.overlay.virtual or v in self.overlay.base.vertexes
+
+    def __iter__(self):
+        return chain(self.overlay.base.vertexes, self.overlay.virtual)
+
+    def __len__(self) -> int:
+        return len(self.overlay.base.vertexes) + len(self.overlay.virtual)
+
+class GraphOverlay:
+    """
+    Query-local vertexes and edges on top of a Graph of Waypoints, which is left untouched.
+    Virtual edges go both ways and join virtual vertexes with each other or with vertexes of the base graph.
+    Intermediate points of virtual arc edges are kept in .arcs instead of Waypoint.arcs.
+    Pathfinders take the overlay in place of the graph for a single query.
+    """
+    def __init__(self, base: Graph):
+        self.base = base
+        # virtual vertex -> its neighbors
+        self.virtual: dict[Waypoint, dict[Waypoint, float]] = dict()
+        # base vertex -> its virtual neighbors
+        self.extra: dict[Waypoint, dict[Waypoint, float]] = dict()
+        self.arcs: dict[tuple[Waypoint, Waypoint], list[Point]] = dict()
+        self.index: SpatialHash[Waypoint] = SpatialHash(EPS)
+        self.vertexes = OverlayVertexes(self)
+
+    def __len__(self) -> int:
+        return len(self.vertexes)
+
+    def is_virtual(self, v: Waypoint) -> bool:
+        return v in self.virtual
+
+    def find_vertex(self, v: Waypoint) -> Optional[Waypoint]:
+        """
+        Returns the vertex of the base graph or the virtual one at the location of v, or None
+        """
+        found = self.base.find_vertex(v)
+        return found if found is not None else self.index.find(*v.location())
+
+    def add_vertex(self, v: Waypoint) -> Waypoint:
+        """
+        Adds v as a virtual vertex, unless there already is a vertex at its location. Returns the vertex at the location.
+        """
+        found = self.find_vertex(v)
+        if found is not None:
+            return found
+        self.virtual[v] = dict()
+        self.index.add(*v.location(), v)
+        return v
+
+    def _adjacent(self, v: Waypoint) -> dict[Waypoint, float]:
+        return self.virtual[v] if v in self.virtual else self.extra.setdefault(v, dict())
+
+    def add_edge(self, v1: Waypoint, v2: Waypoint, cost: float):
+        if v1 not in self.virtual and v2 not in self.virtual:
+            raise ValueError("Edges between vertexes of the base graph belong to the base graph")
+        self._adjacent(v1)[v2] = cost
+        self._adjacent(v2)[v1] = cost
+
+    def has_edge(self, v1: Waypoint, v2: Waypoint) -> bool:
+        if v1 in self.virtual:
+            return v2 in self.virtual[v1]
+        if v2 in self.virtual:
+            return v1 in self.virtual[v2]
+        return self.base.has_edge(v1, v2)
+
+    def cost(self, v1: Waypoint, v2: Waypoint) -> float:
+        if v1 in self.virtual or v2 in self.virtual:
+            return self._adjacent(v1).get(v2, float('inf'))
+        return v1.cost(v2)
+
+    def neighbors(self, v: Waypoint) -> Iterable[tuple[Waypoint, float]]:
+        if v in self.virtual:
+            return self.virtual[v].items()
+        extra = self.extra.get(v)
+        return chain(self.base.neighbors(v), extra.items()) if extra else self.base.neighbors(v)
+
+    def point(self, v: Waypoint) -> Point:
+        return v.coords
+
+    def distance(self, v1: Waypoint, v2: Waypoint) -> float:
+        return v1.distance(v2)
+
+    def portals(self, v: Waypoint) -> dict[Waypoint, tuple[float, list[Waypoint]]]:
+        """
+        Cheapest ways from v to other vertexes going only through virtual vertexes.
+        Returns vertex -> (cost, path from v to it), base vertexes end the ways.
+        """
+        res: dict[Waypoint, tuple[float, list[Waypoint]]] = dict()
+        tie = count()
+        heap = [(0.0, next(tie), v, [v])]
+        while heap:
+            d, _, u, path = heapq.heappop(heap)
+            if u in res:
+                continue
+            res[u] = (d, path)
+            if u is not v and u not in self.virtual:
+                continue
+            for w, cost in (self.virtual.get(u) or self.extra.get(u) or dict()).items():
+                if w not in res:
+                    heapq.heappush(heap, (d + cost, next(tie), w, path + [w]))
+        return res
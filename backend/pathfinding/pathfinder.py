@@ -1,10 +1,21 @@
+import numpy as np
+from typing import Iterable, Optional
+
 from .graph import Graph, GraphEdge as Edge, GraphVertex as Vertex
+from .csr_graph import CSRGraph
+
+from .overlay import GraphOverlay
+from .search import BestFirstSearch
+from .tables import graph_digest, open_tables, write_tables
 
 class Pathfinder:
-    def __init__(self, g: Graph):
+    def __init__(self, g: Graph | CSRGraph):
         self.graph = g
     
-    def find_path(self, start: Vertex, end: Vertex) -> list[Vertex]:
+    def find_path(self, start: Vertex, end: Vertex, overlay: Optional[GraphOverlay] = None) -> list[Vertex]:
+        """
+        Finds path from start to end, which may be virtual vertexes of the overlay of the graph
+        """
         return []
     
     def update_shortest_paths(self, start: Vertex):
@@ -20,121 +31,250 @@ class Pathfinder:
         pass
 
 class Dijkstra(Pathfinder):
-    def __init__(self, g: Graph):
+    def __init__(self, g: Graph | CSRGraph):
         super().__init__(g)
+        self.search = BestFirstSearch(g)
     
-    def find_path(self, start: Vertex, end: Vertex):
+    def find_path(self, start: Vertex, end: Vertex, overlay: Optional[GraphOverlay] = None):
         """
         Finds path from start to end using Dijkstra algorithm
         """
-        if start not in self.graph.vertexes or end not in self.graph.vertexes:
+        graph = overlay if overlay is not None else self.graph
+        if start not in graph.vertexes or end not in graph.vertexes:
             raise RuntimeError("Vertexes not in graph")
         
         if start is end:
             return [start]
         
-        dist = {v: float('inf') for v in self.graph.vertexes}
-        prev = {v: None for v in self.graph.vertexes}
-        dist[start] = 0
-        
-        Q = set(self.graph.vertexes)
-        
-        while Q:
-            u = min(Q, key=lambda v: dist[v])
-            Q.remove(u)
-            
-            if u is end:
-                path = []
-                while u is not None:
-                    path.append(u)
-                    u = prev[u]
-                return path[::-1]
-            
-            for e in u.edges:
-                v = e.other(u)
-                alt = dist[u] + e.cost
-                if alt < dist[v]:
-                    dist[v] = alt
-                    prev[v] = u
-        
-        return []
+        return self.search.find_path(start, end, overlay)
+
+    def shortest_paths(self, start: Vertex, targets: Optional[Iterable[Vertex]] = None, radius: float = float('inf'),
+                       overlay: Optional[GraphOverlay] = None) -> tuple[dict[Vertex, float], dict[Vertex, Vertex]]:
+        """
+        Finds shortest paths from start to all targets, or to all vertexes within radius, in one search.
+        Returns distances and predecessors of reached vertexes, see BestFirstSearch.shortest_paths
+        """
+        if start not in (overlay if overlay is not None else self.graph).vertexes:
+            raise RuntimeError("Vertex not in graph")
+
+        return self.search.shortest_paths(start, targets, radius, overlay)
 
 class Floyd(Pathfinder):
-    def __init__(self, g: Graph):
+    """
+    All-pairs shortest paths of an undirected graph, kept in dense matrices indexed by vertex ids:
+    .dist[i, j] is the distance from i to j, .pred[i, j] is the vertex before j on the path from i, -1 if none.
+
+    If table is a file name, the matrices are memory-mapped from it when it was written for the same graph,
+    otherwise they are computed and written there (see tables.py). Vertexes of a Graph are then ordered by coordinates.
+    """
+    def __init__(self, g: Graph | CSRGraph, dtype: type = np.float32, table: Optional[str] = None):
         super().__init__(g)
+        self.dtype = dtype
+        self.table = table
 
-        self.dist = dict()
-        self.pred = dict()
+        self.vertexes: list[Vertex] = []
+        self.ids: dict[Vertex, int] = dict()
+        self.dist = np.zeros((0, 0), dtype=dtype)
+        self.pred = np.zeros((0, 0), dtype=np.int32)
+
+        if table is None or not self.open_table(table):
+            self.preprocess_paths()
+
+    def index(self, v: Vertex) -> int:
+        return v if isinstance(self.graph, CSRGraph) else self.ids[v]
+
+    def vertex(self, i: int) -> Vertex:
+        return i if isinstance(self.graph, CSRGraph) else self.vertexes[i]
+
+    def _check_ids(self, vs: list[Vertex]):
+        # vertexes added to the graph since preprocessing
+        if not isinstance(self.graph, CSRGraph) and any(v not in self.ids for v in vs):
+            self.preprocess_paths()
+
+    def _relax_through(self, k: int, via: Optional[np.ndarray] = None, shorter: Optional[np.ndarray] = None):
+        """
+        Shortens paths going through k, O(V^2) of vectorized work.
+        via and shorter are buffers of the shape of .dist to reuse.
+        """
+        via = np.add(self.dist[:, k, None], self.dist[k], out=via)
+        shorter = np.less(via, self.dist, out=shorter)
+        np.copyto(self.dist, via, where=shorter)
+        # row k itself never changes, as dist[k, k] is 0
+        np.copyto(self.pred, self.pred[k], where=shorter)
+
+    def _edges_of(self, v: Vertex) -> tuple[np.ndarray, np.ndarray]:
+        edges = [(self.index(u), cost) for u, cost in self.graph.neighbors(v)]
+        js = np.array([j for j, _ in edges], dtype=np.int64)
+        return js, np.array([cost for _, cost in edges], dtype=self.dtype)
 
-        self.preprocess_paths()
-    
     def preprocess_paths(self):
         """
         Fills .dist and .pred with shortest paths between all vertexes with Floyd algorithm
         """
+        n = self._number_vertexes()
 
-        for u in self.graph.vertexes:
-            self.dist[u] = {v: float('inf') for v in self.graph.vertexes}
-            self.pred[u] = {v: None for v in self.graph.vertexes}
-            self.dist[u][u] = 0
+        self.dist = np.full((n, n), np.inf, dtype=self.dtype)
+        self.pred = np.full((n, n), -1, dtype=np.int32)
+        np.fill_diagonal(self.dist, 0)
+        for i in range(n):
+            js, costs = self._edges_of(self.vertex(i))
+            self.dist[i, js] = costs
+            self.pred[i, js] = i
 
-            for e in u.edges:
-                v = e.other(u)
-                self.dist[u][v] = e.cost
-                self.pred[u][v] = u
+        via, shorter = np.empty_like(self.dist), np.empty(self.dist.shape, dtype=bool)
+        for k in range(n):
+            self._relax_through(k, via, shorter)
 
-        for k in self.graph.vertexes:
-            for i in self.graph.vertexes:
-                for j in self.graph.vertexes:
-                    if self.dist[i][j] > self.dist[i][k] + self.dist[k][j]:
-                        self.dist[i][j] = self.dist[i][k] + self.dist[k][j]
-                        self.pred[i][j] = self.pred[k][j]
-        
-    def find_path(self, start: Vertex, end: Vertex) -> list[Vertex]:
+        if self.table is not None:
+            write_tables(self.table, graph_digest(self.graph, self.vertexes), self.dist, self.pred)
+
+    def _number_vertexes(self) -> int:
+        if isinstance(self.graph, CSRGraph):
+            return len(self.graph)
+        self.vertexes = list(self.graph.vertexes)
+        if self.table is not None:
+            # the same graph has to get the same ids in every process
+            self.vertexes.sort(key=lambda v: (self.graph.point(v).x, self.graph.point(v).y))
+        self.ids = {v: i for i, v in enumerate(self.vertexes)}
+        return len(self.vertexes)
+
+    def open_table(self, path: str) -> bool:
         """
-        Restores path from preprocessed .pred
+        Maps the matrices from the file, returns False if it has no tables of this graph
         """
+        self._number_vertexes()
+        tables = open_tables(path, graph_digest(self.graph, self.vertexes), self.dtype)
+        if tables is None:
+            return False
+        self.dist, self.pred = tables
+        return True
 
-        if start not in self.graph.vertexes or end not in self.graph.vertexes:
+    def find_path(self, start: Vertex, end: Vertex, overlay: Optional[GraphOverlay] = None) -> list[Vertex]:
+        """
+        Restores path from preprocessed .pred.
+        Virtual start and end of the overlay are joined to the graph through the cheapest pair of vertexes they reach,
+        so the preprocessed paths stay valid.
+        """
+
+        if overlay is None:
+            if start not in self.graph.vertexes or end not in self.graph.vertexes:
+                raise RuntimeError("Vertexes not in graph")
+            return self.restore_path(start, end)
+
+        if start not in overlay.vertexes or end not in overlay.vertexes:
             raise RuntimeError("Vertexes not in graph")
 
-        if start not in self.dist:
-            self.preprocess_paths()
+        from_start, to_end = overlay.portals(start), overlay.portals(end)
+        # end may be reached through virtual vertexes only
+        best = from_start[end][0] if end in from_start else float('inf')
+        best_pair = None
 
-        path = []
-        if self.dist[start][end] == float('inf'):
-            return path  # No path exists
+        us = [(u, cost) for u, (cost, _) in from_start.items() if not overlay.is_virtual(u)]
+        vs = [(v, cost) for v, (cost, _) in to_end.items() if not overlay.is_virtual(v)]
+        if us and vs:
+            self._check_ids([u for u, _ in us] + [v for v, _ in vs])
+            iu = np.array([self.index(u) for u, _ in us])
+            iv = np.array([self.index(v) for v, _ in vs])
+            total = np.array([c for _, c in us])[:, None] + self.dist[np.ix_(iu, iv)] + np.array([c for _, c in vs])
+            a, b = np.unravel_index(np.argmin(total), total.shape)
+            if total[a, b] < best:
+                best_pair = us[a][0], vs[b][0]
 
-        current = end
-        while current != start:
-            if current is None:
-                return []  # No path exists
-            path.insert(0, current)
-            current = self.pred[start][current]
+        if best_pair is None:
+            return from_start[end][1] if end in from_start else []
+        u, v = best_pair
+        return from_start[u][1][:-1] + self.restore_path(u, v) + to_end[v][1][-2::-1]
 
-        path.insert(0, start)
-        return path
+    def restore_path(self, start: Vertex, end: Vertex) -> list[Vertex]:
+        """
+        Path between vertexes of the graph from .pred
+        """
+
+        self._check_ids([start, end])
+        i, j = self.index(start), self.index(end)
+        if self.dist[i, j] == np.inf:
+            return []  # No path exists
+
+        path = [j]
+        while j != i:
+            j = int(self.pred[i, j])
+            path.append(j)
+        return [self.vertex(k) for k in reversed(path)]
     
     def update_shortest_paths(self, start: Vertex):
         """
-        Updates shortest paths from start to all other vertexes in the graph
+        Updates shortest paths from start to all other vertexes in the graph,
+        after start was added to the graph or got new edges
         """
 
         if start not in self.graph.vertexes:
             raise RuntimeError("Vertex not in graph")
 
-        if start not in self.dist:
-            self.dist[start] = {v: float('inf') for v in self.graph.vertexes}
-            self.pred[start] = {v: None for v in self.graph.vertexes}
-            self.dist[start][start] = 0
-
-            for e in start.edges:
-                v = e.other(start)
-                self.dist[start][v] = e.cost
-                self.pred[start][v] = start
-
-        for i in self.graph.vertexes:
-            for j in self.graph.vertexes:
-                if self.dist[i][j] > self.dist[i][start] + self.dist[start][j]:
-                    self.dist[i][j] = self.dist[i][start] + self.dist[start][j]
-                    self.pred[i][j] = self.pred[start][j]
\ No newline at end of file
+        if isinstance(self.graph, CSRGraph) or start in self.ids:
+            s = self.index(start)
+        else:
+            s = len(self.vertexes)
+            self.vertexes.append(start)
+            self.ids[start] = s
+            self.dist = np.pad(self.dist, ((0, 1), (0, 1)), constant_values=np.inf)
+            self.pred = np.pad(self.pred, ((0, 1), (0, 1)), constant_values=-1)
+            self.dist[s, s] = 0
+
+        # paths from start go through one of its edges, paths to it are the same reversed
+        js, costs = self._edges_of(start)
+        if len(js):
+            cols = np.arange(len(self.dist))
+            via = costs[:, None] + self.dist[js]
+            best = np.argmin(via, axis=0)
+            first = js[best]  # the first vertex after start on the path to each vertex
+            row = via[best, cols]
+            shorter = row < self.dist[s]
+            shorter[s] = False
+            self.dist[s, shorter] = row[shorter]
+            self.dist[shorter, s] = row[shorter]
+            self.pred[s, shorter] = np.where(first == cols, s, self.pred[first, cols])[shorter]
+            self.pred[shorter, s] = first[shorter]
+
+        self._relax_through(s)
+
+if __name__ == '__main__':
+    from random import random, sample, seed
+    from time import perf_counter
+    from backend.geometry import Point
+    from .buildgraph import Waypoint
+
+    test_n = 0
+    if test_n == 0:
+        # Floyd preprocessing time on random geometric graphs, checked against Dijkstra
+        seed(0)
+        for n in (200, 500, 1000):
+            g = Graph(set(Waypoint(Point(random() * 100, random() * 100)) for _ in range(n)))
+            vs = list(g.vertexes)
+            for v in vs:
+                for u in sample(vs, 5):
+                    if u is not v and not g.has_edge(v, u):
+                        g.add_edge(v, u, cost=v.distance(u))
+            ts = perf_counter()
+            floyd = Floyd(g)
+            print(f'V={n:5}: preprocessing {perf_counter() - ts:6.2f}s, {floyd.dist.nbytes + floyd.pred.nbytes >> 20} MiB')
+
+            dist, _ = Dijkstra(g).shortest_paths(vs[0])
+            assert all(abs(floyd.dist[floyd.ids[vs[0]], floyd.ids[v]] - d) < 1e-3 for v, d in dist.items())
+    elif test_n == 1:
+        # building tables vs opening them from a file
+        import os, tempfile
+        seed(0)
+        g = Graph(set(Waypoint(Point(random() * 100, random() * 100)) for _ in range(1000)))
+        vs = list(g.vertexes)
+        for v in vs:
+            for u in sample(vs, 5):
+                if u is not v and not g.has_edge(v, u):
+                    g.add_edge(v, u, cost=v.distance(u))
+        path = os.path.join(tempfile.mkdtemp(), 'floyd.apsp')
+        ts = perf_counter()
+        Floyd(g, table=path)
+        print(f'build and write: {perf_counter() - ts:.2f}s, {os.path.getsize(path) >> 20} MiB')
+        ts = perf_counter()
+        floyd = Floyd(g, table=path)
+        print(f'open: {perf_counter() - ts:.3f}s, first query {len(floyd.find_path(vs[0], vs[1]))} vertexes')
+        os.remove(path)
@@ -1,15 +1,53 @@
+import numpy as np
+from collections import deque
+from enum import Enum
 from typing import Generator, Iterable, Optional
 from itertools import chain
+from math import sqrt
 
 from .graph import Graph
 from .graph import GraphVertex as Vertex
 from .graph import GraphEdge as Edge
 
-from backend.geometry import Point, Rectangle, Line
+from backend.geometry import Figure, Point, Rectangle, Circle, Line, EPS, boxes_overlap
 from backend.sprites import Sprite
 
 SPLIT_CONST = 2
 
+Box = tuple[float, float, float, float]
+
+def sprite_box(s: Sprite) -> Optional[Box]:
+    shape = s.collision_shape
+    if shape is None:
+        return None
+    return shape.aabb() or s.mass_center.aabb()
+
+class ChangeKind(Enum):
+    INSERT = 0
+    REMOVE = 1
+    MOVE = 2
+
+class Change:
+    """
+    Entry of QuadTree.journal: the sprite was inserted, removed or moved by the change of the given version.
+    old and new are its bounding boxes before and after, None where it wasn't in the tree.
+    """
+    __slots__ = ('version', 'kind', 'sprite', 'old', 'new')
+
+    def __init__(self, version: int, sprite: Sprite, old: Optional[Box], new: Optional[Box]):
+        self.version = version
+        self.kind = ChangeKind.INSERT if old is None else ChangeKind.REMOVE if new is None else ChangeKind.MOVE
+        self.sprite = sprite
+        self.old = old
+        self.new = new
+
+    def __repr__(self) -> str:
+        return f'Change {self.version}: {self.kind.name} {self.old} -> {self.new}'
+
+    def touches(self, box: Box) -> bool:
+        return any(b is not None and b[0] <= box[2] and box[0] <= b[2] and b[1] <= box[3] and box[1] <= b[3]
+                   for b in (self.old, self.new))
+
 def split_rectangle(rect: Rectangle, N: int = SPLIT_CONST):
     size = rect.top_right - rect.bottom_left
     size /= N
@@ -18,6 +56,18 @@ def split_rectangle(rect: Rectangle, N: int = SPLIT_CONST):
             bot_left = rect.bottom_left + Point(size.x * ix, size.y * iy)
             yield ix, iy, Rectangle(bot_left, bot_left + size)
 
+def containment_box(shape: Figure) -> Optional[tuple[float, float, float, float]]:
+    """
+    Returns the box, which lies inside a rectangle shrunk by EPS exactly when Rectangle.contains(shape)
+    """
+    if shape is None:
+        return None
+    if isinstance(shape, Circle):
+        # edges may come closer to the circle than EPS, but the center must be strictly inside
+        c, r = shape.center, max(shape.radius - 2 * EPS, 0)
+        return c.x - r, c.y - r, c.x + r, c.y + r
+    return shape.aabb()
+
 def opposite_direction(direction: str) -> str:
     all_directions = ['left', 'right', 'top', 'bottom']
     opposite = ['right', 'left', 'bottom', 'top']
@@ -30,13 +80,49 @@ def opposite_corner(corner: tuple[str]) -> tuple[str]:
     return tuple(opposite_direction(d) for d in corner)
 
 class QuadTree:
-    def __init__(self, rect: Rectangle, parent: Optional['QuadTree'] = None):
+    """
+    If looseness > 1, the tree is loose: every node stores sprites fitting into its rectangle
+    scaled by looseness around the center, so sprites straddling child boundaries still sink down.
+    Rectangles still partition the space, while queries use the enlarged bounds.
+    Subdivision stops at max_depth or when children would be smaller than min_size.
+    A leaf keeps up to capacity sprites and splits only when it overflows, 0 means always split.
+    Children inherit all these settings.
+
+    Every change of the tree gets a new version. A node keeps the version of the last change of its sprites
+    or children, including its subtree, so the version of the root is the current one.
+    The root keeps the last journal_size changes of sprites in journal, see changes_since.
+    """
+    def __init__(self, rect: Rectangle, parent: Optional['QuadTree'] = None, looseness: float = 1.0,
+                 max_depth: Optional[int] = None, min_size: float = 0.0, capacity: int = 0,
+                 journal_size: int = 1024):
         assert rect.size().x == rect.size().y
+        assert looseness >= 1
         
         self.rectangle = rect
+        self.looseness = looseness
+        self.max_depth = max_depth
+        self.min_size = min_size
+        self.capacity = capacity
+        self.depth: int = 0 if parent is None else parent.depth + 1
+        if looseness == 1:
+            self.bounds = rect
+        else:
+            margin = rect.size() * ((looseness - 1) / 2)
+            self.bounds = Rectangle(rect.bottom_left - margin, rect.top_right + margin)
         self.parent = parent
+        # nodes never change their tree
+        self._root: QuadTree = self if parent is None else parent._root
         self.sprites: set[Sprite] = set()
         self.children: list[QuadTree] = [None] * SPLIT_CONST ** 2
+        # sprites moved since the last relocate_dirty, only used by the root
+        self.dirty: set[Sprite] = set()
+
+        self.version: int = 0
+        # only the root keeps the journal and boxes of sprites as of their last change
+        self.journal: Optional[deque[Change]] = deque(maxlen=journal_size) if parent is None else None
+        self.boxes: Optional[dict[Sprite, Box]] = dict() if parent is None else None
+        # the newest version dropped from the journal
+        self.forgotten: int = 0
     
     def __repr__(self) -> str:
         return f'QuadTree of [{self.rectangle.bottom_left}, {self.rectangle.top_right}] region with {len(self.sprites)} sprites'
@@ -53,8 +139,32 @@ class QuadTree:
         return s
         
     def contains(self, s: Sprite):
-        return self.rectangle.contains(s.collision_shape)
+        shape = s.collision_shape
+        if shape is None:
+            return False
+        # bounding boxes reject most sprites before the exact test
+        box, (xmin, ymin, xmax, ymax) = shape.aabb(), self.bounds.aabb()
+        if box is not None and (box[0] < xmin - EPS or box[1] < ymin - EPS or box[2] > xmax + EPS or box[3] > ymax + EPS):
+            return False
+        return self.bounds.contains(shape)
     
+    def child_for(self, s: Sprite) -> Optional['QuadTree']:
+        """
+        Returns the child, which should store the sprite, or None if it stays in this node.
+        Loose children overlap, so the sprite goes to the one with its mass center inside.
+        """
+        if self.looseness == 1:
+            for ch in self.iter_children():
+                if ch.contains(s):
+                    return ch
+            return None
+
+        bl, size = self.rectangle.bottom_left, self.rectangle.size() / SPLIT_CONST
+        ix = min(max(int((s.mass_center.x - bl.x) // size.x), 0), SPLIT_CONST - 1)
+        iy = min(max(int((s.mass_center.y - bl.y) // size.y), 0), SPLIT_CONST - 1)
+        ch = self.children[ix + iy * SPLIT_CONST]
+        return ch if ch is not None and ch.contains(s) else None
+
     def childless(self) -> bool:
         return not any([ch is not None for ch in self.children])
     
@@ -152,19 +262,35 @@ class QuadTree:
                     continue
                 yield from q.get_side_grandchildren(opposite_direction(direction), edge)
 
+    def can_split(self) -> bool:
+        if self.max_depth is not None and self.depth >= self.max_depth:
+            return False
+        return self.rectangle.width() / SPLIT_CONST >= self.min_size
+
     def init_children(self):
+        created = []
         for ix, iy, rect in split_rectangle(self.rectangle):
             i = ix + iy * SPLIT_CONST
             if self.children[i] is None:
-                self.children[i] = QuadTree(rect, self)
+                self.children[i] = QuadTree(rect, self, self.looseness, self.max_depth, self.min_size, self.capacity)
+                created.append(self.children[i])
+        if created:
+            v = self.root().version + 1
+            for ch in created:
+                ch.version = v
+            self.bump(v)
     
     def clear_children(self):
+        pruned = False
         for i, ch in enumerate(self.children):
             if ch is None:
                 continue
             if len(ch.sprites) == 0 and ch.childless():
                 del ch
                 self.children[i] = None
+                pruned = True
+        if pruned:
+            self.bump(self.root().version + 1)
     
     def recursive_parents(self) -> Generator['QuadTree', None, None]:
         if self.parent is not None:
@@ -172,6 +298,8 @@ class QuadTree:
             yield from self.parent.recursive_parents()
 
     def optimize_tree(self) -> set[Sprite]:
+        # nodes of sprites before, to journal what moved when called on the root
+        before = {s: s.node for s in self.boxes} if self.parent is None else None
         lost_by_children = set()
         for ch in self.iter_children():
             lost_by_children.update(ch.optimize_tree())
@@ -191,31 +319,259 @@ class QuadTree:
         
         moved = set()
         for s in chain(self.sprites, lost_by_children):
-            for ch in self.iter_children():
-                if ch.contains(s):
-                    ch.add_sprites([s])
-                    moved.add(s)
-                    break
+            ch = self.child_for(s)
+            if ch is not None:
+                ch._add([s])
+                moved.add(s)
         lost_by_children.difference_update(moved)
         self.sprites.difference_update(moved)
         self.sprites.update(lost_by_children)
+        for s in lost_by_children:
+            s.node = self
+        if self.parent is None:
+            for s in lost:
+                s.node = None
+            self.dirty.clear()
         
         self.clear_children()
+        if before is not None:
+            for s, node in before.items():
+                self.record(s, node)
+        return lost
+
+    def root(self) -> 'QuadTree':
+        return self._root
+
+    def mark_dirty(self, s: Sprite):
+        """
+        Called by a sprite stored in this node after it moved
+        """
+        self.root().dirty.add(s)
+
+    def relocate(self, s: Sprite) -> bool:
+        """
+        Moves the sprite from its node up to the first node containing it, then down as deep as possible.
+        If the sprite left the root, drops it and returns False.
+        """
+        node: QuadTree = s.node
+        node.sprites.discard(s)
+        s.node = None
+
+        q = node
+        while q is not None and not q.contains(s):
+            q = q.parent
+        if q is not None:
+            q._add([s])
+
+        # remove branches left empty
+        for p in node.recursive_parents():
+            p.clear_children()
+        self.record(s, node)
+        return q is not None
+
+    def remove_sprite(self, s: Sprite):
+        """
+        Removes the sprite from its node and prunes branches left empty
+        """
+        node: QuadTree = s.node
+        if node is None:
+            return
+        node.sprites.discard(s)
+        node.root().dirty.discard(s)
+        s.node = None
+        for p in node.recursive_parents():
+            p.clear_children()
+        self.record(s, node)
+
+    def bump(self, v: int):
+        """
+        Sets version v to the node and its parents, v must be newer than the version of the root
+        """
+        q = self
+        while q is not None and q.version < v:
+            q.version = v
+            q = q.parent
+
+    def record(self, s: Sprite, old_node: Optional['QuadTree']):
+        """
+        Journals the change of the sprite, which was stored in old_node before.
+        Does nothing if neither its node nor its box changed.
+        """
+        root = self.root()
+        if old_node is not None and old_node.root() is not root:
+            # the sprite came from another tree
+            old_node = None
+        old = root.boxes.get(s)
+        new = sprite_box(s) if s.node is not None else None
+        if old == new and old_node is s.node:
+            return
+        v = root.version + 1
+        for q in (old_node, s.node, root):
+            if q is not None:
+                q.bump(v)
+        if new is None:
+            root.boxes.pop(s, None)
+        else:
+            root.boxes[s] = new
+        if len(root.journal) == root.journal.maxlen:
+            root.forgotten = root.journal[0].version if root.journal else v
+        root.journal.append(Change(v, s, old, new))
+
+    def changes_since(self, version: int, region: Optional[Box] = None) -> Optional[list[Change]]:
+        """
+        Returns changes of sprites newer than version, which old or new boxes touch region (by default, everything),
+        oldest first. Returns None if the journal doesn't reach back to version, then everything should be assumed changed.
+        Called on a node, it looks only at changes within its subtree.
+        """
+        if self.version <= version:
+            return []
+        root = self.root()
+        if version < root.forgotten:
+            return None
+        if region is None and self is not root:
+            region = self.bounds.aabb()
+        res = []
+        for c in reversed(root.journal):
+            if c.version <= version:
+                break
+            if region is None or c.touches(region):
+                res.append(c)
+        return res[::-1]
+
+    def relocate_dirty(self) -> set[Sprite]:
+        """
+        Relocates only the sprites moved since the last call, unlike optimize_tree.
+        Should be called on the root. Returns sprites, which left the tree.
+        """
+        lost = set()
+        dirty, self.dirty = self.dirty, set()
+        for s in dirty:
+            if s.node is not None and not self.relocate(s):
+                lost.add(s)
         return lost
     
     def add_sprites(self, sprites: Iterable[Sprite]):
+        sprites = list(sprites)
+        old_nodes = [s.node for s in sprites]
+        self._add(sprites)
+        for s, node in zip(sprites, old_nodes):
+            self.record(s, node)
+
+    def _add(self, sprites: Iterable[Sprite]):
         for s in sprites:
             if self.contains(s):
+                leaf = self.childless()
+                if not self.can_split() or leaf and len(self.sprites) < self.capacity:
+                    self.sprites.add(s)
+                    s.node = self
+                    continue
+
                 self.init_children()
-                for ch in self.iter_children():
-                    if ch.contains(s):
-                        ch.add_sprites([s])
-                        break
-                else: # if not break encountered
+                if leaf and self.capacity > 0:
+                    # the bucket overflowed, pushing its sprites down
+                    for t in list(self.sprites):
+                        ch = self.child_for(t)
+                        if ch is not None:
+                            self.sprites.remove(t)
+                            ch._add([t])
+                ch = self.child_for(s)
+                if ch is not None:
+                    ch._add([s])
+                else:
                     self.sprites.add(s)
+                    s.node = self
         
         self.clear_children()
     
+    def stats(self) -> dict[str, int | dict[int, int]]:
+        """
+        Returns numbers of nodes, leaves and sprites, the depth of the tree,
+        histograms of nodes per depth and of leaves per number of sprites in them
+        """
+        depths: dict[int, int] = dict()
+        leaf_sizes: dict[int, int] = dict()
+        nodes = leaves = sprites = 0
+        for q in self.dfs():
+            nodes += 1
+            sprites += len(q.sprites)
+            depths[q.depth - self.depth] = depths.get(q.depth - self.depth, 0) + 1
+            if q.childless():
+                leaves += 1
+                leaf_sizes[len(q.sprites)] = leaf_sizes.get(len(q.sprites), 0) + 1
+        return {'nodes': nodes, 'leaves': leaves, 'sprites': sprites, 'depth': max(depths),
+                'depths': dict(sorted(depths.items())), 'leaf_sizes': dict(sorted(leaf_sizes.items()))}
+
+    @classmethod
+    def from_sprites(cls, rect: Rectangle, sprites: Iterable[Sprite], **kwargs) -> 'QuadTree':
+        """
+        Bulk-loading constructor, kwargs are passed to QuadTree
+        """
+        qtree = cls(rect, **kwargs)
+        qtree.load_sprites(sprites)
+        return qtree
+
+    def load_sprites(self, sprites: Iterable[Sprite]):
+        """
+        Bulk version of add_sprites with the same result.
+        Computes boxes of all sprites up front and distributes them top-down in one pass,
+        creating only the children, which receive sprites.
+        """
+        sprites = list(sprites)
+        old_nodes = [s.node for s in sprites]
+        boxes = np.array([containment_box(s.collision_shape) or (np.nan,) * 4 for s in sprites], dtype=np.float64).reshape(-1, 4)
+        centers = np.array([s.mass_center.coords() for s in sprites], dtype=np.float64).reshape(-1, 2)
+        idx = np.flatnonzero(self.fits(boxes))
+        if len(idx):
+            self._load(sprites, boxes, centers, idx)
+        for s, node in zip(sprites, old_nodes):
+            self.record(s, node)
+
+    def fits(self, boxes: np.ndarray) -> np.ndarray:
+        """
+        Vectorized contains for containment boxes
+        """
+        bl, tr = self.bounds.bottom_left, self.bounds.top_right
+        return ((boxes[:, 0] >= bl.x + EPS) & (boxes[:, 1] >= bl.y + EPS) &
+                (boxes[:, 2] <= tr.x - EPS) & (boxes[:, 3] <= tr.y - EPS))
+
+    def _load(self, sprites: list[Sprite], boxes: np.ndarray, centers: np.ndarray, idx: np.ndarray):
+        leaf = self.childless()
+        if not self.can_split() or leaf and len(self.sprites) + len(idx) <= self.capacity:
+            for i in idx.tolist():
+                self.sprites.add(sprites[i])
+                sprites[i].node = self
+            return
+
+        if leaf and self.capacity > 0 and self.sprites:
+            # the bucket overflows, its sprites are distributed along with the new ones
+            old = list(self.sprites)
+            self.sprites.clear()
+            idx = np.concatenate([idx, np.arange(len(sprites), len(sprites) + len(old))])
+            sprites = sprites + old
+            boxes = np.concatenate([boxes, [containment_box(s.collision_shape) for s in old]])
+            centers = np.concatenate([centers, [s.mass_center.coords() for s in old]])
+
+        self.init_children()
+        target = np.full(len(idx), -1)
+        if self.looseness == 1:
+            for i in reversed(range(len(self.children))):  # the first fitting child wins, like in child_for
+                target[self.children[i].fits(boxes[idx])] = i
+        else:
+            bl, size = self.rectangle.bottom_left, self.rectangle.size() / SPLIT_CONST
+            ix = np.clip((centers[idx, 0] - bl.x) // size.x, 0, SPLIT_CONST - 1).astype(np.int64)
+            iy = np.clip((centers[idx, 1] - bl.y) // size.y, 0, SPLIT_CONST - 1).astype(np.int64)
+            for i, ch in enumerate(self.children):
+                target[(ix + iy * SPLIT_CONST == i) & ch.fits(boxes[idx])] = i
+
+        for i, ch in enumerate(self.children):
+            sub = idx[target == i]
+            if len(sub):
+                ch._load(sprites, boxes, centers, sub)
+        for i in idx[target == -1].tolist():
+            self.sprites.add(sprites[i])
+            sprites[i].node = self
+        self.clear_children()
+
     def get_sprites(self) -> set[Sprite]:
         ans = set()
         ans.update(self.sprites)
@@ -224,7 +580,8 @@ class QuadTree:
         return ans
     
     def get_collision_candidates(self, s: Sprite) -> set[Sprite]:
-        if not self.rectangle.has_intersect(s.collision_shape):
+        shape = s.collision_shape
+        if shape is None or not boxes_overlap(self.bounds.aabb(), shape.aabb()) or not self.bounds.has_intersect(shape):
             return set()
         res = set()
         res.update(self.sprites)
@@ -232,6 +589,21 @@ class QuadTree:
             res.update(ch.get_collision_candidates(s))
         return res
     
+    def get_sprites_in_box(self, xmin: float, ymin: float, xmax: float, ymax: float) -> list[Sprite]:
+        """
+        Returns sprites of all nodes, which bounds overlap the axis-aligned box
+        """
+        res: list[Sprite] = []
+        stack: list[QuadTree] = [self]
+        while stack:
+            q = stack.pop()
+            bl, tr = q.bounds.bottom_left, q.bounds.top_right
+            if xmax < bl.x or xmin > tr.x or ymax < bl.y or ymin > tr.y:
+                continue
+            res.extend(q.sprites)
+            stack.extend(q.iter_children())
+        return res
+
     def get_sprites_lazy(self) -> Generator[Sprite, None, None]:
         for s in self.sprites:
             yield s
@@ -246,4 +618,351 @@ class QuadTree:
             t = ch.get_quad_tree(s)
             if t is not None:
                 return t
-        return self
\ No newline at end of file
+        return self
+
+    def get_quad_tree_at(self, x: float, y: float) -> Optional['QuadTree']:
+        """
+        get_quad_tree for a point sprite at (x, y), without making the sprite
+        """
+        if not self.rectangle.has_intersect_point(x, y):
+            return None
+        q = self
+        while True:
+            for ch in q.iter_children():
+                if ch.rectangle.has_intersect_point(x, y):
+                    q = ch
+                    break
+            else: # if not break encountered
+                return q
+
+    def point_collides(self, x: float, y: float) -> bool:
+        """
+        Returns True if point (x, y) collides with any sprite in the tree.
+        Doesn't allocate sprites, figures or points.
+        """
+        stack: list[QuadTree] = [self]
+        while stack:
+            q = stack.pop()
+            bl, tr = q.bounds.bottom_left, q.bounds.top_right
+            if x < bl.x - EPS or x > tr.x + EPS or y < bl.y - EPS or y > tr.y + EPS:
+                continue
+            for s in q.sprites:
+                if s.collision_shape.has_intersect_point(x, y):
+                    return True
+            stack.extend(q.iter_children())
+        return False
+
+    def segment_span(self, x1: float, y1: float, x2: float, y2: float) -> Optional[tuple[float, float]]:
+        """
+        Returns the interval [t0, t1] of parameters t in [0, 1],
+        for which (x1, y1) + t * (x2 - x1, y2 - y1) lies inside the bounds, or None.
+        """
+        bl, tr = self.bounds.bottom_left, self.bounds.top_right
+        t0, t1 = 0.0, 1.0
+        dx, dy = x2 - x1, y2 - y1
+        if abs(dx) < EPS ** 2:
+            if x1 < bl.x - EPS or x1 > tr.x + EPS:
+                return None
+        else:
+            a, b = (bl.x - EPS - x1) / dx, (tr.x + EPS - x1) / dx
+            t0, t1 = max(t0, min(a, b)), min(t1, max(a, b))
+        if abs(dy) < EPS ** 2:
+            if y1 < bl.y - EPS or y1 > tr.y + EPS:
+                return None
+        else:
+            a, b = (bl.y - EPS - y1) / dy, (tr.y + EPS - y1) / dy
+            t0, t1 = max(t0, min(a, b)), min(t1, max(a, b))
+        return (t0, t1) if t0 <= t1 else None
+
+    def raycast(self, x1: float, y1: float, x2: float, y2: float, nearest: bool = True) -> Optional[tuple[float, Sprite]]:
+        """
+        Traverses only the nodes the segment (x1, y1) -> (x2, y2) passes through, nearest first.
+        Returns (distance from (x1, y1), sprite) of the obstacle hit, or None if the segment is clear.
+        If nearest, returns the closest hit, otherwise stops at the first confirmed one.
+        Doesn't allocate sprites, figures or points.
+        """
+        span = self.segment_span(x1, y1, x2, y2)
+        if span is None:
+            return None
+        hit = self._raycast(x1, y1, x2, y2, nearest, None)
+        if hit is None:
+            return None
+        return hit[0] * sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2), hit[1]
+
+    def _raycast(self, x1: float, y1: float, x2: float, y2: float, nearest: bool,
+                 best: Optional[tuple[float, Sprite]]) -> Optional[tuple[float, Sprite]]:
+        for s in self.sprites:
+            shape = s.collision_shape
+            if shape.has_intersect_segment(x1, y1, x2, y2):
+                t = shape.segment_entry(x1, y1, x2, y2)
+                if not nearest:
+                    return t, s
+                if best is None or t < best[0]:
+                    best = (t, s)
+
+        spans = []
+        for ch in self.iter_children():
+            span = ch.segment_span(x1, y1, x2, y2)
+            if span is not None:
+                spans.append((span[0], ch))
+        spans.sort(key=lambda sp: sp[0])
+
+        for t0, ch in spans:
+            if best is not None and t0 >= best[0]:
+                break
+            best = ch._raycast(x1, y1, x2, y2, nearest, best)
+            if best is not None and not nearest:
+                return best
+        return best
+
+    def segment_collides(self, x1: float, y1: float, x2: float, y2: float) -> bool:
+        """
+        Returns True if segment (x1, y1) -> (x2, y2) collides with any sprite in the tree.
+        Stops at the first obstacle hit.
+        """
+        return self.raycast(x1, y1, x2, y2, nearest=False) is not None
+
+if __name__ == '__main__':
+    from time import perf_counter
+    from random import random, seed
+
+    from backend.sprites import make_sprite
+    from backend.scene_generators import SpriteGenerator
+
+    def count_allocations(classes: list[type]) -> dict[type, int]:
+        """
+        Wraps __init__ of the classes to count created instances
+        """
+        counter = {cls: 0 for cls in classes}
+        for cls in classes:
+            def counted_init(self, *args, __cls=cls, __init=cls.__init__, **kwargs):
+                if type(self) is __cls:
+                    counter[__cls] += 1
+                __init(self, *args, **kwargs)
+            cls.__init__ = counted_init
+        return counter
+
+    def old_check_collisions(qtree: QuadTree, p: Point | Line) -> bool:
+        ts = make_sprite(p)
+        for s in qtree.get_collision_candidates(ts):
+            if ts.collision_shape.has_intersect(s.collision_shape):
+                return True
+        return False
+
+    test_n = 8
+    if test_n == 0:
+        # allocations and time per line-of-sight query: Sprite-wrapping path vs raw coordinates
+        seed(0)
+        field = Rectangle(Point(0, 0), Point(15, 10))
+        qtree = QuadTree(Rectangle(Point(-5, -5), Point(20, 20)))
+        qtree.add_sprites(SpriteGenerator(field, avg_size=2).generate_sprites(30))
+
+        N = 2000
+        segments = [(random() * 15, random() * 10, random() * 15, random() * 10) for _ in range(N)]
+        lines = [Line(Point(x1, y1), Point(x2, y2)) for x1, y1, x2, y2 in segments]
+
+        counter = count_allocations([Point, Line, Sprite])
+        ts = perf_counter()
+        old = [old_check_collisions(qtree, l) for l in lines]
+        old_time = perf_counter() - ts
+        old_counts = dict(counter)
+
+        counter.update({cls: 0 for cls in counter})
+        ts = perf_counter()
+        new = [qtree.segment_collides(*seg) for seg in segments]
+        new_time = perf_counter() - ts
+        new_counts = dict(counter)
+
+        assert old == new
+        print(f'{N} segment queries, {sum(new)} blocked')
+        for name, counts, t in (('make_sprite + get_collision_candidates', old_counts, old_time),
+                                ('QuadTree.segment_collides', new_counts, new_time)):
+            allocs = ', '.join(f'{cls.__name__}: {c / N:.1f}' for cls, c in counts.items())
+            print(f'{name:>40}: {t / N * 1e6:8.1f} us/query, allocations per query: {allocs}')
+    elif test_n == 1:
+        # physics tick cost: full optimize_tree vs relocation of moved sprites only
+        from backend.geometry import Circle
+
+        field = Rectangle(Point(0, 0), Point(15, 15))
+        ticks = 100
+        for n_static in (100, 400, 1600):
+            times = []
+            for relocate in (False, True):
+                seed(0)
+                qtree = QuadTree(Rectangle(Point(-5, -5), Point(20, 20)))
+                qtree.add_sprites(SpriteGenerator(field, avg_size=0.5).generate_sprites(n_static))
+                circles = [Circle(random() * 15, random() * 15, 0.3) for _ in range(10)]
+                movers = [Sprite(c, c.copy(), static=False) for c in circles]
+                qtree.add_sprites(movers)
+
+                ts = perf_counter()
+                for _ in range(ticks):
+                    for s in movers:
+                        s.movement = Point(random() * 0.2 - 0.1, random() * 0.2 - 0.1)
+                        s.update(0.005)
+                    if relocate:
+                        qtree.relocate_dirty()
+                    else:
+                        qtree.optimize_tree()
+                times.append((perf_counter() - ts) / ticks)
+            print(f'{n_static:5} static sprites, 10 moving: optimize_tree {times[0] * 1e3:7.3f} ms/tick, relocate_dirty {times[1] * 1e3:7.3f} ms/tick')
+    elif test_n == 2:
+        # regular vs loose tree: sprites per depth, collision candidates and query times
+        field = Rectangle(Point(0, 0), Point(15, 15))
+        for n_sprites in (50, 200, 800):
+            seed(0)
+            sprites = SpriteGenerator(field, avg_size=1).generate_sprites(n_sprites)
+            segments = [(random() * 15, random() * 15, random() * 15, random() * 15) for _ in range(1000)]
+            print(f'{n_sprites} sprites:')
+            for looseness in (1.0, 1.5, 2.0):
+                qtree = QuadTree(Rectangle(Point(-5, -5), Point(20, 20)), looseness=looseness)
+                qtree.add_sprites(sprites)
+                depth = sum(len(q.sprites) * len(list(q.recursive_parents())) for q in qtree.dfs())
+
+                ts = perf_counter()
+                candidates = sum(len(qtree.get_collision_candidates(s)) for s in sprites)
+                cand_time = perf_counter() - ts
+                ts = perf_counter()
+                blocked = sum(qtree.segment_collides(*seg) for seg in segments)
+                seg_time = perf_counter() - ts
+                print(f'    looseness {looseness}: mean sprite depth {depth / n_sprites:4.1f}, '
+                      f'{candidates / n_sprites:6.1f} candidates per sprite ({cand_time / n_sprites * 1e6:7.1f} us), '
+                      f'segment_collides {seg_time / len(segments) * 1e6:6.1f} us ({blocked} blocked)')
+    elif test_n == 3:
+        # subdivision limits: tree shape and navigation graph size on a map of small sprites
+        from .buildgraph import build_graph_on_quadtree, VertMode
+
+        seed(0)
+        sprites = SpriteGenerator(Rectangle(Point(0, 0), Point(15, 15)), avg_size=0.3).generate_sprites(300)
+        for settings in ({}, {'max_depth': 5}, {'min_size': 1.0}, {'capacity': 4}, {'max_depth': 6, 'capacity': 4}):
+            qtree = QuadTree(Rectangle(Point(-5, -5), Point(20, 20)), **settings)
+            qtree.add_sprites(sprites)
+            stats = qtree.stats()
+            ts = perf_counter()
+            G = build_graph_on_quadtree(qtree, mode=VertMode.ALL)
+            print(f'{str(settings):>32}: {stats["nodes"]:4} nodes, {stats["leaves"]:4} leaves, depth {stats["depth"]:2}, '
+                  f'graph of {len(G.vertexes):5} vertexes in {perf_counter() - ts:5.2f}s')
+            print(f'{"":>34}nodes per depth {stats["depths"]}')
+            print(f'{"":>34}leaves per size {stats["leaf_sizes"]}')
+    elif test_n == 4:
+        # loading a scene: sequential add_sprites of single sprites vs bulk load
+        for n_sprites in (1000, 5000, 20000):
+            seed(0)
+            size = n_sprites ** 0.5
+            sprites = SpriteGenerator(Rectangle(Point(0, 0), Point(size, size)), avg_size=0.5, method='random').generate_sprites(n_sprites)
+            side = 2 ** int(size + 2).bit_length()  # children stay exactly square
+            rect = Rectangle(Point(-1, -1), Point(side - 1, side - 1))
+
+            ts = perf_counter()
+            qtree = QuadTree(rect)
+            for s in sprites:
+                qtree.add_sprites([s])
+            seq_time = perf_counter() - ts
+
+            ts = perf_counter()
+            bulk = QuadTree.from_sprites(rect, sprites)
+            bulk_time = perf_counter() - ts
+
+            assert qtree.stats() == bulk.stats()
+            print(f'{n_sprites:6} sprites, {qtree.stats()["nodes"]:6} nodes: sequential {seq_time:6.2f}s, bulk {bulk_time:6.2f}s')
+    elif test_n == 5:
+        # broad phase: collision candidates and collisions with and without bounding box rejection
+        seed(0)
+        sprites = SpriteGenerator(Rectangle(Point(0, 0), Point(15, 15)), avg_size=1).generate_sprites(300)
+        qtree = QuadTree.from_sprites(Rectangle(Point(-5, -5), Point(20, 20)), sprites)
+
+        results = []
+        aabb = Figure.aabb
+        for use_aabb in (False, True):
+            Figure.aabb = aabb if use_aabb else lambda self: None  # None boxes are never rejected
+            ts = perf_counter()
+            candidates = [qtree.get_collision_candidates(s) for s in sprites]
+            cand_time = perf_counter() - ts
+            ts = perf_counter()
+            collisions = [s.check_collisions(c) for s, c in zip(sprites, candidates)]
+            check_time = perf_counter() - ts
+            results.append((candidates, [[list(c)[i] for i in idx] for c, idx in zip(candidates, collisions)]))
+            print(f'bounding boxes {"on" if use_aabb else "off"}: get_collision_candidates {cand_time / len(sprites) * 1e6:7.1f} us, '
+                  f'check_collisions {check_time / len(sprites) * 1e6:7.1f} us per sprite')
+        Figure.aabb = aabb
+        assert results[0] == results[1]
+    elif test_n == 6:
+        # line-of-sight queries with and without cached edges of obstacles
+        seed(0)
+        sprites = SpriteGenerator(Rectangle(Point(0, 0), Point(15, 15)), avg_size=1).generate_sprites(300)
+        qtree = QuadTree.from_sprites(Rectangle(Point(-5, -5), Point(20, 20)), sprites)
+        N = 20000
+        segments = [(random() * 15, random() * 15, random() * 15, random() * 15) for _ in range(N)]
+
+        results = []
+        cached = Figure.cached
+        for use_cache in (False, True):
+            Figure.cached = cached if use_cache else lambda self, key, compute: compute()
+            ts = perf_counter()
+            results.append([qtree.segment_collides(*seg) for seg in segments])
+            print(f'derived geometry cache {"on" if use_cache else "off"}: {(perf_counter() - ts) / N * 1e6:6.1f} us/query')
+        Figure.cached = cached
+        assert results[0] == results[1]
+    elif test_n == 7:
+        # convex footprints as single polygons vs fans of triangles
+        from backend.geometry import ConvexPolygon, Triangle
+        from backend.pathfinding.visibility import check_collisions_batch
+        seed(0)
+        polygons = [SpriteGenerator(Rectangle(Point(0, 0), Point(15, 15)), avg_size=1).gen_polygon(Point(random() * 15, random() * 15), 1, n=8)
+                    for _ in range(200)]
+        fans = [Triangle(p.vertices[0], a, b) for p in polygons for a, b in zip(p.vertices[1:], p.vertices[2:])]
+        N = 20000
+        segments = [(random() * 15, random() * 15, random() * 15, random() * 15) for _ in range(N)]
+        x1, y1, x2, y2 = (np.array(c) for c in zip(*segments))
+
+        results = []
+        for name, figures in (('triangle fans', fans), ('convex polygons', polygons)):
+            qtree = QuadTree.from_sprites(Rectangle(Point(-5, -5), Point(20, 20)), [make_sprite(f) for f in figures])
+            ts = perf_counter()
+            results.append([qtree.segment_collides(*seg) for seg in segments])
+            scalar_time = perf_counter() - ts
+            ts = perf_counter()
+            assert check_collisions_batch(qtree, x1, y1, x2, y2).tolist() == results[-1]
+            batch_time = perf_counter() - ts
+            print(f'{name:>16}: {len(figures):5} sprites, {qtree.stats()["nodes"]:5} nodes, '
+                  f'segment_collides {scalar_time / N * 1e6:6.1f} us/query, batch {batch_time / N * 1e6:5.1f} us/query')
+        print('blocked segments differ:', sum(a != b for a, b in zip(*results)))
+    elif test_n == 8:
+        # change journal: what changed in a region since a version, against the tree before and after
+        from backend.geometry import Circle
+
+        seed(0)
+        field = Rectangle(Point(0, 0), Point(15, 15))
+        qtree = QuadTree(Rectangle(Point(-5, -5), Point(20, 20)), journal_size=256)
+        sprites = SpriteGenerator(field, avg_size=0.5).generate_sprites(210)
+        qtree.add_sprites(sprites[:200])
+        extra = sprites[200:]
+        movers = [Sprite(c, c.copy(), static=False) for c in (Circle(random() * 15, random() * 15, 0.3) for _ in range(10))]
+        qtree.add_sprites(movers)
+
+        for tick in range(50):
+            version = qtree.version
+            boxes = {s: sprite_box(s) for s in qtree.get_sprites()}
+            nodes = {id(q): q.version for q in qtree.dfs()}
+            for s in movers:
+                s.movement = Point(random() * 0.2 - 0.1, random() * 0.2 - 0.1)
+                s.update(0.005)
+            qtree.relocate_dirty()
+            if tick % 5 == 0:
+                s = next(iter(qtree.get_sprites() - set(movers)))
+                qtree.remove_sprite(s)
+                qtree.add_sprites([extra.pop()])
+
+            region = (random() * 15, random() * 15, random() * 15 + 2, random() * 15 + 2)
+            after = {s: sprite_box(s) for s in qtree.get_sprites()}
+            expected = {s for s in set(boxes) | set(after) if boxes.get(s) != after.get(s)
+                        and any(b is not None and b[0] <= region[2] and region[0] <= b[2] and b[1] <= region[3] and region[1] <= b[3]
+                                for b in (boxes.get(s), after.get(s)))}
+            changes = qtree.changes_since(version, region)
+            assert {c.sprite for c in changes} == expected
+            # nodes, which versions didn't change, kept their sprites
+            for q in qtree.dfs():
+                if id(q) in nodes and q.version == nodes[id(q)]:
+                    assert all(boxes.get(s) == after[s] for s in q.sprites)
+        print(f'version {qtree.version}, {len(qtree.journal)} changes in the journal, older than {qtree.forgotten} forgotten')
+        assert qtree.changes_since(0) is None
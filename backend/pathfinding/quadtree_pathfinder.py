@@ -1,29 +1,47 @@
+import numpy as np
 from time import time
 from typing import Optional
+from math import atan2
+from bisect import bisect
 
 from .graph import Graph
-from .quadtree import QuadTree
+from .quadtree import QuadTree, Box
 from .buildgraph import build_graph_on_quadtree, check_collisions, build_vertexes_from_rect
 from .buildgraph import Waypoint as Vertex
+from .visibility import check_collisions_batch
+from .overlay import GraphOverlay
+from .navcache import build_graph_cached
+from .repair import repair_graph, change_box, rect_box
 
 from .pathfinder import Dijkstra, Floyd, Pathfinder
 from .astar_pathfinder import AStar
 from .thetastar_pathfinder import ThetaStar
 
-from backend.geometry import Point, Line
-from backend.sprites import make_sprite
-from .graph import GraphEdge as Edge
+from backend.geometry import Point, Line, Circle, EPS
+from backend.sprites import Sprite
 from .buildgraph import VertMode
+from .tangents import CircleMode, inflate, ring_order, ring_radius, free_arcs, polyline_length, expand_arcs
+
+# share of the field, which changed boxes may cover before the graph is built anew instead of repaired
+REBUILD_SHARE = 0.25
 
 class QuadPathfinder:
     def __init__(self, quadtree: QuadTree, algorithm: str = 'dijkstra',
-                 graph: Optional[Graph] = None, vertex_dict: Optional[dict[QuadTree, list[Vertex]]] = None):
+                 graph: Optional[Graph] = None, vertex_dict: Optional[dict[QuadTree, list[Vertex]]] = None,
+                 circle_mode: CircleMode = CircleMode.POLYGON, mode: VertMode = VertMode.ALL,
+                 table: Optional[str] = None, cache_dir: Optional[str] = None):
         """_summary_
 
         Args:
             quadtree (QuadTree): _description_
             algorithm (str, optional): _description_. Defaults to 'dijkstra'.
             graph, vertex_dict: if given, will skip build_graph_on_quadte
+            circle_mode (CircleMode, optional): how the graph goes around circles, see build_graph_on_quadtree.
+                With CircleMode.TANGENT start and goal are also connected to circles by tangents.
+            mode (VertMode, optional): waypoints of the graph, see build_graph_on_quadtree. Defaults to VertMode.ALL.
+                With VertMode.REDUCED start and goal are connected to all visible vertices, not only to their quad.
+            table (str, optional): file of Floyd tables, see Floyd.
+            cache_dir (str, optional): directory of built graphs, see navcache.build_graph_cached.
         
         algorhitm:
             'dijkstra' - Dijkstra's algorithm
@@ -35,23 +53,95 @@ class QuadPathfinder:
         self.quadtree = quadtree
         self.vertex_dict: dict[QuadTree, list[Vertex]]
 
-        if not graph or not vertex_dict:
+        if (not graph or not vertex_dict) and cache_dir is not None:
+            graph, vertex_dict = build_graph_cached(quadtree, cache_dir, mode=mode, circle_mode=circle_mode)
+        elif not graph or not vertex_dict:
             ts = time()
-            graph, vertex_dict = build_graph_on_quadtree(quadtree, mode=VertMode.ALL, return_vertex_dict=True)
+            graph, vertex_dict = build_graph_on_quadtree(quadtree, mode=mode, return_vertex_dict=True, circle_mode=circle_mode)
             print(f'Building quadtree graph of {len(graph.vertexes)} vertices took {time() - ts: .2f}s')
         self.vertex_dict = vertex_dict
+        self.mode = mode
+
+        self.circle_mode = circle_mode
+        # inflated circle obstacle -> its waypoints counterclockwise
+        self.rings: list[tuple[Circle, list[Vertex]]] = self.find_rings(graph)
+
+        self.algorithm = algorithm
+        self.table = table
+        self.graph: Pathfinder = self.make_pathfinder(graph)
+        # version of the quadtree the graph was built or repaired for
+        self.version = quadtree.version
+
+    def find_rings(self, graph: Graph) -> list[tuple[Circle, list[Vertex]]]:
+        rings = []
+        if self.circle_mode is CircleMode.TANGENT:
+            circles = [inflate(s.collision_shape) for s in self.quadtree.get_sprites() if isinstance(s.collision_shape, Circle)]
+            for c in circles:
+                # merged points of the ring lie a bit further, see merge_ring_points
+                ring = [v for v in graph.vertexes if c.radius - EPS < abs(v.coords - c.center) < ring_radius(c) + EPS]
+                rings.append((c, ring_order(c, ring)))
+        return rings
+
+    def make_pathfinder(self, graph: Graph) -> Pathfinder:
+        if self.algorithm == 'dijkstra':
+            return Dijkstra(graph)
+        elif self.algorithm == 'floyd':
+            return Floyd(graph, table=self.table)
+        elif self.algorithm == 'A*':
+            return AStar(graph)
+        elif self.algorithm == 'Theta*':
+            return ThetaStar(graph, self.quadtree)
+        raise ValueError(f"Unknown algorithm: {self.algorithm}\nAvailable algorithms are ['dijkstra', 'floyd', 'A*', 'Theta*']")
+
+    def add_obstacle(self, s: Sprite):
+        """
+        Adds the sprite to the quadtree and repairs the graph around it
+        """
+        self.quadtree.add_sprites([s])
+        self.update()
+
+    def remove_obstacle(self, s: Sprite):
+        """
+        Removes the sprite from the quadtree and repairs the graph around it
+        """
+        self.quadtree.remove_sprite(s)
+        self.update()
+
+    def update(self):
+        """
+        Repairs the graph around static obstacles inserted, removed or moved in the quadtree since the last update,
+        builds it anew if the journal of the quadtree doesn't reach back that far.
+        Moving sprites (agents) don't change the graph.
+        """
+        changes = self.quadtree.changes_since(self.version)
+        self.version = self.quadtree.version
+        if changes is None:
+            self.rebuild()
+            return
+        boxes = [change_box(b) for c in changes if c.sprite.static for b in (c.old, c.new) if b is not None]
+        if boxes:
+            self.repair(boxes)
+
+    def rebuild(self):
+        graph, self.vertex_dict = build_graph_on_quadtree(self.quadtree, mode=self.mode, return_vertex_dict=True,
+                                                          circle_mode=self.circle_mode)
+        self.rings = self.find_rings(graph)
+        self.graph = self.make_pathfinder(graph)
 
-        self.graph: Pathfinder
-        if algorithm == 'dijkstra':
-            self.graph = Dijkstra(graph)
-        elif algorithm == 'floyd':
-            self.graph = Floyd(graph)
-        elif algorithm == 'A*':
-            self.graph = AStar(graph)
-        elif algorithm == 'Theta*':
-            self.graph = ThetaStar(graph, self.quadtree)
-        else:
-            raise ValueError(f"Unknown algorithm: {algorithm}\nAvailable algorithms are ['dijkstra', 'floyd', 'A*', 'Theta*']")
+    def repair(self, boxes: list[Box]):
+        """
+        Updates the graph after obstacles within boxes changed, see repair_graph
+        """
+        field = rect_box(self.quadtree)
+        area = sum(max(0.0, min(b[2], field[2]) - max(b[0], field[0])) * max(0.0, min(b[3], field[3]) - max(b[1], field[1]))
+                   for b in boxes)
+        if (self.mode is VertMode.REDUCED or self.circle_mode is CircleMode.TANGENT
+                or area > REBUILD_SHARE * (field[2] - field[0]) * (field[3] - field[1])):
+            # bitangents and tangents join obstacles far apart, so these graphs are built anew, as well as mostly changed ones
+            self.rebuild()
+            return
+        repair_graph(self.quadtree, self.graph.graph, self.vertex_dict, boxes, mode=self.mode)
+        self.graph.preprocess_paths()
     
     def find_path_length(self, path: list[Vertex], start_v: Vertex, goal_v: Vertex) -> float:
         """
@@ -68,6 +158,65 @@ class QuadPathfinder:
         path_len += start_v.coords.distance_to(path[0].coords)
         return path_len
 
+    def visible_vertices(self, p: Point) -> list[Vertex]:
+        """
+        Returns vertices of the quad containing p and its subquads, which are visible from p
+        """
+        if self.mode is VertMode.REDUCED:
+            # the reduced graph has no waypoints in free space, so quads may have no vertices at all
+            vs = list(self.graph.graph.vertexes)
+            collides = check_collisions_batch(self.quadtree, np.full(len(vs), p.x), np.full(len(vs), p.y),
+                                              np.array([v.coords.x for v in vs]), np.array([v.coords.y for v in vs]))
+            return [v for v, c in zip(vs, collides.tolist()) if not c]
+        quad = self.quadtree.get_quad_tree_at(p.x, p.y)
+        return [v for q in quad.dfs() for v in self.vertex_dict[q]
+                if not self.quadtree.segment_collides(p.x, p.y, v.coords.x, v.coords.y)]
+
+    def add_tangents(self, overlay: GraphOverlay, p_v: Vertex, rings: list[list[Vertex]]) -> list[Vertex]:
+        """
+        Connects p_v to the circles by tangents and the touching points to the rings of circles by arcs,
+        all of them virtual in the overlay. rings are the ones of self.rings with the touching points of the query,
+        new touching points are put into them. Returns the touching points.
+        """
+        p = p_v.coords
+        touching: list[Vertex] = []
+        for (c, _), ring in zip(self.rings, rings):
+            for t in c.tangent_points(p.x, p.y):
+                if check_collisions(self.quadtree, t) or self.quadtree.segment_collides(p.x, p.y, t.x, t.y):
+                    continue
+                t_v = overlay.find_vertex(Vertex(t))
+                if t_v is None:
+                    t_v = overlay.add_vertex(Vertex(t))
+                    if ring:
+                        # t is put between its neighbors on the ring
+                        angles = [atan2(v.coords.y - c.center.y, v.coords.x - c.center.x) for v in ring]
+                        i = bisect(angles, atan2(t.y - c.center.y, t.x - c.center.x))
+                        prev_v, next_v = ring[i - 1], ring[i % len(ring)]
+                        arcs = free_arcs(self.quadtree, c, [(prev_v.coords, t), (t, next_v.coords)])
+                        for (v1, v2), arc in zip(((prev_v, t_v), (t_v, next_v)), arcs):
+                            if arc is not None and v1 is not v2 and not overlay.has_edge(v1, v2):
+                                overlay.add_edge(v1, v2, polyline_length(arc))
+                                overlay.arcs[(v1, v2)] = arc[1:-1]
+                                overlay.arcs[(v2, v1)] = arc[-2:0:-1]
+                        ring.insert(i, t_v)
+                    else:
+                        ring.append(t_v)
+                if (overlay.is_virtual(t_v) or overlay.is_virtual(p_v)) and t_v is not p_v and not overlay.has_edge(t_v, p_v):
+                    overlay.add_edge(p_v, t_v, abs(t - p))
+                touching.append(t_v)
+        return touching
+
+    def join_visible(self, overlay: GraphOverlay, p_v: Vertex, vertices: list[Vertex]):
+        """
+        Joins p_v to the vertices visible from it by virtual edges
+        """
+        p = p_v.coords
+        for v in vertices:
+            if v is p_v or overlay.has_edge(p_v, v) or not (overlay.is_virtual(p_v) or overlay.is_virtual(v)):
+                continue
+            if not self.quadtree.segment_collides(p.x, p.y, v.coords.x, v.coords.y):
+                overlay.add_edge(p_v, v, abs(v.coords - p))
+
     def find_path(self, start: Point, goal: Point) -> list[Point]:
         # Implement the pathfinding logic using the quadtree
         
@@ -75,21 +224,14 @@ class QuadPathfinder:
             #print('start or goal inside an obstacle')
             return [] # either start or goal is inside an obstacle
 
-        start_quad = self.quadtree.get_quad_tree(make_sprite(start))
-        start_vertices: list[Vertex] = []
-        for q in start_quad.dfs():
-            for v in self.vertex_dict[q]:
-                if not check_collisions(self.quadtree, Line(start, v.coords)):
-                    start_vertices.append(v)
-
-        end_quad = self.quadtree.get_quad_tree(make_sprite(goal))
-        end_vertices: list[Vertex] = []
-        for q in end_quad.dfs():
-            for v in self.vertex_dict[q]:
-                if not check_collisions(self.quadtree, Line(goal, v.coords)):
-                    end_vertices.append(v)
+        start_vertices = self.visible_vertices(start)
+        end_vertices = self.visible_vertices(goal)
+        # the reduced graph has no waypoints in free space to get from start to goal otherwise,
+        # and tangent points aren't joined to waypoints of quads, so going through them may be a detour
+        direct = (self.mode is VertMode.REDUCED or self.circle_mode is CircleMode.TANGENT) \
+            and not self.quadtree.segment_collides(start.x, start.y, goal.x, goal.y)
         
-        if not start_vertices or not end_vertices:
+        if (not start_vertices or not end_vertices) and not direct and not self.rings:
             #print('no adjacent vertices found')
             return [] # no adjacent vertices to start or goal found
         
@@ -98,31 +240,33 @@ class QuadPathfinder:
         
         # print(f'approx is {len(start_vertices)}x{len(end_vertices)}={len(start_vertices) * len(end_vertices)}')
 
-        # temporarily adding the start and goal vertices to the graph
-        start_v = Vertex(start)
-        goal_v = Vertex(goal)
-        self.graph.graph.add_vertex(start_v)
-        self.graph.graph.add_vertex(goal_v)
+        # start and goal are seen only by this query, the graph and preprocessed paths stay as they are
+        overlay = GraphOverlay(self.graph.graph)
+        start_v = overlay.add_vertex(Vertex(start))
+        goal_v = overlay.add_vertex(Vertex(goal))
 
         for sv in start_vertices:
-            self.graph.graph.add_edge(Edge(start_v, sv, start_v.coords.distance_to(sv.coords)))
+            if overlay.is_virtual(start_v) and not overlay.has_edge(start_v, sv):
+                overlay.add_edge(start_v, sv, start_v.coords.distance_to(sv.coords))
         for ev in end_vertices:
-            self.graph.graph.add_edge(Edge(ev, goal_v, goal_v.coords.distance_to(ev.coords)))
-        
-        self.graph.update_shortest_paths(start_v)
-        self.graph.update_shortest_paths(goal_v)
+            if overlay.is_virtual(goal_v) and not overlay.has_edge(ev, goal_v):
+                overlay.add_edge(ev, goal_v, goal_v.coords.distance_to(ev.coords))
+        if direct and start_v is not goal_v and (overlay.is_virtual(start_v) or overlay.is_virtual(goal_v)):
+            overlay.add_edge(start_v, goal_v, start_v.coords.distance_to(goal_v.coords))
+        # touching points of start and goal on the same circle are joined by arcs too
+        rings = [list(ring) for _, ring in self.rings]
+        start_tangents = self.add_tangents(overlay, start_v, rings)
+        goal_tangents = self.add_tangents(overlay, goal_v, rings)
+        # a tangent from start may lead to the goal directly and the other way round
+        self.join_visible(overlay, start_v, goal_tangents)
+        self.join_visible(overlay, goal_v, start_tangents)
 
-        shortest_path = self.graph.find_path(start_v, goal_v)
+        shortest_path = self.graph.find_path(start_v, goal_v, overlay)
         shortest_path_len = self.find_path_length(shortest_path, start_v, goal_v)
-
-        # removing the start and goal vertices from the graph
-        self.graph.graph.remove_vertex(start_v)
-        self.graph.graph.remove_vertex(goal_v)
-        # updating the shortest paths again
-        self.graph.preprocess_paths()
+        path = expand_arcs(shortest_path, overlay.arcs)
         
         print('shortest path length:', shortest_path_len)
         print("shortest path:", shortest_path)
-        return [vert.coords for vert in shortest_path]
+        return path
 
 # class QuadPathfinderFloyd(Floyd):
@@ -0,0 +1,280 @@
+import numpy as np
+from itertools import chain, combinations
+from math import cos, pi
+from typing import Iterable
+
+from .graph import Graph
+from .quadtree import QuadTree, Box
+from .buildgraph import build_vertexes_from_rect, check_collisions, Waypoint, VertMode
+from .visibility import check_collisions_batch
+
+from backend.algo import SpatialHash
+from backend.geometry import Figure, Point, EPS
+
+def obstacle_box(shape: Figure, quality: int = 20) -> Box:
+    """
+    Box around the shape and the waypoints build_graph_on_quadtree puts at its corners
+    """
+    xs, ys = zip(*((p.x, p.y) for p in shape.vertexes(quality=quality)))
+    box = shape.aabb() or (min(xs), min(ys), max(xs), max(ys))
+    return min(box[0], *xs), min(box[1], *ys), max(box[2], *xs), max(box[3], *ys)
+
+def expand(box: Box, margin: float = EPS) -> Box:
+    return box[0] - margin, box[1] - margin, box[2] + margin, box[3] + margin
+
+def change_box(box: Box, quality: int = 20) -> Box:
+    """
+    obstacle_box for a bounding box from QuadTree.journal, corners of circles lie slightly outside of their boxes
+    """
+    r = max(box[2] - box[0], box[3] - box[1]) / 2
+    return expand(box, r * (1 / cos(pi / max(quality, 3)) - 1))
+
+def rect_box(q: QuadTree) -> Box:
+    bl, tr = q.rectangle.bottom_left, q.rectangle.top_right
+    return bl.x, bl.y, tr.x, tr.y
+
+def boxes_touch(a: Box, b: Box) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def union_box(a: Box, b: Box) -> Box:
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+def hull_touches(points: list[tuple[float, float]], box: Box) -> bool:
+    """
+    Whether the convex hull of points touches the box, by separating axes along the box and all pairs of points
+    """
+    xs, ys = [x for x, _ in points], [y for _, y in points]
+    if max(xs) < box[0] or min(xs) > box[2] or max(ys) < box[1] or min(ys) > box[3]:
+        return False
+    corners = ((box[0], box[1]), (box[2], box[1]), (box[0], box[3]), (box[2], box[3]))
+    for (x1, y1), (x2, y2) in combinations(points, 2):
+        nx, ny = y1 - y2, x2 - x1
+        ps = [nx * x + ny * y for x, y in points]
+        bs = [nx * x + ny * y for x, y in corners]
+        if max(ps) < min(bs) or min(ps) > max(bs):
+            return False
+    return True
+
+def nodes_touching(qtree: QuadTree, boxes: list[Box]) -> list[QuadTree]:
+    """
+    Nodes of the tree, which rectangles touch any of the boxes, children are inside their parents
+    """
+    res: list[QuadTree] = []
+    stack = [qtree]
+    while stack:
+        q = stack.pop()
+        r = rect_box(q)
+        if any(boxes_touch(r, b) for b in boxes):
+            res.append(q)
+            stack.extend(q.iter_children())
+    return res
+
+def changed_nodes(qtree: QuadTree, vertex_dict: dict[QuadTree, list[Waypoint]], boxes: list[Box]) -> tuple[list[QuadTree], list[QuadTree]]:
+    """
+    Nodes the tree gained and lost since vertex_dict was built, when sprites within boxes were added or removed.
+    New nodes are met going down through the nodes touching boxes and through other new nodes
+    (overflowing leaves push their sprites to new children), lost ones are detached from their parents.
+    """
+    added: list[QuadTree] = []
+    stack = [qtree]
+    while stack:
+        q = stack.pop()
+        new = q not in vertex_dict
+        if new:
+            added.append(q)
+        if new or any(boxes_touch(rect_box(q), b) for b in boxes):
+            stack.extend(q.iter_children())
+    removed = [q for q in vertex_dict if q.parent is not None and all(ch is not q for ch in q.parent.children)]
+    return added, removed
+
+def repair_graph(qtree: QuadTree, graph: Graph, vertex_dict: dict[QuadTree, list[Waypoint]], boxes: list[Box],
+                 mode: VertMode = VertMode.CORNERS, quality: int = 20) -> tuple[Graph, dict[QuadTree, list[Waypoint]]]:
+    """
+    Updates graph and vertex_dict built by build_graph_on_quadtree (with circle_mode POLYGON, not VertMode.REDUCED)
+    after obstacles within boxes (see obstacle_box) were added to the tree or removed from it.
+    Waypoints are recomputed in the boxes and in the nodes the tree gained or lost,
+    edges are rechecked for waypoints, which changed, and for segments crossing the boxes.
+    Both are changed in place and returned.
+    """
+    boxes = [expand(b) for b in boxes]
+    added, removed = changed_nodes(qtree, vertex_dict, boxes)
+    # waypoints and corners of obstacles change only here
+    region = boxes + [expand(rect_box(q)) for q in chain(added, removed)]
+    def inside(x: float, y: float) -> bool:
+        return any(b[0] <= x <= b[2] and b[1] <= y <= b[3] for b in region)
+    def touches_region(b: Box) -> bool:
+        return any(boxes_touch(b, r) for r in region)
+
+    new_waypoints: SpatialHash[Waypoint] = SpatialHash(EPS)
+    def get_waypoint(p: Point) -> Waypoint:
+        wp = graph.find_vertex(Waypoint(p)) or new_waypoints.find(p.x, p.y)
+        if wp is None:
+            wp = Waypoint(p)
+            new_waypoints.add(p.x, p.y, wp)
+        return wp
+
+    # corners are shared by neighbouring nodes, each point is checked once
+    free: dict[tuple[float, float], bool] = dict()
+    def is_free(p: Point) -> bool:
+        if (p.x, p.y) not in free:
+            free[(p.x, p.y)] = not check_collisions(qtree, p)
+        return free[(p.x, p.y)]
+
+    dirty = nodes_touching(qtree, region)
+    new_lists: dict[QuadTree, list[Waypoint]] = dict()
+    for q in dirty:
+        wps = [v for v in vertex_dict.get(q, []) if not inside(v.coords.x, v.coords.y)]
+        for p in build_vertexes_from_rect(q.rectangle, mode=mode):
+            if inside(p.x, p.y) and is_free(p):
+                wps.append(get_waypoint(p))
+        new_lists[q] = wps
+    for s in chain.from_iterable(qtree.get_sprites_in_box(*b) for b in region):
+        if s.collision_shape is None:
+            continue
+        for p in s.collision_shape.vertexes(quality=quality):
+            if inside(p.x, p.y) and is_free(p):
+                new_lists[qtree.get_quad_tree_at(p.x, p.y)].append(get_waypoint(p))
+    for q, wps in new_lists.items():
+        # corners shared by obstacles or with the node come once
+        new_lists[q] = list({id(v): v for v in wps}.values())
+
+    # waypoints, which joined or left any node, get all their edges anew
+    changed: dict[int, Waypoint] = dict()
+    for q in chain(dirty, removed):
+        old = {id(v): v for v in vertex_dict.get(q, [])}
+        new = {id(v): v for v in new_lists.get(q, [])}
+        changed.update({i: v for i, v in chain(old.items(), new.items()) if (i in old) != (i in new)})
+    for q in removed:
+        del vertex_dict[q]
+    vertex_dict.update(new_lists)
+
+    present = set(id(v) for q in dirty for v in vertex_dict[q])
+    for v in changed.values():
+        if id(v) not in present:
+            if v in graph.vertexes and graph.find_vertex(v) is v:
+                graph.remove_vertex(v)
+        else:
+            for u in [e.other(v) for e in v.edges]:
+                v.remove_edge_to(u)
+                u.remove_edge_to(v)
+            if graph.find_vertex(v) is None:
+                graph.add_vertex(v)
+
+    # candidate pairs as in build_graph_on_quadtree, where one of the nodes is dirty,
+    # only pairs with changed waypoints or crossing the boxes may change
+    dirty_ids = set(map(id, dirty))
+    pairs: dict[tuple[int, int], tuple[Waypoint, Waypoint]] = dict()
+    arrays: dict[int, tuple[np.ndarray, np.ndarray, np.ndarray]] = dict()
+    def node_arrays(q: QuadTree) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if id(q) not in arrays:
+            wps = vertex_dict.get(q, [])
+            arrays[id(q)] = (np.array([v.coords.x for v in wps], dtype=np.float64),
+                             np.array([v.coords.y for v in wps], dtype=np.float64),
+                             np.array([id(v) in changed for v in wps], dtype=bool))
+        return arrays[id(q)]
+
+    def add_pairs(q: QuadTree, tqs: Iterable[QuadTree]):
+        x1, y1, c1 = node_arrays(q)
+        if not len(x1):
+            return
+        x1, y1, c1 = x1[:, None], y1[:, None], c1[:, None]
+        for tq in tqs:
+            x2, y2, c2 = node_arrays(tq)
+            if not len(x2):
+                continue
+            keep = c1 | c2
+            for box in boxes:
+                keep = keep | ((np.minimum(x1, x2) <= box[2]) & (np.maximum(x1, x2) >= box[0])
+                               & (np.minimum(y1, y2) <= box[3]) & (np.maximum(y1, y2) >= box[1]))
+            l1, l2 = vertex_dict[q], vertex_dict[tq]
+            for i, j in zip(*np.nonzero(keep)):
+                v1, v2 = l1[i], l2[j]
+                if v1 is v2:
+                    continue
+                key = (id(v1), id(v2)) if id(v1) < id(v2) else (id(v2), id(v1))
+                if key not in pairs:
+                    pairs[key] = (v1, v2)
+    adjacent: dict[int, list[QuadTree]] = dict()
+    def adjacent_to(q: QuadTree) -> list[QuadTree]:
+        # find_adjacent is neither symmetric nor only about touching nodes
+        if id(q) not in adjacent:
+            adjacent[id(q)] = list(q.find_adjacent(direction='all'))
+        return adjacent[id(q)]
+
+    for q in dirty:
+        add_pairs(q, chain([q], adjacent_to(q), q.recursive_parents()))
+    # and the other way round: t is related to its subtree, segments from its waypoints to clean nodes
+    # cross the boxes only from nodes behind them, unless the waypoints changed
+    for t in dirty:
+        if not vertex_dict.get(t):
+            continue
+        points = [(v.coords.x, v.coords.y) for v in vertex_dict[t]]
+        whole = any(id(v) in changed for v in vertex_dict[t])
+        stack = list(t.iter_children())
+        while stack:
+            q = stack.pop()
+            r = rect_box(q)
+            corners = [(r[0], r[1]), (r[2], r[1]), (r[0], r[3]), (r[2], r[3])]
+            if not whole and not any(hull_touches([p] + corners, b) for p in points for b in boxes):
+                continue
+            if id(q) not in dirty_ids:
+                add_pairs(q, [t])
+            stack.extend(q.iter_children())
+    # t is related to the nodes it is adjacent to, which may be apart, so segments between clean ones may cross the boxes too.
+    # Nodes adjacent to q or to its subtree, but outside of q, are adjacent to q itself,
+    # so subtrees are skipped if neither q nor its union with any adjacent node touches the region.
+    def reaches(q: QuadTree) -> bool:
+        r = rect_box(q)
+        return touches_region(r) or any(touches_region(union_box(r, rect_box(a))) for a in adjacent_to(q))
+    stack = [qtree]
+    while stack:
+        q = stack.pop()
+        if id(q) not in dirty_ids:
+            for a in adjacent_to(q):
+                if id(a) in dirty_ids or any(boxes_touch(b, union_box(rect_box(q), rect_box(a))) for b in boxes):
+                    add_pairs(q, [a])
+        stack.extend(ch for ch in q.iter_children() if reaches(ch))
+
+    candidates = list(pairs.values())
+    x1, y1, x2, y2 = (np.fromiter(c, dtype=np.float64, count=len(candidates)) for c in (
+        (v1.coords.x for v1, _ in candidates), (v1.coords.y for v1, _ in candidates),
+        (v2.coords.x for _, v2 in candidates), (v2.coords.y for _, v2 in candidates),
+    ))
+    collides = check_collisions_batch(qtree, x1, y1, x2, y2)
+    costs = np.hypot(x2 - x1, y2 - y1)
+    for (v1, v2), c, cost in zip(candidates, collides.tolist(), costs.tolist()):
+        if not c:
+            graph.add_edge(v1, v2, cost=cost)
+        elif v1.has_edge_to(v2):
+            v1.remove_edge_to(v2)
+            v2.remove_edge_to(v1)
+    return graph, vertex_dict
+
+if __name__ == '__main__':
+    from random import seed
+    from time import perf_counter
+    from backend.core import Core
+    from backend.geometry import Rectangle, Triangle, Circle
+    from backend.scene_generators import SpriteGenerator
+    from .buildgraph import build_graph_on_quadtree
+
+    test_n = 0
+    if test_n == 0:
+        # adding obstacles one by one: repairing the graph vs building it anew
+        seed(0)
+        back = Core()
+        generator = SpriteGenerator(Rectangle(Point(0, 0), Point(15, 10)), avg_size=2, types=[Triangle, Circle])
+        back.add_sprites(generator.generate_sprites(20))
+        graph, vertex_dict = build_graph_on_quadtree(back.quadtree, mode=VertMode.ALL, return_vertex_dict=True)
+        t_repair = t_full = 0.0
+        extra = generator.generate_sprites(10)
+        for s in extra:
+            ts = perf_counter()
+            back.quadtree.add_sprites([s])
+            repair_graph(back.quadtree, graph, vertex_dict, [obstacle_box(s.collision_shape)], mode=VertMode.ALL)
+            t_repair += perf_counter() - ts
+            ts = perf_counter()
+            full, _ = build_graph_on_quadtree(back.quadtree, mode=VertMode.ALL, return_vertex_dict=True)
+            t_full += perf_counter() - ts
+            assert len(full.vertexes) == len(graph.vertexes)
+        print(f'V={len(graph.vertexes)}: repair {t_repair / len(extra) * 1e3:.1f} ms, full build {t_full / len(extra) * 1e3:.1f} ms')
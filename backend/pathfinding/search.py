@@ -0,0 +1,239 @@
+from typing import Callable, Generic, Hashable, Iterable, Optional, TypeVar
+
+from .graph import Graph
+from .csr_graph import CSRGraph
+from .overlay import GraphOverlay
+
+from backend.algo import IndexedHeap
+
+V = TypeVar("V", bound=Hashable)
+
+def zero_heuristic(v, goal) -> float:
+    return 0.0
+
+class BestFirstSearch(Generic[V]):
+    """
+    Best-first search over a Graph or a CSRGraph, shared by Dijkstra, A* and Theta*.
+
+    Vertexes get integer ids on first sight, per-vertex state (cost, parent, closed flag) lives in lists indexed by them.
+    State is valid only if its stamp matches the generation of the current query,
+    so starting a new query is O(1) and a query costs time proportional to the vertexes it reaches.
+
+    heuristic(v, goal) estimates the remaining cost, zero gives Dijkstra.
+    relax(u, v, cost) returns (parent, cost from start) for reaching v from the closed vertex u by an edge of the given cost,
+    by default the parent is u; Theta* tries the parent of u instead.
+    A query may search a GraphOverlay of the graph instead, to see vertexes and edges added only for it.
+    """
+
+    def __init__(self, graph: Graph | CSRGraph,
+                 heuristic: Callable[[V, V], float] = zero_heuristic,
+                 relax: Optional[Callable[[V, V, float], tuple[V, float]]] = None):
+        self.graph = graph
+        self.heuristic = heuristic
+        self.relax = relax if relax is not None else self.relax_edge
+
+        # CSRGraph vertexes already are ids
+        self.dense = isinstance(graph, CSRGraph)
+        # python id of a vertex -> its id, Waypoints compare by coordinates, which isn't enough here
+        self.ids: dict[int, int] = dict()
+        self.vertex_of: list[V] = []
+
+        self.cost: list[float] = []
+        self.parent: list[int] = []
+        self.seen: list[int] = []    # generation in which cost and parent were set
+        self.closed: list[int] = []  # generation in which the vertex was closed
+        self.generation = 0
+        self.open_set: IndexedHeap[int] = IndexedHeap()
+
+    def reset(self):
+        """
+        Forgets state of all queries, ids of removed vertexes are dropped too
+        """
+        self.ids.clear()
+        self.vertex_of.clear()
+        for arr in (self.cost, self.parent, self.seen, self.closed):
+            arr.clear()
+
+    def id(self, v: V) -> int:
+        if self.dense:
+            if v >= len(self.seen):
+                self._grow(len(self.graph))
+            return v
+        i = self.ids.get(id(v))
+        if i is None:
+            i = len(self.vertex_of)
+            self.ids[id(v)] = i
+            self.vertex_of.append(v)
+            self._grow(i + 1)
+        return i
+
+    def vertex(self, i: int) -> V:
+        return i if self.dense else self.vertex_of[i]
+
+    def _grow(self, n: int):
+        extra = n - len(self.seen)
+        if extra > 0:
+            self.cost += [float('inf')] * extra
+            self.parent += [-1] * extra
+            self.seen += [0] * extra
+            self.closed += [0] * extra
+
+    def new_query(self):
+        if not self.dense and len(self.vertex_of) > 2 * len(self.graph.vertexes) + 64:
+            # temporary vertexes (like start and goal of QuadPathfinder) come and go, their ids pile up
+            self.reset()
+        self.generation += 1
+        self.open_set.clear()
+
+    def g(self, v: V) -> float:
+        """
+        Cost of the best known path from start to v in the last query
+        """
+        i = self.id(v)
+        return self.cost[i] if self.seen[i] == self.generation else float('inf')
+
+    def came_from(self, v: V) -> Optional[V]:
+        i = self.id(v)
+        return self.vertex(self.parent[i]) if self.seen[i] == self.generation else None
+
+    def relax_edge(self, u: V, v: V, cost: float) -> tuple[V, float]:
+        return u, self.g(u) + cost
+
+    def find_path(self, start: V, goal: V, graph: Optional[GraphOverlay] = None) -> list[V]:
+        """
+        Returns the path from start to goal as a list of vertexes, empty if goal is unreachable
+        """
+        neighbors = (graph if graph is not None else self.graph).neighbors
+        self.new_query()
+        gen, cost, parent, seen, closed = self.generation, self.cost, self.parent, self.seen, self.closed
+        s, t = self.id(start), self.id(goal)
+        cost[s], parent[s], seen[s] = 0.0, s, gen
+        self.open_set.insert(s, self.heuristic(start, goal))
+
+        while self.open_set:
+            i = self.open_set.extract_minimum()
+            if i == t:
+                return self.path(t)
+            closed[i] = gen
+            u = self.vertex(i)
+            for v, edge_cost in neighbors(u):
+                j = self.id(v)
+                if closed[j] == gen:
+                    continue
+                p, g = self.relax(u, v, edge_cost)
+                if seen[j] != gen or g < cost[j]:
+                    cost[j], parent[j], seen[j] = g, self.id(p), gen
+                    self.open_set.insert(j, g + self.heuristic(v, goal))
+        return []
+
+    def shortest_paths(self, start: V, targets: Optional[Iterable[V]] = None, radius: float = float('inf'),
+                       graph: Optional[GraphOverlay] = None) -> tuple[dict[V, float], dict[V, V]]:
+        """
+        Settles vertexes in order of their cost from start, ignoring the heuristic, until all targets are settled
+        or the cost exceeds radius. Without targets and radius the whole component of start is settled.
+        Returns costs and predecessors of the settled vertexes, the predecessor of start is start itself.
+        """
+        neighbors = (graph if graph is not None else self.graph).neighbors
+        self.new_query()
+        gen, cost, parent, seen, closed = self.generation, self.cost, self.parent, self.seen, self.closed
+        s = self.id(start)
+        cost[s], parent[s], seen[s] = 0.0, s, gen
+        self.open_set.insert(s, 0.0)
+        remaining = {self.id(v) for v in targets} if targets is not None else None
+
+        dist: dict[V, float] = dict()
+        pred: dict[V, V] = dict()
+        while self.open_set:
+            i, d = self.open_set.extract_minimum_with_priority()
+            if d > radius:
+                break
+            closed[i] = gen
+            u = self.vertex(i)
+            dist[u], pred[u] = d, self.vertex(parent[i])
+            if remaining is not None:
+                remaining.discard(i)
+                if not remaining:
+                    break
+            for v, edge_cost in neighbors(u):
+                j = self.id(v)
+                if closed[j] == gen:
+                    continue
+                p, g = self.relax(u, v, edge_cost)
+                if seen[j] != gen or g < cost[j]:
+                    cost[j], parent[j], seen[j] = g, self.id(p), gen
+                    self.open_set.insert(j, g)
+        return dist, pred
+
+    def path(self, t: int) -> list[V]:
+        path = [self.vertex(t)]
+        while self.parent[t] != t:
+            t = self.parent[t]
+            path.append(self.vertex(t))
+        return path[::-1]
+
+if __name__ == '__main__':
+    from random import random, randrange, seed
+    from time import perf_counter
+    from backend.geometry import Point
+    from .buildgraph import Waypoint
+    from .pathfinder import Dijkstra
+    from .astar_pathfinder import AStar
+
+    test_n = 0
+    if test_n == 0:
+        # short queries on a big grid graph: per-query setup used to be proportional to the whole graph
+        seed(0)
+        side = 300
+        grid = [[Waypoint(Point(x + random() * 0.1, y + random() * 0.1)) for y in range(side)] for x in range(side)]
+        g = Graph(set(v for column in grid for v in column))
+        for x in range(side):
+            for y in range(side):
+                if x + 1 < side:
+                    g.add_edge(grid[x][y], grid[x + 1][y], cost=abs(grid[x][y].coords - grid[x + 1][y].coords))
+                if y + 1 < side:
+                    g.add_edge(grid[x][y], grid[x][y + 1], cost=abs(grid[x][y].coords - grid[x][y + 1].coords))
+        csr, ids = CSRGraph.from_graph(g, return_ids=True)
+
+        pairs = []
+        for _ in range(1000):
+            x, y = randrange(side - 3), randrange(side - 2)
+            pairs.append((grid[x][y], grid[x + 3][y + 2]))
+        print(f'V={len(g.vertexes)}, {len(pairs)} queries of 5 hops')
+        for cls in (Dijkstra, AStar):
+            for graph in (g, csr):
+                pf = cls(graph)
+                queries = pairs if graph is g else [(ids[a], ids[b]) for a, b in pairs]
+                ts = perf_counter()
+                for a, b in queries:
+                    pf.find_path(a, b)
+                print(f'{cls.__name__:>9} on {type(graph).__name__:>8}: {(perf_counter() - ts) / len(queries) * 1e3:.3f} ms/query')
+    elif test_n == 1:
+        # one-to-many: a single search to all targets vs a query per target
+        seed(0)
+        side = 100
+        grid = [[Waypoint(Point(x + random() * 0.1, y + random() * 0.1)) for y in range(side)] for x in range(side)]
+        g = Graph(set(v for column in grid for v in column))
+        for x in range(side):
+            for y in range(side):
+                if x + 1 < side:
+                    g.add_edge(grid[x][y], grid[x + 1][y], cost=abs(grid[x][y].coords - grid[x + 1][y].coords))
+                if y + 1 < side:
+                    g.add_edge(grid[x][y], grid[x][y + 1], cost=abs(grid[x][y].coords - grid[x][y + 1].coords))
+
+        pf = Dijkstra(g)
+        start = grid[side // 2][side // 2]
+        targets = [grid[randrange(side)][randrange(side)] for _ in range(50)]
+        ts = perf_counter()
+        paths = [pf.find_path(start, t) for t in targets]
+        print(f'{len(targets)} queries: {perf_counter() - ts:.3f}s')
+        ts = perf_counter()
+        dist, pred = pf.shortest_paths(start, targets)
+        print(f'one-to-many: {perf_counter() - ts:.3f}s, {len(dist)} vertexes settled')
+        for t, path in zip(targets, paths):
+            restored = [t]
+            while restored[-1] is not start:
+                restored.append(pred[restored[-1]])
+            assert restored[::-1] == path
+        ts = perf_counter()
+        dist, _ = pf.shortest_paths(start, radius=10)
+        print(f'radius 10: {perf_counter() - ts:.3f}s, {len(dist)} vertexes settled')
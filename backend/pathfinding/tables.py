@@ -0,0 +1,81 @@
+"""
+File format of all-pairs tables (see Floyd):
+    header of HEADER_SIZE bytes: magic, format version, dtype of distances, number of vertexes, digest of the graph
+    distances, n x n of the stored dtype, row-major
+    predecessors, n x n of int32, row-major
+Tables are opened with numpy.memmap, so a query reads only the rows it needs,
+and processes opening the same file share its pages through the OS page cache.
+"""
+
+import hashlib
+import os
+import struct
+import numpy as np
+from typing import Optional
+
+from .graph import Graph
+from .csr_graph import CSRGraph
+
+TABLE_MAGIC = b'APSPTBL\0'
+TABLE_VERSION = 1
+_HEADER = struct.Struct('<8sI4sQ32s')
+HEADER_SIZE = 64
+
+def graph_digest(graph: Graph | CSRGraph, vertexes: Optional[list] = None) -> bytes:
+    """
+    sha256 of coordinates and edges of the graph, vertexes of a Graph are taken in the given order
+    """
+    h = hashlib.sha256()
+    if isinstance(graph, CSRGraph):
+        for arr in (graph.xs, graph.ys, graph.indptr, graph.indices, graph.costs):
+            h.update(np.ascontiguousarray(arr).tobytes())
+        return h.digest()
+
+    ids = {v: i for i, v in enumerate(vertexes)}
+    h.update(np.array([graph.point(v).x for v in vertexes], dtype=np.float64).tobytes())
+    h.update(np.array([graph.point(v).y for v in vertexes], dtype=np.float64).tobytes())
+    for v in vertexes:
+        edges = sorted((ids[u], cost) for u, cost in graph.neighbors(v))
+        h.update(np.array([len(edges)], dtype=np.int64).tobytes())
+        h.update(np.array([i for i, _ in edges], dtype=np.int64).tobytes())
+        h.update(np.array([cost for _, cost in edges], dtype=np.float64).tobytes())
+    return h.digest()
+
+def write_tables(path: str, digest: bytes, dist: np.ndarray, pred: np.ndarray):
+    """
+    Writes the tables next to path and moves them in place,
+    so processes which have the old file mapped keep reading the old tables
+    """
+    n = len(dist)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, dist.dtype.str.encode(), n, digest).ljust(HEADER_SIZE, b'\0'))
+        for arr in (dist, pred.astype(np.int32, copy=False)):
+            # by rows, so memmapped tables are not read into memory at once
+            for i in range(0, n, 1024):
+                f.write(np.ascontiguousarray(arr[i:i + 1024]).tobytes())
+    os.replace(tmp, path)
+
+def open_tables(path: str, digest: bytes, dtype: type) -> Optional[tuple[np.ndarray, np.ndarray]]:
+    """
+    Maps distance and predecessor tables of the file copy-on-write,
+    returns None if there is no file or it was written for another graph, dtype or format version
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < _HEADER.size:
+        return None
+    magic, version, dtype_str, n, file_digest = _HEADER.unpack(header)
+    if magic != TABLE_MAGIC or version != TABLE_VERSION or file_digest != digest \
+            or dtype_str.rstrip(b'\0').decode() != np.dtype(dtype).str:
+        return None
+    item = np.dtype(dtype).itemsize
+    if n == 0 or os.path.getsize(path) != HEADER_SIZE + n * n * (item + 4):
+        return None
+
+    dist = np.memmap(path, dtype=dtype, mode='c', offset=HEADER_SIZE, shape=(n, n))
+    pred = np.memmap(path, dtype=np.int32, mode='c', offset=HEADER_SIZE + n * n * item, shape=(n, n))
+    return dist, pred
@@ -0,0 +1,195 @@
+import numpy as np
+from enum import Enum
+from itertools import combinations
+from math import atan2, ceil, cos, pi, sin
+from typing import Optional
+
+from .quadtree import QuadTree
+from .visibility import check_collisions_batch
+
+from backend.geometry import Circle, Point, EPS
+
+# waypoints are put this far from circles, so tangent segments don't count as collisions
+TANGENT_MARGIN = 10 * EPS
+
+class CircleMode(Enum):
+    POLYGON = 0  # circles are approximated by circumscribed polygons of `quality` vertexes
+    TANGENT = 1  # tangent points between circles and other obstacles, joined by arcs along the circles
+
+def inflate(circle: Circle) -> Circle:
+    return Circle(circle.center.x, circle.center.y, circle.radius + TANGENT_MARGIN)
+
+def arc_points(circle: Circle, p1: Point, p2: Point, quality: int = 20) -> list[Point]:
+    """
+    Polyline going counterclockwise around the circle from p1 to p2, both lying on it, excluding p1 and p2.
+    Its segments are tangent to the circle, so the polyline never gets inside.
+    It turns by at most 2 * pi / quality at a time, no coarser than the polygon of CircleMode.POLYGON.
+    """
+    c, r = circle.center, circle.radius
+    a1 = atan2(p1.y - c.y, p1.x - c.x)
+    span = (atan2(p2.y - c.y, p2.x - c.x) - a1) % (2 * pi)
+    n = max(ceil(span * quality / (2 * pi)), 1)
+    step = span / n
+    # corners of the circumscribed polygon are between the touching points
+    rc = r / cos(step / 2)
+    return [Point(c.x + rc * cos(a1 + (i + 0.5) * step), c.y + rc * sin(a1 + (i + 0.5) * step)) for i in range(n)]
+
+def polyline_length(points: list[Point]) -> float:
+    return sum(abs(b - a) for a, b in zip(points, points[1:]))
+
+def segments_free(qtree: QuadTree, segments: list[tuple[Point, Point]]) -> list[bool]:
+    if not segments:
+        return []
+    x1, y1, x2, y2 = (np.array(c, dtype=np.float64) for c in zip(*((a.x, a.y, b.x, b.y) for a, b in segments)))
+    return (~check_collisions_batch(qtree, x1, y1, x2, y2)).tolist()
+
+def ring_radius(circle: Circle, quality: int = 20) -> float:
+    """
+    Distance from the center to the points merged by merge_ring_points, corners of the polygon of CircleMode.POLYGON
+    """
+    return circle.radius / cos(pi / quality)
+
+def merge_ring_points(qtree: QuadTree, circles: dict[int, Circle], segments: list[tuple[Point, Point, int, int]],
+                      quality: int = 20) -> list[tuple[Point, Point, int, int]]:
+    """
+    Replaces points touching a circle within 2 * pi / quality of each other by one point at ring_radius
+    in the middle of them. It lies outside of the tangents at all of them, so the segments still don't cross the circle,
+    and a ring has about `quality` points like the polygon of CircleMode.POLYGON.
+    Segments, which got blocked by other obstacles, keep their own points.
+    """
+    step = 2 * pi / quality
+    merged: dict[tuple[int, int], Point] = dict()
+    for i, c in circles.items():
+        ends = sorted((atan2(seg[k].y - c.center.y, seg[k].x - c.center.x), n, k)
+                      for n, seg in enumerate(segments) for k in (0, 1) if seg[k + 2] == i)
+        cluster: list[tuple[float, int, int]] = []
+        for end in ends + [(float('inf'), -1, -1)]:
+            if cluster and end[0] - cluster[0][0] > step:
+                if len(cluster) > 1:
+                    a = (cluster[0][0] + cluster[-1][0]) / 2
+                    rc = ring_radius(c, quality)
+                    p = Point(c.center.x + rc * cos(a), c.center.y + rc * sin(a))
+                    merged.update({(n, k): p for _, n, k in cluster})
+                cluster = []
+            cluster.append(end)
+    moved = [n for n, seg in enumerate(segments) if (n, 0) in merged or (n, 1) in merged]
+    moved_segments = [(merged.get((n, 0), segments[n][0]), merged.get((n, 1), segments[n][1])) for n in moved]
+    free = {n: ok and not any(qtree.point_collides(p.x, p.y) for p in seg)
+            for n, seg, ok in zip(moved, moved_segments, segments_free(qtree, moved_segments))}
+    res = []
+    for n, (p1, p2, i1, i2) in enumerate(segments):
+        if free.get(n, True):
+            p1, p2 = merged.get((n, 0), p1), merged.get((n, 1), p2)
+        res.append((p1, p2, i1, i2))
+    return res
+
+def tangent_segments(qtree: QuadTree, quality: int = 20) -> tuple[dict[int, Circle], list[tuple[Point, Point, int, int]]]:
+    """
+    Collision free tangent segments between circle obstacles of qtree and from corners of other obstacles to circles,
+    with close points on a circle merged by merge_ring_points.
+    Returns inflated circles by sprite id and segments (p1, p2, id1, id2), where id is the sprite id of the circle
+    the point touches, or None for corners.
+    """
+    circles: dict[int, Circle] = dict()
+    corners: list[Point] = []
+    for s in qtree.get_sprites():
+        shape = s.collision_shape
+        if isinstance(shape, Circle):
+            if shape.radius >= EPS:
+                circles[id(s)] = inflate(shape)
+        elif shape is not None:
+            corners += shape.vertexes()
+
+    candidates: list[tuple[Point, Point, int, int]] = []
+    for (i1, c1), (i2, c2) in combinations(circles.items(), 2):
+        candidates += [(p1, p2, i1, i2) for p1, p2 in c1.bitangents(c2)]
+    for i, c in circles.items():
+        for v in corners:
+            candidates += [(v, p, None, i) for p in c.tangent_points(v.x, v.y)]
+
+    free = segments_free(qtree, [(p1, p2) for p1, p2, _, _ in candidates])
+    segments = [seg for seg, ok in zip(candidates, free) if ok and not any(qtree.point_collides(p.x, p.y) for p in seg[:2])]
+    return circles, merge_ring_points(qtree, circles, segments, quality)
+
+def ring_order(circle: Circle, points: list) -> list:
+    """
+    Sorts waypoints on the circle counterclockwise
+    """
+    c = circle.center
+    return sorted(points, key=lambda v: atan2(v.coords.y - c.y, v.coords.x - c.x))
+
+def free_arcs(qtree: QuadTree, circle: Circle, pairs: list[tuple[Point, Point]], quality: int = 20) -> list[list[Point] | None]:
+    """
+    For (p1, p2) pairs of points on the circle returns polylines of counterclockwise arcs from p1 to p2,
+    or None for arcs blocked by other obstacles
+    """
+    arcs = [[p1] + arc_points(circle, p1, p2, quality) + [p2] for p1, p2 in pairs]
+    segments = [(a, b) for arc in arcs for a, b in zip(arc, arc[1:])]
+    free = iter(segments_free(qtree, segments))
+    res = []
+    for arc in arcs:
+        ok = all([next(free) for _ in range(len(arc) - 1)])
+        res.append(arc if ok else None)
+    return res
+
+def connect_ring(qtree: QuadTree, graph, circle: Circle, ring: list, quality: int = 20):
+    """
+    Joins consecutive waypoints of the ring (sorted by ring_order) by arc edges going both ways.
+    Intermediate points of an arc are kept in Waypoint.arcs of its ends.
+    """
+    if len(ring) < 2:
+        return
+    pairs = list(zip(ring, ring[1:] + ring[:1])) if len(ring) > 2 else [(ring[0], ring[1]), (ring[1], ring[0])]
+    arcs = free_arcs(qtree, circle, [(v1.coords, v2.coords) for v1, v2 in pairs], quality)
+    for (v1, v2), arc in zip(pairs, arcs):
+        if arc is None or v1.has_edge_to(v2) and v1.cost(v2) <= polyline_length(arc):
+            continue
+        graph.add_edge(v1, v2, cost=polyline_length(arc))
+        v1.arcs[v2] = arc[1:-1]
+        v2.arcs[v1] = arc[-2:0:-1]
+
+def expand_arcs(path: list, arcs: Optional[dict] = None) -> list[Point]:
+    """
+    Coordinates of the path of waypoints with arcs between them unrolled.
+    arcs (like GraphOverlay.arcs) are checked for (v1, v2) pairs before Waypoint.arcs.
+    """
+    res: list[Point] = []
+    for v1, v2 in zip(path, path[1:]):
+        res.append(v1.coords)
+        arc = arcs.get((v1, v2)) if arcs else None
+        res += arc if arc is not None else v1.arcs.get(v2, [])
+    if path:
+        res.append(path[-1].coords)
+    return res
+
+if __name__ == '__main__':
+    import io, contextlib
+    from time import perf_counter
+    from random import seed
+
+    from backend.core import Core
+    from backend.geometry import Rectangle, Triangle
+    from backend.scene_generators import SpriteGenerator
+    from .quadtree_pathfinder import QuadPathfinder
+    from .tangents import CircleMode  # the one QuadPathfinder compares with, not the one of __main__
+
+    test_n = 0
+    if test_n == 0:
+        # graph size, path length and query time of polygonized circles vs tangents
+        start, goal = Point(-1, 0), Point(16, 11)
+        for n_sprites, types in ((10, [Circle]), (30, [Circle]), (20, [Triangle, Circle])):
+            seed(5)
+            back = Core()
+            back.add_sprites(SpriteGenerator(Rectangle(Point(0, 0), Point(15, 10)), avg_size=2, types=types).generate_sprites(n_sprites))
+            print(f'{n_sprites} sprites of {[t.__name__ for t in types]}:')
+            for circle_mode in CircleMode:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    ts = perf_counter()
+                    pf = QuadPathfinder(back.quadtree, circle_mode=circle_mode)
+                    build_time = perf_counter() - ts
+                    ts = perf_counter()
+                    path = [start] + pf.find_path(start, goal) + [goal]
+                    query_time = perf_counter() - ts
+                G = pf.graph.graph
+                print(f'{circle_mode.name:>10}: V={len(G.vertexes):5} E={sum(len(v.edges) for v in G.vertexes) // 2:6}, '
+                      f'build {build_time:5.2f}s, query {query_time:5.2f}s, path length {polyline_length(path):.4f}')
@@ -1,91 +1,41 @@
+from typing import Optional
+
 from .pathfinder import Pathfinder
 from .graph import Graph
+from .csr_graph import CSRGraph
 from .quadtree import QuadTree
-from .buildgraph import Waypoint as Vertex, check_collisions
-from backend.geometry import Point, Line
-from backend.algo import PriorityQueue
+from .buildgraph import Waypoint as Vertex
+from .overlay import GraphOverlay
+from .search import BestFirstSearch
 
 class ThetaStar(Pathfinder):
-    def __init__(self, g: Graph, quadtree: QuadTree):
+    def __init__(self, g: Graph | CSRGraph, quadtree: QuadTree):
         super().__init__(g)
         self.quadtree = quadtree
+        self.search = BestFirstSearch(g, heuristic=self.heuristic, relax=self.update_vertex)
     
-    def heuristic(self, end: Vertex):
+    def heuristic(self, vertex: Vertex, end: Vertex):
         """
-        Euristic distance from start to end
+        Euristic distance from vertex to end
         Simple decart distance
         """
-        return self.start.distance(end)
+        return self.graph.distance(vertex, end)
 
-    def find_path(self, start: Vertex, end: Vertex) -> list[Vertex]:
+    def find_path(self, start: Vertex, end: Vertex, overlay: Optional[GraphOverlay] = None) -> list[Vertex]:
         """
         Finds path from start to end using Theta* algorithm
         """
-        self.start = start
-
-        self.g_score: dict[Vertex, float] = {vertex: float('inf') for vertex in self.graph.vertexes}
-        self.g_score[start] = 0
-        self.f_score: dict[Vertex, float] = {vertex: float('inf') for vertex in self.graph.vertexes}
-        self.f_score[start] = self.g_score[start] + self.heuristic(end)
-
-        self.came_from: dict[Vertex, Vertex] = {}
-        self.came_from[start] = start
-        
-        self.open_set: PriorityQueue[Vertex] = PriorityQueue()
-        self.open_set.insert(start, self.f_score[start])
-        self.closed_set: set[Vertex] = set()
-
-        while self.open_set:
-            current = self.open_set.extract_minimum()
-
-            if current == end:
-                return self.reconstruct_path(current)
-            self.closed_set.add(current)
+        return self.search.find_path(start, end, overlay)
 
-            for edge in current.edges:
-                neighbor = edge.other(current)
-
-                if neighbor not in self.closed_set:
-                    if neighbor not in self.open_set:
-                        # Initialize values of neighbor if it is
-                        # Not already in the open set
-                        self.g_score[neighbor] = float('inf')
-                        self.came_from[neighbor] = None
-                    self.update_vertex(current, neighbor)
-
-        return []
-
-    def update_vertex(self, current: Vertex, neighbor: Vertex) -> None:
+    def update_vertex(self, current: Vertex, neighbor: Vertex, cost: float) -> tuple[Vertex, float]:
         # This part of the algorithm is the main difference between A* and Theta*
-        parent = self.came_from[current]
-        s = current
-        if self.line_of_sight(parent, neighbor):
+        parent = self.search.came_from(current)
+        if self.search.id(parent) != self.search.id(current) and self.line_of_sight(parent, neighbor):
             # If there is line-of-sight between parent(s) and neighbor
             # then ignore s and use the path from parent(s) to neighbor
-            s = parent
-        
-        # If the length of the path from start to s and from s to 
-        # neighbor is shorter than the shortest currently known distance
-        # from start to neighbor, then update node with the new distance
-        
-        cost = s.distance(neighbor)
-        if self.g_score[s] + cost < self.g_score[neighbor]:
-            self.g_score[neighbor] = self.g_score[s] + cost
-            self.came_from[neighbor] = s
-            
-            self.open_set.discard(neighbor)
-            self.open_set.insert(neighbor, self.g_score[neighbor] + self.heuristic(neighbor))
+            return parent, self.search.g(parent) + self.graph.distance(parent, neighbor)
+        return current, self.search.g(current) + cost
 
     def line_of_sight(self, start: Vertex, end: Vertex):
-        return not check_collisions(self.quadtree, Line(start.coords, end.coords))
-
-    def reconstruct_path(self, current: Vertex) -> list[Vertex]:
-        print('reconstructing...')
-        path = [current]
-        while current in self.came_from:
-            if current == self.came_from[current]:
-                break
-            current = self.came_from[current]
-            path.append(current)
-        path.reverse()
-        return path
\ No newline at end of file
+        p1, p2 = self.graph.point(start), self.graph.point(end)
+        return not self.quadtree.segment_collides(p1.x, p1.y, p2.x, p2.y)
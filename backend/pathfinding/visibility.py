@@ -0,0 +1,215 @@
+import numpy as np
+from typing import Iterable, Optional
+
+from .quadtree import QuadTree
+
+from backend.geometry import Figure, Triangle, Circle, ConvexPolygon, Point, Line, EPS
+from backend.sprites import Sprite
+
+CHUNK_SIZE = 1024
+
+def _sign(a: np.ndarray) -> np.ndarray:
+    return (a > EPS).astype(np.int8) - (a < -EPS).astype(np.int8)
+
+def _cross(ax: np.ndarray, ay: np.ndarray, bx: np.ndarray, by: np.ndarray) -> np.ndarray:
+    return ax * by - ay * bx
+
+def _signed_distance(ax, ay, bx, by, px, py) -> np.ndarray:
+    """
+    Vectorized Line(a, b).distance(p)
+    """
+    lx, ly = bx - ax, by - ay
+    length = np.sqrt(lx ** 2 + ly ** 2)
+    cross = _cross(lx, ly, px - ax, py - ay)
+    return np.where(length > EPS, cross / np.where(length > EPS, length, 1), 0.0)
+
+def segments_hit_edges(ex1, ey1, ex2, ey2, x1, y1, x2, y2) -> np.ndarray:
+    """
+    Vectorized Line(e1, e2).has_intersect(Line(p1, p2)) for edges of obstacles,
+    except for segments lying on the edge, which don't count (like in Triangle.has_intersect)
+    """
+    d1 = _signed_distance(ex1, ey1, ex2, ey2, x1, y1)
+    d2 = _signed_distance(ex1, ey1, ex2, ey2, x2, y2)
+    a1, a2 = np.abs(d1), np.abs(d2)
+
+    # collinear segments intersect if vertexes of one lie inside the other
+    collinear = a1 + a2 < 2 * EPS
+    prod1 = (ex1 - x1) * (ex2 - x2) + (ey1 - y1) * (ey2 - y2)
+    prod2 = (ex1 - x2) * (ex2 - x1) + (ey1 - y2) * (ey2 - y1)
+    collinear_hit = (prod1 < 0) | (prod2 < 0)
+
+    # otherwise the intersection point of the lines must be strictly inside the edge
+    same_side = _sign(d1) * _sign(d2) > 0
+    denom = np.where(collinear, 1, a1 + a2)
+    ix = (x1 * a2 + x2 * a1) / denom
+    iy = (y1 * a2 + y2 * a1) / denom
+    crossing_hit = (ex1 - ix) * (ex2 - ix) + (ey1 - iy) * (ey2 - iy) < -EPS
+
+    hit = np.where(collinear, collinear_hit, ~same_side & crossing_hit)
+    coinciding = (d1 < EPS) & (d2 < EPS)
+    return hit & ~coinciding
+
+def segments_hit_circles(cx, cy, r, x1, y1, x2, y2) -> np.ndarray:
+    """
+    Vectorized Circle.has_intersect(Line(p1, p2))
+    """
+    far = np.abs(_signed_distance(x1, y1, x2, y2, cx, cy)) > r - EPS
+    lx, ly = x2 - x1, y2 - y1
+    p1x, p1y = x1 - cx, y1 - cy
+    p2x, p2y = x2 - cx, y2 - cy
+    opposite = (lx * p1x + ly * p1y) * (lx * p2x + ly * p2y) < 0
+    inside = np.minimum(np.sqrt(p1x ** 2 + p1y ** 2), np.sqrt(p2x ** 2 + p2y ** 2)) < r - EPS
+    return (r >= EPS) & ~far & (opposite | inside)
+
+def segments_hit_polygons(ax, ay, bx, by, valid, x1, y1, x2, y2) -> np.ndarray:
+    """
+    Vectorized ConvexPolygon.has_intersect_segment for counterclockwise edges (a, b) padded along the last axis,
+    padding edges have valid set to False
+    """
+    lx, ly = bx - ax, by - ay
+    length = np.sqrt(lx ** 2 + ly ** 2)
+    valid = valid & (length > EPS)
+    length = np.where(valid, length, 1)
+    dist = _cross(lx, ly, x1 - ax, y1 - ay) / length - EPS
+    speed = _cross(lx, ly, x2 - x1, y2 - y1) / length
+    still = np.abs(speed) < EPS ** 2
+    t = -dist / np.where(still, 1, speed)
+    t_in = np.where(valid & ~still & (speed > 0), t, 0.0).max(axis=-1)
+    t_out = np.where(valid & ~still & (speed < 0), t, 1.0).min(axis=-1)
+    outside = (valid & still & (dist <= 0)).any(axis=-1)
+    return ~outside & (np.maximum(t_in, 0.0) < np.minimum(t_out, 1.0))
+
+class ObstacleArrays:
+    """
+    Collision shapes of sprites packed into arrays for vectorized tests:
+    triangles as (T, 3, 2) vertexes, circles as (C,) centers and radiuses,
+    convex polygons as (P, K, 2) vertexes padded by repeating the last one,
+    everything else is kept as figures and tested one by one.
+    Every obstacle also has an axis-aligned bounding box.
+    """
+    def __init__(self, sprites: Iterable[Sprite]):
+        triangles: list[Triangle] = []
+        circles: list[Circle] = []
+        polygons: list[ConvexPolygon] = []
+        self.others: list[Figure] = []
+        # sprite id -> (kind, index), kind is 0 for triangles, 1 for circles, 2 for others and 3 for polygons
+        self.slots: dict[int, tuple[int, int]] = dict()
+
+        for s in sprites:
+            shape = s.collision_shape
+            if shape is None:
+                continue
+            if isinstance(shape, Triangle):
+                self.slots[id(s)] = (0, len(triangles))
+                triangles.append(shape)
+            elif isinstance(shape, Circle):
+                self.slots[id(s)] = (1, len(circles))
+                circles.append(shape)
+            elif isinstance(shape, ConvexPolygon):
+                self.slots[id(s)] = (3, len(polygons))
+                polygons.append(shape)
+            else:
+                self.slots[id(s)] = (2, len(self.others))
+                self.others.append(shape)
+
+        self.triangles = np.array([[v.coords() for v in t.vertices] for t in triangles], dtype=np.float64).reshape(-1, 3, 2)
+        self.circles = np.array([[c.center.x, c.center.y, c.radius] for c in circles], dtype=np.float64).reshape(-1, 3)
+        k = max((len(p.vertices) for p in polygons), default=3)
+        self.polygons = np.array([[v.coords() for v in p.vertices] + [p.vertices[-1].coords()] * (k - len(p.vertices)) for p in polygons],
+                                 dtype=np.float64).reshape(-1, k, 2)
+        # edge i goes from vertex i - 1 to vertex i, edges between repeated vertexes are padding
+        self.poly_valid = np.arange(k)[None, :] < np.array([len(p.vertices) for p in polygons], dtype=np.int64)[:, None]
+
+        self.tri_box = np.concatenate([self.triangles.min(axis=1), self.triangles.max(axis=1)], axis=1)
+        self.circ_box = np.stack([self.circles[:, 0] - self.circles[:, 2], self.circles[:, 1] - self.circles[:, 2],
+                                  self.circles[:, 0] + self.circles[:, 2], self.circles[:, 1] + self.circles[:, 2]], axis=1)
+        other_box = []
+        for f in self.others:
+            box = f.aabb()
+            other_box.append(box if box is not None else [-np.inf, -np.inf, np.inf, np.inf])
+        self.other_box = np.array(other_box, dtype=np.float64).reshape(-1, 4)
+        self.poly_box = np.concatenate([self.polygons.min(axis=1), self.polygons.max(axis=1)], axis=1)
+
+    def split(self, sprites: Iterable[Sprite]) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns indexes of triangles, circles, other figures and polygons of the given sprites
+        """
+        idx: tuple[list[int], list[int], list[int], list[int]] = ([], [], [], [])
+        for s in sprites:
+            slot = self.slots.get(id(s))
+            if slot is not None:
+                idx[slot[0]].append(slot[1])
+        return tuple(np.array(i, dtype=np.int64) for i in idx)
+
+def _overlapping_pairs(seg_box: np.ndarray, obj_box: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    mask = ((seg_box[:, None, 0] <= obj_box[None, :, 2] + EPS) & (seg_box[:, None, 2] >= obj_box[None, :, 0] - EPS) &
+            (seg_box[:, None, 1] <= obj_box[None, :, 3] + EPS) & (seg_box[:, None, 3] >= obj_box[None, :, 1] - EPS))
+    return np.nonzero(mask)
+
+def _check_chunk(qtree: QuadTree, obstacles: ObstacleArrays, x1, y1, x2, y2) -> np.ndarray:
+    res = np.zeros(len(x1), dtype=bool)
+    seg_box = np.stack([np.minimum(x1, x2), np.minimum(y1, y2), np.maximum(x1, x2), np.maximum(y1, y2)], axis=1)
+    box = seg_box[:, :2].min(axis=0), seg_box[:, 2:].max(axis=0)
+    tri, circ, oth, poly = obstacles.split(qtree.get_sprites_in_box(*box[0], *box[1]))
+
+    if len(tri):
+        si, k = _overlapping_pairs(seg_box, obstacles.tri_box[tri])
+        t = obstacles.triangles[tri[k]]
+        sx1, sy1, sx2, sy2 = x1[si, None], y1[si, None], x2[si, None], y2[si, None]
+        a, b = t, np.roll(t, -1, axis=1)  # edges ab, bc, ca
+        hit = segments_hit_edges(a[..., 0], a[..., 1], b[..., 0], b[..., 1], sx1, sy1, sx2, sy2).any(axis=1)
+        res[si[hit]] = True
+
+    if len(circ):
+        si, k = _overlapping_pairs(seg_box, obstacles.circ_box[circ])
+        c = obstacles.circles[circ[k]]
+        hit = segments_hit_circles(c[:, 0], c[:, 1], c[:, 2], x1[si], y1[si], x2[si], y2[si])
+        res[si[hit]] = True
+
+    if len(poly):
+        si, k = _overlapping_pairs(seg_box, obstacles.poly_box[poly])
+        p, valid = obstacles.polygons[poly[k]], obstacles.poly_valid[poly[k]]
+        a = np.roll(p, 1, axis=1)  # edges (p[i - 1], p[i])
+        sx1, sy1, sx2, sy2 = x1[si, None], y1[si, None], x2[si, None], y2[si, None]
+        hit = segments_hit_polygons(a[..., 0], a[..., 1], p[..., 0], p[..., 1], valid, sx1, sy1, sx2, sy2)
+        res[si[hit]] = True
+
+    if len(oth):
+        si, k = _overlapping_pairs(seg_box, obstacles.other_box[oth])
+        for i, j in zip(si.tolist(), oth[k].tolist()):
+            if res[i]:
+                continue
+            p1, p2 = Point(float(x1[i]), float(y1[i])), Point(float(x2[i]), float(y2[i]))
+            if abs(p1 - p2) > EPS and obstacles.others[j].has_intersect(Line(p1, p2)):
+                res[i] = True
+    return res
+
+def check_collisions_batch(qtree: QuadTree, x1: np.ndarray, y1: np.ndarray, x2: np.ndarray, y2: np.ndarray,
+                           obstacles: Optional[ObstacleArrays] = None) -> np.ndarray:
+    """
+    Batched check_collisions for N segments (x1, y1) -> (x2, y2).
+    Returns boolean mask, True for segments colliding with anything in qtree.
+    Segments are sorted along a Morton curve and tested in spatially coherent chunks:
+    each chunk collects obstacles from the quadtree leaves it overlaps and tests them all in one vectorized pass.
+    If obstacles is not provided, packs sprites of qtree.
+    """
+    x1, y1, x2, y2 = (np.asarray(a, dtype=np.float64) for a in (x1, y1, x2, y2))
+    res = np.zeros(len(x1), dtype=bool)
+    if len(x1) == 0:
+        return res
+    if obstacles is None:
+        obstacles = ObstacleArrays(qtree.get_sprites())
+
+    # order segments by Morton code of their midpoints on a 1024x1024 grid
+    bl, size = qtree.rectangle.bottom_left, qtree.rectangle.width()
+    gx = np.clip(((x1 + x2) / 2 - bl.x) / size * 1024, 0, 1023).astype(np.uint32)
+    gy = np.clip(((y1 + y2) / 2 - bl.y) / size * 1024, 0, 1023).astype(np.uint32)
+    code = np.zeros(len(x1), dtype=np.uint32)
+    for bit in range(10):
+        code |= ((gx >> bit) & 1) << (2 * bit) | ((gy >> bit) & 1) << (2 * bit + 1)
+    order = np.argsort(code, kind='stable')
+
+    for start in range(0, len(order), CHUNK_SIZE):
+        idx = order[start:start + CHUNK_SIZE]
+        res[idx] = _check_chunk(qtree, obstacles, x1[idx], y1[idx], x2[idx], y2[idx])
+    return res
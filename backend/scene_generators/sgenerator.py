@@ -3,7 +3,7 @@ from random import choice, random, gauss
 from math import pi, cos, sin, atan2
 
 from backend.sprites.sprite import make_sprite, Sprite
-from backend.geometry import Figure, Rectangle, Triangle, Circle, Point
+from backend.geometry import Figure, Rectangle, Triangle, Circle, ConvexPolygon, Point
 from .perlin_noise_generator import fill_dots as fill_dots_perlin, mean_min_distance
 from .grid_noise_generator import fill_dots as fill_dots_grid
 
@@ -100,6 +100,13 @@ class SpriteGenerator:
         radius = random_not_small(avg_size / 2)
         return Circle(center.x, center.y, radius)
     
+    def gen_polygon(self, center: Point, avg_size: float, n: int = 6) -> ConvexPolygon:
+        # convex hull of points around the center, falls back to a triangle if the points are degenerate
+        try:
+            return ConvexPolygon.hull([self.gen_point_around(center, avg_size) for i in range(n)])
+        except ValueError:
+            return ConvexPolygon(self.gen_triangle_normal(center, avg_size).vertices)
+    
     def gen_figure(self, center: Optional[Point] = None) -> Figure:
         t = choice(self.types)
         if not center:
@@ -111,6 +118,8 @@ class SpriteGenerator:
             return self.gen_triangle(center, self.avg_size, self.triangle_mode)
         elif t is Circle:
             return self.gen_circle(center, self.avg_size)
+        elif t is ConvexPolygon:
+            return self.gen_polygon(center, self.avg_size)
         else:
             raise NotImplemented(f"Generation of {t} is not yet implemented.")
     
@@ -1,10 +1,12 @@
+from typing import Optional
+
 from .sprite import Sprite
-from backend.pathfinding import Graph, Waypoint
+from backend.pathfinding import Graph, CSRGraph, Waypoint
 from backend.geometry import Figure, Point, Line
 
 class FigArray(Figure):
-    def __init__(self, elements: set[Point|Line|Figure] = set()):
-        self.elements = elements
+    def __init__(self, elements: Optional[set[Point|Line|Figure]] = None):
+        self.elements = elements if elements is not None else set()
     
     def add(self, element: Point|Line|Figure):
         self.elements.add(element)
@@ -30,7 +32,9 @@ class FigArray(Figure):
             e.rotate(center, angle)
 
 class GraphSprite(Sprite):
-    def __init__(self, G: Graph):
+    def __init__(self, G: Graph | CSRGraph):
+        if isinstance(G, CSRGraph):
+            G = G.to_graph()
         va = FigArray()
         for v in G.vertexes:
             if not isinstance(v, Waypoint):
@@ -1,39 +1,86 @@
 from typing import Iterable
 
-from backend.geometry import Figure, Point, mean_points
+from backend.geometry import Figure, Point, mean_points, boxes_overlap
+
+class PosedFigure:
+    """
+    World figure of a sprite, placed lazily by the sprite pose.
+    Keeps a copy of the figure at the pose it was given in (angle, center),
+    and on access after the pose version changed sets world = R(angle - reference angle)(copy - reference center) + center
+    """
+    def __init__(self, figure: Figure, sprite: 'Sprite'):
+        self.world = figure
+        self.local: Figure = None  # copied before the first placement
+        self.angle = sprite.angle
+        self.center = sprite.mass_center
+        self.version = sprite.version
+
+    def get(self, sprite: 'Sprite') -> Figure:
+        if self.version != sprite.version and self.world is not None:
+            if self.local is None:
+                self.local = self.world.copy()
+            self.world.place(self.local, self.center, sprite.angle - self.angle, sprite.mass_center)
+            self.version = sprite.version
+        return self.world
 
 class Sprite:
     def __init__(self, mesh: Figure, collision_shape: Figure, static: bool = True):
-        self.mesh: Figure = mesh
-        self.collision_shape: Figure = collision_shape
-        if self.collision_shape is not None:
+        # pose: accumulated rotation and position of the mass center, its version changes on every move
+        self.angle = 0.0
+        self.version = 0
+        if collision_shape is not None:
             # self.mass_center: Point = mean_points(self.collision_shape.vertexes(quality=4))
-            self.mass_center: Point = self.collision_shape.mass_center()
+            self.mass_center: Point = collision_shape.mass_center()
         else:
             self.mass_center = Point(0, 0)
+        self.mesh = mesh
+        self.collision_shape = collision_shape
         self.static = static
         
         self.blocked = False
         self.movement = Point(0, 0)
         self.rotation = 0.0
+        # QuadTree node, which stores the sprite. It is notified when the sprite moves
+        self.node = None
     
     def __copy__(self):
         raise TypeError(f"Copying of {self.__class__.__name__} is not allowed")
 
     def __deepcopy__(self, memo):
         raise TypeError(f"Deep copying of {self.__class__.__name__} is not allowed")
+
+    @property
+    def mesh(self) -> Figure:
+        return self._mesh.get(self)
+
+    @mesh.setter
+    def mesh(self, f: Figure):
+        self._mesh = PosedFigure(f, self)
+
+    @property
+    def collision_shape(self) -> Figure:
+        shape = self._collision_shape
+        return shape.world if shape.version == self.version else shape.get(self)
+
+    @collision_shape.setter
+    def collision_shape(self, f: Figure):
+        self._collision_shape = PosedFigure(f, self)
     
     def check_collisions(self, others: Iterable['Sprite']) -> list[int]:
-        if self.collision_shape is None:
+        shape = self.collision_shape
+        if shape is None:
             return []
         
         collides = []
         for i, sprite in enumerate(others):
             if sprite is self:
                 continue
-            if sprite.collision_shape is None:
+            other = sprite.collision_shape
+            if other is None:
+                continue
+            if not boxes_overlap(shape.aabb(), other.aabb()):
                 continue
-            if self.collision_shape.has_intersect(sprite.collision_shape):
+            if shape.has_intersect(other):
                 collides.append(i)
         return collides
 
@@ -50,13 +97,13 @@ class Sprite:
             rot = self.rotation
             mov = self.movement
             
-            if self.collision_shape is not None:
-                self.collision_shape.rotate(self.mass_center, rot)
-                self.collision_shape.move(mov)
-            if self.mesh is not None:
-                self.mesh.rotate(self.mass_center, rot)
-                self.mesh.move(mov)
-            self.mass_center += mov
+            # figures are placed on access, only the pose changes here
+            if rot != 0 or mov.x != 0 or mov.y != 0:
+                self.angle += rot
+                self.mass_center += mov
+                self.version += 1
+                if self.node is not None:
+                    self.node.mark_dirty(self)
             
             self.rotation = 0.0
             self.movement = Point(0, 0)
@@ -67,4 +114,48 @@ class Sprite:
         return id(self)
 
 def make_sprite(f: Figure):
-    return Sprite(f.copy(), f.copy())
\ No newline at end of file
+    return Sprite(f.copy(), f.copy())
+
+if __name__ == '__main__':
+    from time import perf_counter
+    from random import random, seed
+
+    from backend.geometry import Triangle
+
+    test_n = 0
+    if test_n == 0:
+        # physics tick of moving sprites: eager rotate + move of both figures vs pose update
+        seed(0)
+        N, ticks = 200, 200
+        triangles = [Triangle(Point(x, y), Point(x + 1, y), Point(x, y + 1)) for x, y in ((random() * 15, random() * 15) for _ in range(N))]
+        sprites = [Sprite(t.copy(), t.copy(), static=False) for t in triangles]
+        meshes, shapes = [t.copy() for t in triangles], [t.copy() for t in triangles]
+        centers = [t.mass_center() for t in triangles]
+
+        ts = perf_counter()
+        for _ in range(ticks):
+            for i in range(N):
+                rot, mov = 0.01, Point(0.01, 0.0)
+                for f in (shapes[i], meshes[i]):
+                    f.rotate(centers[i], rot)
+                    f.move(mov)
+                centers[i] += mov
+        eager_time = (perf_counter() - ts) / ticks
+
+        ts = perf_counter()
+        for _ in range(ticks):
+            for s in sprites:
+                s.rotation, s.movement = 0.01, Point(0.01, 0.0)
+                s.update(0.005)
+        pose_time = (perf_counter() - ts) / ticks
+
+        ts = perf_counter()
+        for _ in range(ticks):
+            for s in sprites:
+                s.rotation, s.movement = 0.01, Point(0.01, 0.0)
+                s.update(0.005)
+                s.collision_shape.aabb()
+        placed_time = (perf_counter() - ts) / ticks
+
+        print(f'{N} sprites: eager {eager_time * 1e3:.2f} ms/tick, pose only {pose_time * 1e3:.2f} ms/tick, '
+              f'pose + collision shape {placed_time * 1e3:.2f} ms/tick')
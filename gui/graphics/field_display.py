@@ -47,7 +47,7 @@ class FieldDisplay(GridDisplay):
                     a, b = mesh.center.x - mesh.radius, -mesh.center.y + mesh.radius
                     c, d = 2 * mesh.radius, -2 * mesh.radius
                     self.registered_items[item] = self.scene.addEllipse(a, b, c, d, pen=self.pen, brush=self.brush)
-                elif isinstance(mesh, (bc.Triangle, bc.Rectangle)):
+                elif isinstance(mesh, (bc.Triangle, bc.Rectangle, bc.ConvexPolygon)):
                     self.registered_items[item] = self.scene.addPolygon(QPolygonF([QPointF(v.x, -v.y) for v in mesh.corners()]), pen=self.pen, brush=self.brush)
                 elif isinstance(mesh, bc.Path):
                     titem = RouteChain(parent=self, path=mesh, pen=self.pen2, brush=self.brush3)
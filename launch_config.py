@@ -9,6 +9,7 @@ from backend import make_sprite, Sprite, GraphSprite
 from backend import build_graph_on_quadtree, VertMode
 from backend import SpriteGenerator
 from backend.pathfinding import QuadPathfinder
+from backend.pathfinding.navcache import build_graph_cached
 
 def generate_sprites(back: Core, gen_configuration: int = 0) -> None:
     if gen_configuration == 0:
@@ -20,8 +21,8 @@ def generate_sprites(back: Core, gen_configuration: int = 0) -> None:
     else:
         sprites = SpriteGenerator(Rectangle(Point(0, 0), Point(15, 10)), avg_size=2, types = [Triangle]).generate_sprites(gen_configuration)
     
+    back.add_sprites(sprites)
     for s in sprites:
-        back.add_sprite(s)
         print(s.mesh)
 
 def pregenerated_sprites(back: Core, gen_configuration: int = 0) -> None:
@@ -98,7 +99,7 @@ def pregenerated_sprites(back: Core, gen_configuration: int = 0) -> None:
     
 
 def generate_launch(back: Core, launch_configuration: int = 0, generate: bool = False, gen_configuration: int = 0,
-                    pathfinder_algorithm: str = None) -> None:
+                    pathfinder_algorithm: str = None, nav_cache: str = None) -> None:
     if not generate:
         pregenerated_sprites(back, gen_configuration)
     else:
@@ -172,8 +173,13 @@ def generate_launch(back: Core, launch_configuration: int = 0, generate: bool =
             pathfinder_algorithm = 'dijkstra'
         
         ts = time()
-        graph, vertex_dict = build_graph_on_quadtree(back.quadtree, mode=VertMode.ALL, return_vertex_dict=True)
-        print(f'Building quadtree graph of {len(graph.vertexes)} vertices took {time() - ts: .2f}s')
+        if nav_cache:
+            # built graphs are kept in the nav_cache directory, fingerprinted by the scene
+            graph, vertex_dict = build_graph_cached(back.quadtree, nav_cache, mode=VertMode.ALL)
+            print(f'Getting quadtree graph of {len(graph.vertexes)} vertices took {time() - ts: .2f}s')
+        else:
+            graph, vertex_dict = build_graph_on_quadtree(back.quadtree, mode=VertMode.ALL, return_vertex_dict=True)
+            print(f'Building quadtree graph of {len(graph.vertexes)} vertices took {time() - ts: .2f}s')
         
         p1 = QuadPathfinder(back.quadtree, algorithm='Theta*', graph=graph, vertex_dict=vertex_dict)
         p2 = QuadPathfinder(back.quadtree, algorithm='A*', graph=graph, vertex_dict=vertex_dict)
@@ -191,4 +197,24 @@ def generate_launch(back: Core, launch_configuration: int = 0, generate: bool =
         print(f"Searching path took {time() - ts: .2f}s for A*")
         print('path', path)
         back.add_sprite(Sprite(Path(path), None))
-        
\ No newline at end of file
+        
+    # compares the graph of VertMode.ALL with the reduced visibility graph: sizes, build and query times
+    elif launch_configuration == 6:
+        start, dest = Point(-1, 0), Point(16, 11)
+        if not pathfinder_algorithm:
+            pathfinder_algorithm = 'dijkstra'
+        
+        for mode in (VertMode.ALL, VertMode.REDUCED):
+            ts = time()
+            graph, vertex_dict = build_graph_on_quadtree(back.quadtree, mode=mode, return_vertex_dict=True)
+            build_time = time() - ts
+            pathfinder = QuadPathfinder(back.quadtree, algorithm=pathfinder_algorithm, graph=graph, vertex_dict=vertex_dict, mode=mode)
+            
+            ts = time()
+            path = [start] + pathfinder.find_path(start, dest) + [dest]
+            query_time = time() - ts
+            length = sum(abs(b - a) for a, b in zip(path, path[1:]))
+            n_edges = sum(len(v.edges) for v in graph.vertexes) // 2
+            print(f"{mode.name:>8}: {len(graph.vertexes)} vertices, {n_edges} edges, building took {build_time: .2f}s, "
+                  f"searching path took {query_time: .2f}s for {pathfinder_algorithm}, path length {length: .4f}")
+            back.add_sprite(Sprite(Path(path), None))